@@ -1,9 +1,11 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from app.replicas import RoutingSession
 
-# Initialize SQLAlchemy without binding to a specific Flask app
-db = SQLAlchemy()
+# Initialize SQLAlchemy without binding to a specific Flask app; the session
+# reads from a replica when the request's ReplicaRouter picked one
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 
 
@@ -20,17 +22,90 @@ def create_app(config_class=None):
 
         app.config.from_object(get_config())
 
+    # Faster JSON encoding for responses
+    from app.json_provider import init_json
+
+    init_json(app)
+
+    # Time connection checkouts, unless the config picked its own pool (PgBouncer mode)
+    from app.pool import InstrumentedQueuePool
+
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "poolclass": InstrumentedQueuePool,
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+    # Flask-SQLAlchemy only applies these to the primary; replicas get the same
+    app.config["SQLALCHEMY_BINDS"] = {
+        key: {**app.config["SQLALCHEMY_ENGINE_OPTIONS"], "url": url} if isinstance(url, str) else url
+        for key, url in app.config.get("SQLALCHEMY_BINDS", {}).items()
+    }
+
     # Initialize extensions with the app
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Reads of GET requests on the read replicas, if any, guarded by their lag
+    from app.replicas import ReplicaRouter
+
+    ReplicaRouter(app)
+
+    # Per-worker stashpoint catalog, refreshed by the change signals
+    from app import signals  # noqa: F401
+    from app.services.catalog import StashpointCatalog
+
+    StashpointCatalog(app)
+
+    # Shared stashpoint versions, bumped after each change, that the caches below check on every hit
+    from app.services.shared_cache import CacheVersions
+
+    CacheVersions(app)
+
+    # Per-worker search result cache, checked against the stashpoint versions
+    from app.services.search_cache import SearchCache
+
+    SearchCache(app)
+
+    # Per-worker cache of availability calendar days, checked the same way
+    from app.services.availability import AvailabilityCache
+
+    AvailabilityCache(app)
+
+    # Per-worker cache of map tile clusters, cleared by stashpoint changes
+    from app.services.clusters import ClusterCache
+
+    ClusterCache(app)
+
+    # Request, SQL and pool metrics, scraped from /metrics
+    from app.metrics import Metrics
+
+    metrics = Metrics(app)
+
+    # Per-request query counts, and EXPLAIN ANALYZE captures of slow requests
+    from app.profiler import QueryProfiler
+
+    QueryProfiler(app)
+
     # Register blueprints
     from app.routes.stashpoints import bp as stashpoints_bp
 
+    from app.routes.admin import bp as admin_bp
+
     app.register_blueprint(stashpoints_bp, url_prefix="/api/v1/stashpoints")
+    app.register_blueprint(admin_bp, url_prefix="/api/v1/admin")
+
+    # Register CLI commands
+    from app.cli import stashpoints_cli
+
+    app.cli.add_command(stashpoints_cli)
 
     @app.route("/healthcheck")
     def healthcheck():
         return {"status": "healthy"}
 
+    @app.route("/metrics")
+    def prometheus_metrics():
+        from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+        return generate_latest(metrics.registry), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
     return app
@@ -0,0 +1,75 @@
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from app import create_app
+from app.pool import InstrumentedAsyncQueuePool
+
+
+def async_database_url(url):
+    """The database URL with its driver switched to asyncpg"""
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+def async_engine_options(config):
+    """
+    The sync engine's options translated for asyncpg, with the pool sized
+    by ASYNC_POOL_SIZE and ASYNC_MAX_OVERFLOW.
+
+    Under PgBouncer asyncpg's prepared statement caches are switched off,
+    since consecutive transactions can land on different server connections.
+    """
+    options = config["SQLALCHEMY_ENGINE_OPTIONS"]
+    connect_args = {"timeout": options.get("connect_args", {}).get("connect_timeout", 10)}
+    if config["DB_PGBOUNCER"]:
+        connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    connect_args["server_settings"] = dict(config["DB_SESSION_SETTINGS"])
+    return {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": config["ASYNC_POOL_SIZE"],
+        "max_overflow": config["ASYNC_MAX_OVERFLOW"],
+        "pool_timeout": options.get("pool_timeout", 30),
+        "pool_recycle": options.get("pool_recycle", -1),
+        "pool_pre_ping": options.get("pool_pre_ping", True),
+        "connect_args": connect_args,
+    }
+
+
+def create_asgi_app(config_class=None):
+    """
+    Create the ASGI application.
+
+    Stashpoint searches and listings are served by async handlers over an
+    asyncpg connection pool, so a request waiting on Postgres doesn't hold
+    a thread. Every other route falls through to the Flask app, which also
+    provides the config and the in-process caches.
+    """
+    flask_app = create_app(config_class)
+    config = flask_app.config
+
+    engine = create_async_engine(
+        async_database_url(config["SQLALCHEMY_DATABASE_URI"]), **async_engine_options(config)
+    )
+    flask_app.extensions["async_engine"] = engine
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await engine.dispose()
+
+    from app.routes.async_stashpoints import routes
+
+    asgi_app = Starlette(
+        routes=[*routes, Mount("/", app=WSGIMiddleware(flask_app))],
+        lifespan=lifespan,
+    )
+    asgi_app.state.flask_app = flask_app
+    asgi_app.state.config = config
+    asgi_app.state.engine = engine
+    asgi_app.state.session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    return asgi_app
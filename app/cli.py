@@ -0,0 +1,114 @@
+import time
+import click
+from flask.cli import AppGroup
+
+
+stashpoints_cli = AppGroup("stashpoints", help="Stashpoint maintenance commands.")
+
+
+@stashpoints_cli.command("rebuild-occupancy")
+@click.option("--stashpoint-id", default=None, help="Only rebuild this stashpoint.")
+def rebuild_occupancy_command(stashpoint_id):
+    """Recompute the occupancy buckets from the bookings table."""
+    from app.services.occupancy import rebuild_occupancy
+
+    written = rebuild_occupancy(stashpoint_id)
+    click.echo(f"Rebuilt {written} occupancy buckets")
+
+
+@stashpoints_cli.command("check-occupancy")
+@click.option("--stashpoint-id", default=None, help="Only check this stashpoint.")
+@click.option("--limit", default=20, show_default=True, help="Max drifted buckets to print.")
+def check_occupancy_command(stashpoint_id, limit):
+    """Compare the occupancy buckets with the bookings table."""
+    from app.services.occupancy import check_occupancy
+
+    drift = check_occupancy(stashpoint_id)
+    if not drift:
+        click.echo("Occupancy is consistent with bookings")
+        return
+
+    for row in drift[:limit]:
+        click.echo(
+            f"{row['stashpoint_id']} {row['bucket_start'].isoformat()}: "
+            f"stored={row['stored']} expected={row['expected']}"
+        )
+    raise click.ClickException(f"{len(drift)} occupancy buckets out of sync")
+
+
+@stashpoints_cli.command("compile-hours")
+@click.option("--stashpoint-id", default=None, help="Only compile this stashpoint.")
+def compile_hours_command(stashpoint_id):
+    """Recompute the compiled open minutes from the opening hours."""
+    from app.services.opening_hours import recompile_open_minutes
+
+    compiled = recompile_open_minutes(stashpoint_id)
+    click.echo(f"Compiled the opening hours of {compiled} stashpoints")
+
+
+@stashpoints_cli.command("refresh-open-windows")
+@click.option("--stashpoint-id", default=None, help="Only refresh this stashpoint.")
+def refresh_open_windows_command(stashpoint_id):
+    """Roll the precomputed UTC open windows forward (run daily)."""
+    from app.services.opening_hours import refresh_open_windows
+
+    written = refresh_open_windows([stashpoint_id] if stashpoint_id else None)
+    click.echo(f"Wrote {written} open windows")
+
+
+@stashpoints_cli.command("maintain-booking-partitions")
+@click.option("--drop", is_flag=True, help="Drop old partitions instead of moving them to the archive schema.")
+def maintain_booking_partitions_command(drop):
+    """Add the coming months' bookings partitions and archive the old ones (run daily)."""
+    from flask import current_app
+    from app.services.booking_partitions import ARCHIVE_SCHEMA, maintain_booking_partitions, partition_name
+
+    result = maintain_booking_partitions(
+        months_ahead=current_app.config["BOOKING_PARTITION_MONTHS_AHEAD"],
+        retain_months=current_app.config["BOOKING_RETAIN_MONTHS"],
+        drop=drop,
+    )
+    for month in result["created"]:
+        click.echo(f"Created {partition_name(month)}")
+    for month in result["archived"]:
+        click.echo(f"{'Dropped' if drop else 'Archived'} {partition_name(month)}"
+                   + ("" if drop else f" to {ARCHIVE_SCHEMA}"))
+    if not result["created"] and not result["archived"]:
+        click.echo("Booking partitions are up to date")
+
+
+@stashpoints_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "import_format", type=click.Choice(["csv", "json"]), default=None,
+              help="File format (default: from the extension).")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows validated and merged at a time.")
+@click.option("--limit", default=20, show_default=True, help="Max row errors to print.")
+def import_command(path, import_format, chunk_size, limit):
+    """Upsert stashpoints by external_id from a CSV or JSON/NDJSON file."""
+    from app.services.stashpoint_import import detect_format, import_stashpoints, read_rows
+
+    import_format = import_format or detect_format(filename=path)
+    if import_format is None:
+        raise click.BadParameter("can't tell the format from the extension, pass --format", param_hint="path")
+
+    def progress(report):
+        click.echo(f"{report.rows} rows, {report.failed} failed, "
+                   f"{report.rows / (time.perf_counter() - report.started):.0f} rows/s", err=True)
+
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        try:
+            report = import_stashpoints(read_rows(stream, import_format), chunk_size, on_chunk=progress).to_dict()
+        except ValueError as e:
+            # an unreadable file, rather than a bad row
+            raise click.ClickException(str(e))
+
+    for error in report["errors"][:limit]:
+        messages = "; ".join(f"{e['field'] or 'row'}: {e['message']}" for e in error["errors"])
+        click.echo(f"row {error['row']} ({error['external_id']}): {messages}")
+    click.echo(
+        f"Imported {report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s): "
+        f"{report['inserted']} inserted, {report['updated']} updated, {report['unchanged']} unchanged, "
+        f"{report['failed']} failed"
+    )
+    if report["failed"]:
+        raise click.exceptions.Exit(1)
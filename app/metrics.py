@@ -0,0 +1,165 @@
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from app.pool import pool_status
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def request_endpoint():
+    """The endpoint label of the current request (the route's name, not its URL)"""
+    if not has_request_context():
+        return 'none'
+    return request.endpoint or 'unmatched'
+
+
+@contextmanager
+def request_phase(name):
+    """
+    Time a phase of the current request (parsing, validation, query,
+    serialization) and label the SQL it runs with it. SQL outside any
+    phase is labelled "other". Does nothing outside a Flask request, e.g.
+    in the async handlers.
+    """
+    if not has_request_context():
+        yield
+        return
+
+    outer = g.get('metrics_phase')
+    g.metrics_phase = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.metrics_phase = outer
+        metrics = g.get('metrics')
+        if metrics is not None:
+            metrics.phase_seconds.labels(request_endpoint(), name).observe(time.perf_counter() - started)
+
+
+class PoolCollector:
+    """Reads the pool gauges from the app's engines at scrape time"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def collect(self):
+        from app import db
+
+        size = GaugeMetricFamily('db_pool_size', 'Connections the pool keeps open', labels=['pool'])
+        checked_out = GaugeMetricFamily('db_pool_checked_out', 'Connections in use', labels=['pool'])
+        overflow = GaugeMetricFamily('db_pool_overflow', 'Connections opened beyond the pool size', labels=['pool'])
+        checkouts = CounterMetricFamily('db_pool_checkouts', 'Connection checkouts', labels=['pool'])
+        timeouts = CounterMetricFamily('db_pool_timeouts', 'Checkouts that gave up waiting', labels=['pool'])
+        wait = CounterMetricFamily('db_pool_checkout_wait_seconds', 'Time spent checking out connections',
+                                   labels=['pool'])
+
+        with self.app.app_context():
+            engines = {key or 'default': engine for key, engine in db.engines.items()}
+        if 'async_engine' in self.app.extensions:
+            engines['async'] = self.app.extensions['async_engine']
+
+        for name, engine in engines.items():
+            status = pool_status(engine.pool)
+            if 'size' in status:
+                size.add_metric([name], status['size'])
+                checked_out.add_metric([name], status['checked_out'])
+                overflow.add_metric([name], status['overflow'])
+            stats = getattr(engine.pool, 'checkout_stats', None)
+            if stats is not None:
+                checkouts.add_metric([name], stats.checkouts)
+                timeouts.add_metric([name], stats.timeouts)
+                wait.add_metric([name], stats.wait_seconds_total)
+
+        yield from (size, checked_out, overflow, checkouts, timeouts, wait)
+
+
+class Metrics:
+    """
+    Prometheus metrics for the app's requests and SQL.
+
+    Requests are labelled by endpoint, and SQL statements by endpoint and
+    by the `request_phase` they ran in, so slow requests can be pinned on
+    parsing, the database or serialization. Each app gets its own registry.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        self.registry = CollectorRegistry()
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Request latency', ['method', 'endpoint'],
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.requests = Counter(
+            'http_requests', 'Requests by response status', ['method', 'endpoint', 'status'],
+            registry=self.registry,
+        )
+        self.response_bytes = Histogram(
+            'http_response_size_bytes', 'Response body size', ['method', 'endpoint'],
+            buckets=SIZE_BUCKETS, registry=self.registry,
+        )
+        self.phase_seconds = Histogram(
+            'http_request_phase_duration_seconds', 'Time spent in each phase of a request', ['endpoint', 'phase'],
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.statements = Counter(
+            'db_statements', 'SQL statements executed', ['endpoint', 'phase'],
+            registry=self.registry,
+        )
+        self.statement_seconds = Histogram(
+            'db_statement_duration_seconds', 'SQL statement execution time', ['endpoint', 'phase'],
+            buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.registry.register(PoolCollector(app))
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+                event.listen(engine, 'handle_error', self._handle_error)
+
+        app.extensions['metrics'] = self
+
+    def _start_request(self):
+        g.metrics = self
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+
+        labels = (request.method, request_endpoint())
+        self.request_seconds.labels(*labels).observe(time.perf_counter() - started)
+        self.requests.labels(*labels, str(response.status_code)).inc()
+        # streamed responses have no length up front
+        if not response.is_streamed:
+            self.response_bytes.labels(*labels).observe(response.calculate_content_length() or 0)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        phase = g.get('metrics_phase') if has_request_context() else None
+        labels = (request_endpoint(), phase or 'other')
+        self.statements.labels(*labels).inc()
+        self.statement_seconds.labels(*labels).observe(elapsed)
+
+    def _handle_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_started'):
+            connection.info['metrics_started'].pop()
@@ -1,5 +1,7 @@
 from app.models.stashpoint import Stashpoint
 from app.models.booking import Booking
 from app.models.customer import Customer
+from app.models.occupancy import StashpointOccupancy
+from app.models.opening_hours import StashpointOpeningHours, StashpointOpenWindow
 
-__all__ = ["Stashpoint", "Booking", "Customer"]
+__all__ = ["Stashpoint", "Booking", "Customer", "StashpointOccupancy", "StashpointOpeningHours", "StashpointOpenWindow"]
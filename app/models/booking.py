@@ -1,20 +1,50 @@
+import math
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, and_, event, func
 from sqlalchemy.ext.hybrid import hybrid_property
 from app import db
 
 
+# Longest a booking may run. Bookings overlapping a window all drop off at
+# most this long before it, which lets searches skip older partitions.
+MAX_BOOKING_DAYS = 31
+MAX_BOOKING = timedelta(days=MAX_BOOKING_DAYS)
+
+# Partition holding bookings outside the monthly partitions
+DEFAULT_PARTITION = "bookings_default"
+
+
 class Booking(db.Model):
-    """Represents a customer's booking to store bags at a stashpoint"""
+    """
+    Represents a customer's booking to store bags at a stashpoint.
+
+    The table is range-partitioned by month of `dropoff_time`, see
+    app/services/booking_partitions.py; the primary key includes it as
+    Postgres requires, while the ORM identifies bookings by `id` alone.
+    """
 
     __tablename__ = "bookings"
+    __table_args__ = (
+        # capacity checks probe one stashpoint's live bookings by time
+        db.Index(
+            "ix_bookings_stashpoint_window",
+            "stashpoint_id", "dropoff_time", "pickup_time",
+            postgresql_where=db.text("NOT is_cancelled"),
+        ),
+        db.CheckConstraint(
+            f"pickup_time - dropoff_time <= interval '{MAX_BOOKING_DAYS} days'", name="ck_bookings_max_duration"
+        ),
+        {"postgresql_partition_by": "RANGE (dropoff_time)"},
+    )
 
     id = db.Column(db.String, primary_key=True, default=lambda: uuid.uuid4().hex)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     # Booking details
     bag_count = db.Column(db.Integer, nullable=False, default=1)
-    dropoff_time = db.Column(db.DateTime, nullable=False, index=True)
+    # in the primary key as the partition key
+    dropoff_time = db.Column(db.DateTime, primary_key=True, index=True)
     pickup_time = db.Column(db.DateTime, nullable=False, index=True)
 
     # Status fields
@@ -31,10 +61,31 @@ class Booking(db.Model):
         db.String, db.ForeignKey("customers.id"), nullable=False, index=True
     )
 
+    __mapper_args__ = {"primary_key": [id]}
+
     # Relationships
     stashpoint = db.relationship("Stashpoint", back_populates="bookings")
     customer = db.relationship("Customer", back_populates="bookings")
 
+    @hybrid_property
+    def days(self):
+        """Days charged for, counting each started 24 hours"""
+        return max(1, math.ceil((self.pickup_time - self.dropoff_time).total_seconds() / 86400))
+
+    @days.expression
+    def days(cls):
+        seconds = func.extract("epoch", cls.pickup_time - cls.dropoff_time)
+        return func.greatest(1, func.ceil(seconds / 86400))
+
+    @hybrid_property
+    def is_active(self):
+        """Not cancelled and the bags not yet collected"""
+        return not self.is_cancelled and not self.checked_out
+
+    @is_active.expression
+    def is_active(cls):
+        return and_(cls.is_cancelled == False, cls.checked_out == False)
+
     def to_dict(self):
         """Convert the model to a dictionary for API responses"""
         return {
@@ -52,3 +103,10 @@ class Booking(db.Model):
             "days": self.days,
             "is_active": self.is_active,
         }
+
+
+# create_all makes the partitioned table; this catches every booking until
+# `flask stashpoints maintain-booking-partitions` adds the monthly ones
+event.listen(
+    Booking.__table__, "after_create", DDL(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF bookings DEFAULT")
+)
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Integer, String, event, func, inspect, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from app import db
+from app.models.booking import Booking
+
+
+# Width of an occupancy bucket. Changing it requires `flask stashpoints rebuild-occupancy`.
+BUCKET_MINUTES = 15
+BUCKET = timedelta(minutes=BUCKET_MINUTES)
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Booking attributes that move bags between buckets
+_TRACKED_ATTRIBUTES = ("stashpoint_id", "dropoff_time", "pickup_time", "bag_count", "is_cancelled")
+
+
+class StashpointOccupancy(db.Model):
+    """Bags booked at a stashpoint during one fixed-width time bucket"""
+
+    __tablename__ = "stashpoint_occupancy"
+
+    stashpoint_id = db.Column(
+        db.String, db.ForeignKey("stashpoints.id", ondelete="CASCADE"), primary_key=True
+    )
+    # indexed on its own too, for time-window scans across every stashpoint
+    bucket_start = db.Column(db.DateTime, primary_key=True, index=True)
+    booked_bags = db.Column(db.Integer, nullable=False, default=0)
+
+
+def bucket_floor(moment):
+    """Start of the bucket containing `moment` (naive UTC)"""
+    return moment - (moment - _EPOCH) % BUCKET
+
+
+def bucket_floor_sql(column):
+    """SQL counterpart of `bucket_floor` for a timestamp column"""
+    seconds = BUCKET_MINUTES * 60
+    return func.timezone(
+        "UTC", func.to_timestamp(func.floor(func.extract("epoch", column) / seconds) * seconds)
+    )
+
+
+def apply_booking(connection, stashpoint_id, dropoff_time, pickup_time, bag_count):
+    """Add `bag_count` (negative to remove) to every bucket the booking touches"""
+    last_instant = pickup_time - timedelta(microseconds=1)
+    bucket_start = func.generate_series(
+        bucket_floor(dropoff_time), bucket_floor(last_instant), BUCKET
+    ).column_valued("bucket_start")
+
+    stmt = insert(StashpointOccupancy).from_select(
+        ["stashpoint_id", "bucket_start", "booked_bags"],
+        select(
+            literal(stashpoint_id, String),
+            bucket_start,
+            literal(bag_count, Integer),
+        ),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StashpointOccupancy.stashpoint_id, StashpointOccupancy.bucket_start],
+        set_={"booked_bags": StashpointOccupancy.booked_bags + stmt.excluded.booked_bags},
+    )
+    connection.execute(stmt)
+
+
+def _previous_value(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, name)
+
+
+@event.listens_for(Booking, "after_insert")
+def _booking_inserted(mapper, connection, booking):
+    if not booking.is_cancelled:
+        apply_booking(
+            connection,
+            booking.stashpoint_id,
+            booking.dropoff_time,
+            booking.pickup_time,
+            booking.bag_count,
+        )
+
+
+@event.listens_for(Booking, "after_update")
+def _booking_updated(mapper, connection, booking):
+    state = inspect(booking)
+    if not any(state.attrs[name].history.has_changes() for name in _TRACKED_ATTRIBUTES):
+        return
+
+    previous = {name: _previous_value(state, name) for name in _TRACKED_ATTRIBUTES}
+    if not previous["is_cancelled"]:
+        apply_booking(
+            connection,
+            previous["stashpoint_id"],
+            previous["dropoff_time"],
+            previous["pickup_time"],
+            -previous["bag_count"],
+        )
+    if not booking.is_cancelled:
+        apply_booking(
+            connection,
+            booking.stashpoint_id,
+            booking.dropoff_time,
+            booking.pickup_time,
+            booking.bag_count,
+        )
+
+
+@event.listens_for(Booking, "after_delete")
+def _booking_deleted(mapper, connection, booking):
+    state = inspect(booking)
+    previous = {name: _previous_value(state, name) for name in _TRACKED_ATTRIBUTES}
+    if not previous["is_cancelled"]:
+        apply_booking(
+            connection,
+            previous["stashpoint_id"],
+            previous["dropoff_time"],
+            previous["pickup_time"],
+            -previous["bag_count"],
+        )
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# active_history loads the old value on assignment so after_update can always undo it
+for _name in _TRACKED_ATTRIBUTES:
+    event.listen(getattr(Booking, _name), "set", _load_previous_value, active_history=True)
@@ -0,0 +1,301 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+import pytz
+from flask import current_app, has_app_context
+from sqlalchemy import Integer, String, cast, delete, event, func, insert, inspect
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.orm import Session
+from app import db
+from app.models.stashpoint import Stashpoint
+
+
+DAY_MINUTES = 24 * 60
+# Bits in a compiled schedule, one per minute from Monday 00:00
+WEEK_MINUTES = Stashpoint.open_minutes.type.length
+WEEK = timedelta(days=7)
+
+# Days of open windows precomputed ahead, when there's no app config to ask
+DEFAULT_HORIZON_DAYS = 60
+
+# Stashpoint attributes the compiled schedule depends on
+_SCHEDULE_ATTRIBUTES = ("open_from", "open_until", "opening_hours")
+
+# Stashpoint attributes the open windows depend on
+_WINDOW_ATTRIBUTES = ("open_minutes", "timezone", "open_windows_from", "open_windows_until")
+
+
+class StashpointOpeningHours(db.Model):
+    """
+    One opening of a stashpoint's weekly schedule: from `opens` on
+    `weekday` (0 is Monday) up to and including the `closes` minute, as
+    `open_until` always has been. A `closes` before `opens` runs past
+    midnight into the next day. Days without any rows are closed.
+    """
+
+    __tablename__ = "stashpoint_opening_hours"
+
+    stashpoint_id = db.Column(
+        db.String, db.ForeignKey("stashpoints.id", ondelete="CASCADE"), primary_key=True
+    )
+    weekday = db.Column(db.SmallInteger, primary_key=True)
+    opens = db.Column(db.Time, primary_key=True)
+    closes = db.Column(db.Time, nullable=False)
+
+    stashpoint = db.relationship("Stashpoint", back_populates="opening_hours")
+
+    def to_dict(self):
+        return {
+            "weekday": self.weekday,
+            "opens": self.opens.strftime("%H:%M"),
+            "closes": self.closes.strftime("%H:%M"),
+        }
+
+
+class StashpointOpenWindow(db.Model):
+    """
+    One stretch of time a stashpoint is open, in naive UTC, from `opens_at`
+    up to but excluding `closes_at`. Precomputed from the compiled schedule
+    and the stashpoint's timezone for the stashpoint's open_windows_from to
+    open_windows_until, so searches compare times instead of converting
+    them to every stashpoint's local time.
+    """
+
+    __tablename__ = "stashpoint_open_windows"
+
+    stashpoint_id = db.Column(
+        db.String, db.ForeignKey("stashpoints.id", ondelete="CASCADE"), primary_key=True
+    )
+    opens_at = db.Column(db.DateTime, primary_key=True)
+    closes_at = db.Column(db.DateTime, nullable=False)
+
+
+@lru_cache(maxsize=None)
+def zone(name):
+    """The pytz timezone called `name`"""
+    return pytz.timezone(name)
+
+
+def local_time(moment, timezone):
+    """`moment` (aware, or naive UTC) as naive local time in the IANA `timezone`"""
+    if moment.tzinfo is None:
+        moment = pytz.utc.localize(moment)
+    return moment.astimezone(zone(timezone)).replace(tzinfo=None)
+
+
+def utc_time(local, timezone, is_dst):
+    """
+    Naive local time in `timezone` as naive UTC. `is_dst` picks the side of
+    a clock change for times a change skips or repeats.
+    """
+    tz = zone(timezone)
+    return tz.normalize(tz.localize(local, is_dst=is_dst)).astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def minute_of_week(moment):
+    """Minutes from Monday 00:00 to the weekday and time of day of `moment`"""
+    return moment.weekday() * DAY_MINUTES + moment.hour * 60 + moment.minute
+
+
+def daily_schedule(open_from, open_until):
+    """The (weekday, opens, closes) openings of the same hours every day"""
+    if open_from > open_until:
+        # never matched the old time-of-day checks, so never open
+        return []
+    return [(weekday, open_from, open_until) for weekday in range(7)]
+
+
+def compile_schedule(openings):
+    """
+    The open minutes of the week of (weekday, opens, closes) openings, as
+    an int with bit n set when minute n from Monday 00:00 is open.
+    Openings past Sunday midnight wrap around to Monday.
+    """
+    mask = 0
+    for weekday, opens, closes in openings:
+        first = weekday * DAY_MINUTES + opens.hour * 60 + opens.minute
+        last = weekday * DAY_MINUTES + closes.hour * 60 + closes.minute
+        if last < first:
+            last += DAY_MINUTES
+        mask |= ((1 << (last - first + 1)) - 1) << first
+    # fold anything past the end of the week back onto Monday
+    return (mask | mask >> WEEK_MINUTES) & ((1 << WEEK_MINUTES) - 1)
+
+
+def mask_to_bits(mask):
+    """The BIT(WEEK_MINUTES) string of a compiled schedule, minute 0 first"""
+    return format(mask, f"0{WEEK_MINUTES}b")[::-1]
+
+
+def bits_to_mask(bits):
+    """A compiled schedule from its BIT(WEEK_MINUTES) string; None stays None"""
+    return int(bits[::-1], 2) if bits is not None else None
+
+
+def is_open(mask, moment):
+    """Whether the compiled schedule `mask` is open at the minute of the week of `moment`"""
+    return bool(mask >> minute_of_week(moment) & 1)
+
+
+def open_runs(mask):
+    """
+    (first, end) minutes of the week of each run of open minutes, `end`
+    excluded. A run over Sunday midnight ends past WEEK_MINUTES.
+    """
+    runs = []
+    first = 0
+    while mask >> first:
+        rest = mask >> first
+        first += (rest & -rest).bit_length() - 1
+        closed = ~(mask >> first)
+        end = first + (closed & -closed).bit_length() - 1
+        runs.append((first, end))
+        first = end
+    if len(runs) > 1 and runs[0][0] == 0 and runs[-1][1] == WEEK_MINUTES:
+        runs[-1] = (runs[-1][0], WEEK_MINUTES + runs.pop(0)[1])
+    return runs
+
+
+def open_windows(mask, timezone, start, end):
+    """
+    The (opens_at, closes_at) naive UTC windows of the compiled schedule
+    `mask` in `timezone` overlapping [start, end), earliest first. Windows
+    that touch are merged, so an always-open stashpoint has one.
+
+    Around clock changes, openings take the earlier reading of a repeated
+    local time and closings the later one.
+    """
+    runs = open_runs(mask)
+    local_start = local_time(start, timezone)
+    week = datetime.combine(local_start.date() - timedelta(days=local_start.weekday()), datetime.min.time())
+    # a run carried over from the week before can still be open at `start`
+    week -= WEEK
+    windows = []
+    while runs and utc_time(week, timezone, True) < end:
+        for first, last in runs:
+            opens_at = utc_time(week + timedelta(minutes=first), timezone, True)
+            closes_at = utc_time(week + timedelta(minutes=last), timezone, False)
+            if closes_at <= start or opens_at >= end or closes_at <= opens_at:
+                continue
+            if windows and windows[-1][1] >= opens_at:
+                windows[-1] = (windows[-1][0], max(windows[-1][1], closes_at))
+            else:
+                windows.append((opens_at, closes_at))
+        week += WEEK
+    return windows
+
+
+def window_horizon(now=None):
+    """
+    The [start, end) naive UTC range open windows are kept for: from the
+    day before `now` to OPEN_WINDOWS_HORIZON_DAYS after it.
+    """
+    days = DEFAULT_HORIZON_DAYS
+    if has_app_context():
+        days = current_app.config.get("OPEN_WINDOWS_HORIZON_DAYS", days)
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=1), today + timedelta(days=days + 1)
+
+
+def write_open_windows(connection, stashpoint_id, windows):
+    """Replace the stored open windows of a stashpoint"""
+    connection.execute(delete(StashpointOpenWindow).where(StashpointOpenWindow.stashpoint_id == stashpoint_id))
+    if windows:
+        connection.execute(insert(StashpointOpenWindow), [
+            {"stashpoint_id": stashpoint_id, "opens_at": opens_at, "closes_at": closes_at}
+            for opens_at, closes_at in windows
+        ])
+
+
+def is_open_sql(open_minutes, minute):
+    """SQL test of a BIT(WEEK_MINUTES) column at a minute of the week"""
+    return func.get_bit(open_minutes, minute) == 1
+
+
+def minute_of_week_sql(column):
+    """SQL counterpart of `minute_of_week` for a timestamp column"""
+    return cast(
+        (func.extract("isodow", column) - 1) * DAY_MINUTES
+        + func.extract("hour", column) * 60
+        + func.extract("minute", column),
+        Integer,
+    )
+
+
+def daily_open_minutes_sql(open_from, open_until):
+    """
+    SQL for the BIT(WEEK_MINUTES) of `daily_schedule`, from time columns,
+    for raw SQL writes that don't go through the session.
+    """
+    first = cast(func.extract("hour", open_from) * 60 + func.extract("minute", open_from), Integer)
+    last = cast(func.extract("hour", open_until) * 60 + func.extract("minute", open_until), Integer)
+    open_count = func.greatest(last - first + 1, 0)
+    day = (
+        func.repeat("0", first, type_=String)
+        + func.repeat("1", open_count, type_=String)
+        + func.repeat("0", DAY_MINUTES - first - open_count, type_=String)
+    )
+    return cast(func.repeat(day, 7, type_=String), BIT(WEEK_MINUTES))
+
+
+def stashpoint_openings(stashpoint, deleted=()):
+    """
+    The (weekday, opens, closes) openings of a stashpoint: its weekly
+    schedule, or `open_from`/`open_until` every day when it has none.
+    """
+    rows = [hours for hours in stashpoint.opening_hours if hours not in deleted]
+    if rows:
+        return [(hours.weekday, hours.opens, hours.closes) for hours in rows]
+    if stashpoint.open_from is None or stashpoint.open_until is None:
+        return []
+    return daily_schedule(stashpoint.open_from, stashpoint.open_until)
+
+
+def compile_open_minutes(stashpoint, deleted=()):
+    """Set a stashpoint's `open_minutes` from its current schedule"""
+    stashpoint.open_minutes = mask_to_bits(compile_schedule(stashpoint_openings(stashpoint, deleted)))
+
+
+@event.listens_for(Session, "before_flush")
+def _compile_changed_schedules(session, flush_context, instances):
+    deleted = set(session.deleted)
+    changed, moved = set(), set()
+    for obj in (*session.new, *session.dirty, *deleted):
+        if isinstance(obj, StashpointOpeningHours):
+            if obj.stashpoint is not None:
+                changed.add(obj.stashpoint)
+            history = inspect(obj).attrs.stashpoint.history
+            changed.update(stashpoint for stashpoint in history.deleted if stashpoint is not None)
+        elif isinstance(obj, Stashpoint) and obj not in deleted:
+            state = inspect(obj)
+            if state.pending or any(state.attrs[name].history.has_changes() for name in _SCHEDULE_ATTRIBUTES):
+                changed.add(obj)
+            elif state.attrs.timezone.history.has_changes():
+                moved.add(obj)
+
+    for stashpoint in changed - deleted:
+        compile_open_minutes(stashpoint, deleted)
+    # the windows are rewritten for the current horizon as the rows are saved
+    start, end = window_horizon()
+    for stashpoint in (changed | moved) - deleted:
+        stashpoint.open_windows_from, stashpoint.open_windows_until = start, end
+
+
+def _stashpoint_windows(stashpoint):
+    if stashpoint.open_windows_from is None or stashpoint.open_minutes is None:
+        return []
+    return open_windows(
+        bits_to_mask(stashpoint.open_minutes), stashpoint.timezone or "UTC",
+        stashpoint.open_windows_from, stashpoint.open_windows_until,
+    )
+
+
+@event.listens_for(Stashpoint, "after_insert")
+def _stashpoint_inserted(mapper, connection, stashpoint):
+    write_open_windows(connection, stashpoint.id, _stashpoint_windows(stashpoint))
+
+
+@event.listens_for(Stashpoint, "after_update")
+def _stashpoint_updated(mapper, connection, stashpoint):
+    state = inspect(stashpoint)
+    if any(state.attrs[name].history.has_changes() for name in _WINDOW_ATTRIBUTES):
+        write_open_windows(connection, stashpoint.id, _stashpoint_windows(stashpoint))
@@ -1,11 +1,16 @@
 import uuid
 from datetime import datetime
 from geoalchemy2.types import Geography
+from sqlalchemy.dialects.postgresql import BIT
 from sqlalchemy.ext.hybrid import hybrid_method
 from sqlalchemy import func
 from app import db
 
 
+# Hands out Stashpoint.cache_version, see app/services/shared_cache.py
+CACHE_VERSIONS = db.Sequence("stashpoint_cache_version", metadata=db.metadata)
+
+
 class Stashpoint(db.Model):
     """A location where bags can be stored"""
 
@@ -13,6 +18,16 @@ class Stashpoint(db.Model):
 
     id = db.Column(db.String, primary_key=True, default=lambda: uuid.uuid4().hex)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        index=True,
+    )
+
+    # Partner's id for the location, the key imports are upserted on
+    external_id = db.Column(db.String(255), unique=True, nullable=True)
 
     # Basic details
     name = db.Column(db.String(255), nullable=False)
@@ -34,8 +49,34 @@ class Stashpoint(db.Model):
     open_from = db.Column(db.Time, nullable=False)
     open_until = db.Column(db.Time, nullable=False)
 
+    # Every minute of the week from Monday 00:00, set when open, compiled
+    # from opening_hours (or open_from/open_until every day without any)
+    # whenever they change. See app/models/opening_hours.py.
+    open_minutes = db.Column(BIT(7 * 24 * 60), nullable=True)
+
+    # IANA zone the opening hours are kept in
+    timezone = db.Column(db.String(64), nullable=False, default="UTC", server_default="UTC")
+
+    # Range of the stashpoint_open_windows rows, the open times in UTC
+    # precomputed from open_minutes and timezone. Searches outside it
+    # convert to local time instead.
+    open_windows_from = db.Column(db.DateTime, nullable=True)
+    open_windows_until = db.Column(db.DateTime, nullable=True)
+
+    # Set from CACHE_VERSIONS after every commit changing the stashpoint or
+    # its bookings, so each worker's caches can tell their copy is stale;
+    # indexed for the highest version, read before each cached value is computed
+    cache_version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0", index=True)
+
     # Relationships
     bookings = db.relationship("Booking", back_populates="stashpoint", lazy="dynamic")
+    opening_hours = db.relationship(
+        "StashpointOpeningHours",
+        back_populates="stashpoint",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="(StashpointOpeningHours.weekday, StashpointOpeningHours.opens)",
+    )
 
     def __init__(self, **kwargs):
         super(Stashpoint, self).__init__(**kwargs)
@@ -59,4 +100,5 @@ class Stashpoint(db.Model):
             "open_until": (
                 self.open_until.strftime("%H:%M") if self.open_until else None
             ),
+            "timezone": self.timezone,
         }
@@ -0,0 +1,101 @@
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class CheckoutStats:
+    """Counts and wait times of the connection checkouts from one pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe(self, wait_seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def describe(self):
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_seconds_total * 1000, 3),
+                'wait_ms_mean': round(self.wait_seconds_total * 1000 / waits, 3) if waits else 0.0,
+                'wait_ms_max': round(self.wait_seconds_max * 1000, 3),
+            }
+
+
+class InstrumentedPoolMixin:
+    """
+    Times every checkout, including the wait for a free connection when
+    the pool is exhausted. The stats carry over when the engine is disposed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.checkout_stats.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        self.checkout_stats.observe(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_status(pool):
+    """Size, overflow and checkout statistics of a connection pool"""
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'timeout_seconds': pool.timeout(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # QueuePool counts up from -size; only connections beyond the size are overflow
+            'overflow': max(pool.overflow(), 0),
+        })
+    stats = getattr(pool, 'checkout_stats', None)
+    if stats is not None:
+        status['checkouts'] = stats.describe()
+    return status
+
+
+def dispose_after_fork(app):
+    """
+    Forget the pooled connections a forked worker inherited from its parent
+    (gunicorn with preload_app), so the worker opens its own. They are left
+    open for the parent, as closing them here would end its sessions too.
+    """
+    from app import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+
+# EXPLAIN ANALYZE runs the statement again, so only reads are explained
+EXPLAINABLE = ('SELECT', 'WITH')
+
+
+def plan_nodes(plan):
+    """Every node of an EXPLAIN (FORMAT JSON) plan"""
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(node.get('Plans', ()))
+
+
+def seq_scans(plan):
+    """Tables read by sequential scans anywhere in the plan"""
+    return sorted(node.get('Relation Name') for node in plan_nodes(plan) if node.get('Node Type') == 'Seq Scan')
+
+
+def rows_scanned(plan):
+    """
+    Rows read from tables and indexes by an EXPLAIN ANALYZE plan: what each
+    scan returned plus what its filters threw away, over all its loops.
+    """
+    total = 0
+    for node in plan_nodes(plan):
+        if 'Relation Name' not in node:
+            continue
+        per_loop = (
+            node.get('Actual Rows', 0)
+            + node.get('Rows Removed by Filter', 0)
+            + node.get('Rows Removed by Index Recheck', 0)
+        )
+        total += per_loop * node.get('Actual Loops', 1)
+    return total
+
+
+def json_safe(parameters):
+    """Bind parameters as they'd appear in JSON, e.g. datetimes as strings"""
+    return json.loads(json.dumps(parameters, default=str))
+
+
+class QueryProfiler:
+    """
+    Per-request SQL counts and time, reported in the X-Query-Count and
+    X-DB-Time (milliseconds) headers.
+
+    When a request running SQL takes longer than QUERY_PROFILER_THRESHOLD_MS,
+    its slowest read statements are run again under EXPLAIN (ANALYZE,
+    BUFFERS) and kept with their SQL and bind parameters in a ring buffer
+    of the last QUERY_PROFILER_MAX_CAPTURES slow requests. Meant for
+    development: the slow request also waits for its EXPLAINs.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        self.captures = deque(maxlen=app.config['QUERY_PROFILER_MAX_CAPTURES'])
+        self._lock = threading.Lock()
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+                event.listen(engine, 'handle_error', self._handle_error)
+
+        app.extensions['query_profiler'] = self
+
+    def describe(self):
+        """The captured slow requests, newest first"""
+        with self._lock:
+            return list(reversed(self.captures))
+
+    def clear(self):
+        with self._lock:
+            self.captures.clear()
+
+    def _start_request(self):
+        if current_app.config['QUERY_PROFILER_ENABLED']:
+            g.profiler_started = time.perf_counter()
+            g.profiler_statements = []
+
+    def _finish_request(self, response):
+        started = g.pop('profiler_started', None)
+        if started is None:
+            return response
+
+        statements = g.pop('profiler_statements')
+        db_seconds = sum(duration for _, _, duration in statements)
+        response.headers['X-Query-Count'] = str(len(statements))
+        response.headers['X-DB-Time'] = f'{db_seconds * 1000:.3f}'
+
+        duration = time.perf_counter() - started
+        if statements and duration * 1000 >= current_app.config['QUERY_PROFILER_THRESHOLD_MS']:
+            self._capture(duration, db_seconds, statements)
+        return response
+
+    def _capture(self, duration, db_seconds, statements):
+        from app import db
+
+        slowest = sorted(statements, key=lambda s: s[2], reverse=True)
+        reads = [s for s in slowest if s[0].lstrip().upper().startswith(EXPLAINABLE)]
+        explained = []
+        for statement, parameters, seconds in reads[:current_app.config['QUERY_PROFILER_MAX_STATEMENTS']]:
+            explained.append({
+                'sql': statement,
+                'parameters': json_safe(parameters),
+                'duration_ms': round(seconds * 1000, 3),
+                **self._explain(db.engine, statement, parameters),
+            })
+
+        capture = {
+            'captured_at': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'url': request.full_path,
+            'endpoint': request.endpoint,
+            'duration_ms': round(duration * 1000, 3),
+            'db_time_ms': round(db_seconds * 1000, 3),
+            'query_count': len(statements),
+            'statements': explained,
+        }
+        with self._lock:
+            self.captures.append(capture)
+
+    def _explain(self, engine, statement, parameters):
+        """The plan of one statement, on its own connection and rolled back"""
+        g.profiler_explaining = True
+        try:
+            with engine.connect() as connection:
+                plan = connection.exec_driver_sql(
+                    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + statement, parameters
+                ).scalar()
+                connection.rollback()
+        except Exception as e:
+            return {'plan': None, 'error': str(e)}
+        finally:
+            g.profiler_explaining = False
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return {
+            'plan': plan,
+            'seq_scans': seq_scans(plan[0]['Plan']),
+            'rows_scanned': rows_scanned(plan[0]['Plan']),
+        }
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['profiler_started'].pop()
+        if not has_app_context() or g.get('profiler_explaining'):
+            return
+        statements = g.get('profiler_statements')
+        if statements is not None:
+            statements.append((statement, parameters, time.perf_counter() - started))
+
+    def _handle_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('profiler_started'):
+            connection.info['profiler_started'].pop()
@@ -0,0 +1,181 @@
+import itertools
+import threading
+import time
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+# SQLALCHEMY_BINDS keys starting with this are read replicas of the primary
+# (config.replica_binds names them replica1, replica2...)
+REPLICA_BIND_PREFIX = "replica"
+
+# Session.info key holding the bind key of the replica a request reads from
+REPLICA_KEY = "read_replica"
+
+# Session.info flag set once a session has written, so its reads stay on the primary
+WROTE_KEY = "wrote"
+
+# Cookie sent to clients that wrote, so their next reads see their writes
+STICKY_COOKIE = "db_primary"
+
+# Blueprints that always read from the primary
+PRIMARY_BLUEPRINTS = ("admin",)
+
+READ_METHODS = ("GET", "HEAD")
+
+# Where the primary's WAL has got to, read just before each lag check
+PRIMARY_LSN_SQL = text("SELECT pg_current_wal_lsn()")
+
+# Seconds a replica is behind the primary: 0 when it isn't a replica, or
+# has replayed all the primary had written at :primary_lsn; NULL when its
+# WAL receiver isn't streaming, as it can't tell how far behind it is then.
+# Otherwise the age of the last transaction it replayed, or, when it has
+# replayed all it received, of the last message from the primary, which a
+# stalled stream stops refreshing.
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            THEN EXTRACT(EPOCH FROM now() - (SELECT last_msg_receipt_time FROM pg_stat_wal_receiver))
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+def is_write(clause):
+    """Whether a statement writes or locks rows, and so has to run on the primary"""
+    return bool(getattr(clause, "is_dml", False)) or getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    """
+    A session that reads from the replica in `info[REPLICA_KEY]`, when the
+    request picked one. Flushes, DML and locking reads go to the primary,
+    and once the session has written every later read does too, so a
+    request always sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get(REPLICA_KEY)
+        if replica is not None and bind is None:
+            if self._flushing or is_write(clause):
+                self.info.pop(REPLICA_KEY)
+                self.info[WROTE_KEY] = True
+            else:
+                return self._db.engines[replica]
+        elif self._flushing or is_write(clause):
+            self.info[WROTE_KEY] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of GET requests to the read replicas in SQLALCHEMY_BINDS.
+
+    Each worker measures a replica's lag at most every
+    REPLICA_LAG_CHECK_SECONDS, and skips replicas more than
+    REPLICA_MAX_LAG_SECONDS behind or unreachable, falling back to the
+    primary when none is left. Other methods, the admin endpoints and
+    clients holding the STICKY_COOKIE, given out for REPLICA_STICKY_SECONDS
+    by requests that wrote, stay on the primary.
+    """
+
+    def __init__(self, app=None, clock=time.monotonic):
+        self.clock = clock
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.replicas = [key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith(REPLICA_BIND_PREFIX)]
+        self._lock = threading.Lock()
+        self._lags = {}
+        self._next = itertools.count()
+        self.reads = dict.fromkeys([*self.replicas, "primary"], 0)
+
+        if self.replicas:
+            app.before_request(self._route_request)
+            app.after_request(self._stick_writers)
+        app.extensions["replica_router"] = self
+
+    def lag(self, replica):
+        """
+        Seconds `replica` is behind the primary, or None when it can't be
+        reached or isn't streaming from the primary, measured again once
+        the last measurement is too old.
+        """
+        now = self.clock()
+        with self._lock:
+            measured = self._lags.get(replica)
+        if measured is not None and now - measured[0] < current_app.config["REPLICA_LAG_CHECK_SECONDS"]:
+            return measured[1]
+
+        lag = self._measure_lag(replica)
+        with self._lock:
+            self._lags[replica] = (now, lag)
+        return lag
+
+    def _measure_lag(self, replica):
+        from app import db
+
+        try:
+            with db.engine.connect() as primary:
+                primary_lsn = primary.execute(PRIMARY_LSN_SQL).scalar()
+            with db.engines[replica].connect() as connection:
+                lag = connection.execute(LAG_SQL, {"primary_lsn": primary_lsn}).scalar()
+        except SQLAlchemyError:
+            return None
+        return None if lag is None else float(lag)
+
+    def pick(self):
+        """The bind key of a replica to read from, in turn, or None for the primary"""
+        max_lag = current_app.config["REPLICA_MAX_LAG_SECONDS"]
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            lag = self.lag(replica)
+            if lag is not None and lag <= max_lag:
+                return replica
+        return None
+
+    def describe(self):
+        """Each replica's last measured lag and reads served, and the reads that fell back to the primary"""
+        with self._lock:
+            lags = {replica: self._lags.get(replica, (None, None))[1] for replica in self.replicas}
+            reads = dict(self.reads)
+        return {
+            "replicas": [
+                {"bind": replica, "lag_seconds": lags[replica], "reads": reads[replica]}
+                for replica in self.replicas
+            ],
+            "primary_fallbacks": reads["primary"],
+            "max_lag_seconds": current_app.config["REPLICA_MAX_LAG_SECONDS"],
+        }
+
+    def _route_request(self):
+        if (
+            request.method not in READ_METHODS
+            or request.blueprint in PRIMARY_BLUEPRINTS
+            or request.cookies.get(STICKY_COOKIE)
+        ):
+            return
+
+        from app import db
+
+        replica = self.pick()
+        with self._lock:
+            self.reads[replica or "primary"] += 1
+        if replica is not None:
+            db.session.info[REPLICA_KEY] = replica
+
+    def _stick_writers(self, response):
+        from app import db
+
+        if db.session.info.get(WROTE_KEY) and response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE, "1", max_age=current_app.config["REPLICA_STICKY_SECONDS"], httponly=True
+            )
+        return response
@@ -0,0 +1,156 @@
+import hmac
+import io
+from flask import Blueprint, current_app, jsonify, request
+from app import db
+from app.pool import pool_status
+
+
+bp = Blueprint("admin", __name__)
+
+
+@bp.before_request
+def require_admin_token():
+    """Only callers presenting ADMIN_TOKEN get in; without one, only debug and test apps"""
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        if current_app.debug or current_app.testing:
+            return None
+        return jsonify({'error': 'Admin endpoints are disabled'}), 404
+
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    return None
+
+
+@bp.route("/catalog", methods=["GET"])
+def get_catalog_stats():
+    """Version, memory footprint and hit statistics of this worker's stashpoint catalog"""
+    catalog = current_app.extensions['stashpoint_catalog']
+    return jsonify({
+        'enabled': current_app.config['STASHPOINT_CATALOG_ENABLED'],
+        **catalog.describe(),
+    })
+
+
+@bp.route("/search-cache", methods=["GET"])
+def get_search_cache_stats():
+    """Size and hit statistics of this worker's search result cache"""
+    return jsonify({
+        'enabled': current_app.config['SEARCH_CACHE_ENABLED'],
+        **current_app.extensions['search_cache'].describe(),
+    })
+
+
+@bp.route("/availability-cache", methods=["GET"])
+def get_availability_cache_stats():
+    """Size and hit statistics of this worker's availability calendar cache"""
+    return jsonify({
+        'enabled': current_app.config['AVAILABILITY_CACHE_ENABLED'],
+        **current_app.extensions['availability_cache'].describe(),
+    })
+
+
+@bp.route("/cluster-cache", methods=["GET"])
+def get_cluster_cache_stats():
+    """Size and hit statistics of this worker's map tile cache"""
+    return jsonify(current_app.extensions['cluster_cache'].describe())
+
+
+@bp.route("/db-pool", methods=["GET"])
+def get_db_pool_stats():
+    """Size, overflow, checked-out connections and checkout waits of this worker's pools, replicas included"""
+    pools = {key or 'default': pool_status(engine.pool) for key, engine in db.engines.items()}
+    async_engine = current_app.extensions.get('async_engine')
+    if async_engine is not None:
+        pools['async'] = pool_status(async_engine.pool)
+    return jsonify({'pgbouncer': current_app.config.get('DB_PGBOUNCER', False), 'pools': pools})
+
+
+@bp.route("/replicas", methods=["GET"])
+def get_replica_stats():
+    """Lag and reads of this worker's read replicas, and the reads that fell back to the primary"""
+    return jsonify(current_app.extensions['replica_router'].describe())
+
+
+@bp.route("/slow-queries", methods=["GET"])
+def get_slow_queries():
+    """
+    The slow requests captured by the query profiler, newest first, each
+    with its slowest statements' SQL, bind parameters and EXPLAIN plans.
+    """
+    return jsonify({
+        'enabled': current_app.config['QUERY_PROFILER_ENABLED'],
+        'threshold_ms': current_app.config['QUERY_PROFILER_THRESHOLD_MS'],
+        'captures': current_app.extensions['query_profiler'].describe(),
+    })
+
+
+@bp.route("/slow-queries", methods=["DELETE"])
+def clear_slow_queries():
+    current_app.extensions['query_profiler'].clear()
+    return '', 204
+
+
+@bp.route("/stashpoints/import", methods=["POST"])
+def import_stashpoints_route():
+    """
+    Upsert stashpoints by external_id from a CSV or JSON/NDJSON file, sent
+    as the request body or as the `file` field of a multipart form. The
+    format comes from `?format=`, the content type or the file name.
+
+    Returns the import report: row counts, throughput and per-row errors.
+    """
+    from app.services.stashpoint_import import detect_format, import_stashpoints, read_rows
+
+    upload = request.files.get('file')
+    if upload is not None:
+        binary, filename, mimetype = upload.stream, upload.filename, upload.mimetype
+    else:
+        binary, filename, mimetype = request.stream, None, request.mimetype
+
+    import_format = request.args.get('format') or detect_format(filename, mimetype)
+    if import_format is None:
+        return jsonify({'error': 'Unknown file format, pass ?format=csv or ?format=json'}), 400
+    chunk_size = request.args.get('chunk_size', 5000, type=int)
+    if chunk_size <= 0:
+        return jsonify({'error': 'chunk_size must be positive'}), 400
+
+    stream = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+    try:
+        report = import_stashpoints(read_rows(stream, import_format), chunk_size)
+    except ValueError as e:
+        # an unreadable file, rather than a bad row
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report.to_dict())
+
+
+@bp.route("/stashpoints/<stashpoint_id>/opening-hours", methods=["PUT"])
+def set_opening_hours_route(stashpoint_id):
+    """
+    Replace a stashpoint's weekly opening hours with the `hours` of the
+    JSON body, a list of {weekday, opens, closes}; an empty list goes back
+    to open_from/open_until every day. An optional `timezone` moves the
+    hours to another IANA timezone. The compiled schedule and UTC open
+    windows searches use are updated in the same commit.
+    """
+    from pydantic import ValidationError
+    from app.routes.stashpoints import validation_error_response
+    from app.schemas.stashpoints import OpeningHoursParams
+    from app.services.bookings import StashpointNotFound
+    from app.services.opening_hours import set_opening_hours
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    try:
+        params = OpeningHoursParams(**body)
+        result = set_opening_hours(
+            stashpoint_id, [(hours.weekday, hours.opens, hours.closes) for hours in params.hours], params.timezone
+        )
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(e)
+    except StashpointNotFound:
+        return jsonify({'error': 'Stashpoint not found'}), 404
+    return jsonify(result)
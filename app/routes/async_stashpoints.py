@@ -0,0 +1,179 @@
+from pydantic import ValidationError
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import parse_etags, quote_etag
+from app.routes.stashpoints import (
+    NDJSON_MIMETYPE,
+    SEARCH_FIELDS,
+    format_catalog_page,
+    format_search_page,
+    next_page_headers,
+    parse_page_params,
+    parse_search_params,
+    stashpoints_with_distance,
+    validation_error_body,
+    wants_ndjson,
+)
+from app.schemas.stashpoints import BatchSearchParams
+from app.services.search import (
+    StashpointRow, build_batch_search_query, build_list_query, group_batch_results, search_queries, search_rows
+)
+from app.services.search_cache import listing_query, page_etag, page_from, quantize_search, search_cache_key
+from app.services.shared_cache import generation_query
+
+
+# Async counterparts of the read endpoints in app/routes/stashpoints.py.
+# They share its validation and formatting, and run the same queries
+# through the async engine on `request.app.state`.
+
+
+def json_response(request, data, status_code=200, headers=None):
+    """A JSON response serialized the same way as Flask's jsonify"""
+    body = request.app.state.flask_app.json.dumps(data) + '\n'
+    return Response(body, status_code=status_code, headers=headers, media_type='application/json')
+
+
+def validation_error_response(request, e):
+    return json_response(request, validation_error_body(e), status_code=400)
+
+
+def paginated_response(request, items, next_cursor):
+    base_url = str(request.url.replace(query=''))
+    headers = next_page_headers(base_url, dict(request.query_params), next_cursor)
+    return json_response(request, items, headers=headers)
+
+
+async def get_stashpoints(request):
+    """See `get_stashpoints` in app/routes/stashpoints.py"""
+    query_params = dict(request.query_params)
+
+    # no search params? list the catalog
+    if not SEARCH_FIELDS & query_params.keys():
+        return await get_stashpoint_catalog(request, query_params)
+
+    try:
+        search_params, after = parse_search_params(query_params)
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(request, e)
+
+    if request.app.state.config['SEARCH_CACHE_ENABLED']:
+        response_data, next_cursor, etag = await cached_search_page(request, search_params, after)
+    else:
+        response_data, next_cursor = await search_page(request, search_params, after)
+        etag = page_etag(response_data, next_cursor)
+
+    if parse_etags(request.headers.get('If-None-Match')).contains(etag):
+        return Response(status_code=304, headers={'ETag': quote_etag(etag)})
+
+    response = paginated_response(request, response_data, next_cursor)
+    response.headers['ETag'] = quote_etag(etag)
+    return response
+
+
+async def cached_search_page(request, search_params, after):
+    """`search_page` through the search cache, with the page's ETag (see app/routes/stashpoints.py)"""
+    config = request.app.state.config
+    cache = request.app.state.flask_app.extensions['search_cache']
+    shared = quantize_search(search_params, config['SEARCH_CACHE_COORD_DECIMALS'])
+    key = search_cache_key(shared)
+
+    async with request.app.state.session_factory() as session:
+        cached = cache.entry(key)
+        if cached is None:
+            cache.count(False)
+        else:
+            listing = (await session.execute(listing_query(cached.stashpoint_ids, search_params))).all()
+            if cache.is_listing_current(key, cached, listing):
+                return page_from(cached.value, listing)
+        generation = (await session.execute(generation_query())).scalar()
+
+    response_data, next_cursor = await search_page(request, shared, after)
+    page = (response_data, next_cursor, page_etag(response_data, next_cursor))
+    stashpoint_ids = [stashpoint['id'] for stashpoint in response_data]
+    cache.set(key, page, generation, stashpoint_ids)
+    if shared == search_params:
+        return page
+    async with request.app.state.session_factory() as session:
+        listing = (await session.execute(listing_query(stashpoint_ids, search_params))).all()
+    return page_from(page, listing)
+
+
+async def search_page(request, search_params, after):
+    """One page of search results as dicts, plus the cursor of the next page"""
+    config = request.app.state.config
+    page_size = search_params.limit or config['STASHPOINTS_PAGE_SIZE']
+    limit = page_size + 1
+
+    async with request.app.state.session_factory() as session:
+        for query, params in search_queries(search_params, config, limit=limit, after=after):
+            results = (await session.execute(query, params)).all()
+            if len(results) >= limit:
+                break
+    return format_search_page(search_rows(results), page_size)
+
+
+async def get_stashpoint_catalog(request, query_params):
+    """A page of every stashpoint, in id order"""
+    try:
+        if wants_ndjson(query_params, request.headers.get('Accept')):
+            return stream_stashpoint_catalog(request)
+        page_params, after_id = parse_page_params(query_params)
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(request, e)
+
+    page_size = page_params.limit or request.app.state.config['STASHPOINTS_PAGE_SIZE']
+    async with request.app.state.session_factory() as session:
+        rows = await session.execute(build_list_query(page_size + 1, after_id))
+        stashpoints = [StashpointRow(row) for row in rows]
+    return paginated_response(request, *format_catalog_page(stashpoints, page_size))
+
+
+def stream_stashpoint_catalog(request):
+    """Stream every stashpoint as NDJSON, writing rows as they're read"""
+    state = request.app.state
+    batch_size = state.config['STASHPOINTS_STREAM_BATCH_SIZE']
+
+    async def generate():
+        # a keyset page per session, so no transaction stays open while the client reads
+        after_id = None
+        while True:
+            async with state.session_factory() as session:
+                rows = (await session.execute(build_list_query(batch_size, after_id))).all()
+            for row in rows:
+                yield state.flask_app.json.dumps(StashpointRow(row).to_dict()) + '\n'
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1].id
+
+    return StreamingResponse(generate(), media_type=NDJSON_MIMETYPE)
+
+
+async def batch_search_stashpoints(request):
+    """See `batch_search_stashpoints_route` in app/routes/stashpoints.py"""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return json_response(request, {'error': 'Request body must be a JSON object'}, status_code=400)
+
+    try:
+        batch_params = BatchSearchParams(**body)
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(request, e)
+
+    config = request.app.state.config
+    query = build_batch_search_query(
+        batch_params.searches, config, default_limit=config['STASHPOINTS_PAGE_SIZE']
+    )
+    async with request.app.state.session_factory() as session:
+        rows = (await session.execute(query)).all()
+
+    results = group_batch_results(rows, len(batch_params.searches))
+    return json_response(request, {'results': [stashpoints_with_distance(rows) for rows in results]})
+
+
+routes = [
+    Route('/api/v1/stashpoints/', get_stashpoints, methods=['GET']),
+    Route('/api/v1/stashpoints/search:batch', batch_search_stashpoints, methods=['POST']),
+]
@@ -1,14 +1,168 @@
-from flask import Blueprint, jsonify, request
+from urllib.parse import urlencode
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from pydantic import ValidationError
-from datetime import datetime
-from sqlalchemy import func, and_, or_, cast, Float
-from app.models import Stashpoint, Booking
-from app.schemas.stashpoints import StashpointSearchParams, StashpointResponse
+from datetime import datetime, timedelta
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
 from app import db
+from app.metrics import request_phase
+from app.schemas.stashpoints import (
+    AvailabilityParams, BatchSearchParams, BookingCreateParams, ClusterParams, PageParams, StashpointSearchParams, StashpointResponse
+)
+from app.services.availability import stashpoint_availability
+from app.services.bookings import BookingUnavailable, StashpointBusy, StashpointNotFound, create_booking
+from app.services.capacity import naive_utc
+from app.services.clusters import viewport_clusters
+from app.services.opening_hours import get_opening_hours
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.search import (
+    batch_search_stashpoints, iter_stashpoints, list_stashpoints, search_stashpoints
+)
+from app.services.search_cache import listing_query, page_etag, page_from, quantize_search, search_cache_key
 
 
 bp = Blueprint("stashpoints", __name__)
 
+# any of these switches the endpoint from catalog listing to availability search
+SEARCH_FIELDS = {'lat', 'lng', 'dropoff', 'pickup', 'bag_count', 'radius_km'}
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def validation_error_body(e):
+    """The 400 body for a ValidationError or ValueError"""
+    if isinstance(e, ValidationError):
+        errors = []
+        for error in e.errors():
+            field = '.'.join(str(x) for x in error['loc'])
+            errors.append({
+                'field': field,
+                'message': error['msg'],
+                'type': error['type']
+            })
+        return {'error': 'Validation failed', 'details': errors}
+    else:
+        return {'error': str(e)}
+
+
+def validation_error_response(e):
+    """Turn a ValidationError or ValueError into a 400 response"""
+    return jsonify(validation_error_body(e)), 400
+
+
+def next_page_headers(base_url, args, next_cursor):
+    """X-Next-Cursor and Link headers pointing at the next page, if any"""
+    if not next_cursor:
+        return {}
+    next_args = {**args, 'cursor': next_cursor}
+    return {
+        'X-Next-Cursor': next_cursor,
+        'Link': f'<{base_url}?{urlencode(next_args)}>; rel="next"',
+    }
+
+
+def paginated_response(items, next_cursor):
+    """JSON array response, with the next page's cursor in the headers"""
+    response = jsonify(items)
+    response.headers.update(next_page_headers(request.base_url, request.args.to_dict(), next_cursor))
+    return response
+
+
+def parse_search_params(query_params):
+    """
+    Validate search query params, returning the StashpointSearchParams and
+    the (sort_distance, id) to resume after. Raises ValueError or
+    ValidationError.
+    """
+    with request_phase('parsing'):
+        query_params = dict(query_params)
+
+        # convert strings to proper types
+        if 'lat' in query_params:
+            query_params['lat'] = float(query_params['lat'])
+        if 'lng' in query_params:
+            query_params['lng'] = float(query_params['lng'])
+        if 'bag_count' in query_params:
+            query_params['bag_count'] = int(query_params['bag_count'])
+        if 'radius_km' in query_params:
+            query_params['radius_km'] = float(query_params['radius_km'])
+        if 'limit' in query_params:
+            query_params['limit'] = int(query_params['limit'])
+
+        # parse datetime strings
+        if 'dropoff' in query_params:
+            query_params['dropoff'] = datetime.fromisoformat(query_params['dropoff'].replace('Z', '+00:00'))
+        if 'pickup' in query_params:
+            query_params['pickup'] = datetime.fromisoformat(query_params['pickup'].replace('Z', '+00:00'))
+
+    with request_phase('validation'):
+        # run pydantic validation
+        search_params = StashpointSearchParams(**query_params)
+
+        # resume after the last row of the previous page
+        after = None
+        if search_params.cursor:
+            sort_distance, stashpoint_id = decode_cursor(search_params.cursor, 'search', (int, float), str)
+            after = (float(sort_distance), stashpoint_id)
+
+    return search_params, after
+
+
+def parse_page_params(query_params):
+    """
+    Validate catalog listing query params, returning the PageParams and the
+    id to resume after. Raises ValueError or ValidationError.
+    """
+    with request_phase('parsing'):
+        query_params = dict(query_params)
+        if 'limit' in query_params:
+            query_params['limit'] = int(query_params['limit'])
+
+    with request_phase('validation'):
+        page_params = PageParams(**query_params)
+
+        after_id = None
+        if page_params.cursor:
+            after_id, = decode_cursor(page_params.cursor, 'catalog', str)
+
+    return page_params, after_id
+
+
+def stashpoints_with_distance(rows):
+    """API dicts for (stashpoint, distance_km, ...) rows"""
+    response_data = []
+    for stashpoint, distance, *_ in rows:
+        stashpoint_dict = stashpoint.to_dict()
+        stashpoint_dict['distance_km'] = round(distance, 2) if distance is not None else 0.0
+        response_data.append(stashpoint_dict)
+    return response_data
+
+
+def format_search_page(results, page_size):
+    """
+    Dicts for the first `page_size` search results, plus the next page's
+    cursor if the search returned more.
+    """
+    page = results[:page_size]
+
+    next_cursor = None
+    if len(results) > page_size:
+        last_stashpoint, _, last_sort_distance = page[-1]
+        next_cursor = encode_cursor('search', last_sort_distance, last_stashpoint.id)
+
+    return stashpoints_with_distance(page), next_cursor
+
+
+def format_catalog_page(stashpoints, page_size):
+    """Dicts for the first `page_size` stashpoints, plus the next page's cursor"""
+    page = stashpoints[:page_size]
+
+    next_cursor = None
+    if len(stashpoints) > page_size:
+        next_cursor = encode_cursor('catalog', page[-1].id)
+
+    return [stashpoint.to_dict() for stashpoint in page], next_cursor
+
 
 @bp.route("/", methods=["GET"])
 def get_stashpoints():
@@ -20,122 +174,283 @@ def get_stashpoints():
     - dropoff/pickup: ISO datetime strings
     - bag_count: how many bags
     - radius_km: max distance (optional)
+    - limit: page size, i.e. only the nearest N for searches (optional)
+    - cursor: X-Next-Cursor from the previous page (optional)
+    - format: "ndjson" streams the whole catalog, one stashpoint per line (optional)
 
     Filters:
     - Within radius (if specified)
     - Has capacity for the bags during the time period
     - Open at both dropoff and pickup times
 
-    Sorted by distance from search point.
+    Search pages carry an ETag and answer If-None-Match with 304. With
+    SEARCH_CACHE_ENABLED, coordinates are rounded so near-identical
+    searches share a cached page.
+
+    Sorted by distance from search point. Without search params the whole
+    catalog is listed in id order. Both are keyset paginated, unless the
+    catalog is requested as NDJSON (`format=ndjson` or
+    `Accept: application/x-ndjson`).
     """
     # grab query params
     query_params = request.args.to_dict()
 
-    # no params? return everything
-    if not query_params:
-        stashpoints = Stashpoint.query.all()
-        return jsonify([stashpoint.to_dict() for stashpoint in stashpoints])
+    # no search params? list the catalog
+    if not SEARCH_FIELDS & query_params.keys():
+        return get_stashpoint_catalog(query_params)
 
     # validate params
     try:
-        # convert strings to proper types
-        if 'lat' in query_params:
-            query_params['lat'] = float(query_params['lat'])
-        if 'lng' in query_params:
-            query_params['lng'] = float(query_params['lng'])
-        if 'bag_count' in query_params:
-            query_params['bag_count'] = int(query_params['bag_count'])
-        if 'radius_km' in query_params:
-            query_params['radius_km'] = float(query_params['radius_km'])
+        search_params, after = parse_search_params(query_params)
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(e)
 
-        # parse datetime strings
-        if 'dropoff' in query_params:
-            query_params['dropoff'] = datetime.fromisoformat(query_params['dropoff'].replace('Z', '+00:00'))
-        if 'pickup' in query_params:
-            query_params['pickup'] = datetime.fromisoformat(query_params['pickup'].replace('Z', '+00:00'))
+    if current_app.config['SEARCH_CACHE_ENABLED']:
+        response_data, next_cursor, etag = cached_search_page(search_params, after)
+    else:
+        response_data, next_cursor = search_page(search_params, after)
+        etag = page_etag(response_data, next_cursor)
 
-        # run pydantic validation
-        search_params = StashpointSearchParams(**query_params)
+    with request_phase('serialization'):
+        response = paginated_response(response_data, next_cursor)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+
+def cached_search_page(search_params, after):
+    """
+    `search_page` through the search cache, with the page's ETag. The page
+    is searched from the rounded point of `quantize_search`, and served
+    with distances from the search's own point.
+    """
+    cache = current_app.extensions['search_cache']
+    # near-identical searches share a cached page
+    shared = quantize_search(search_params, current_app.config['SEARCH_CACHE_COORD_DECIMALS'])
+    key = search_cache_key(shared)
+
+    cached = cache.entry(key)
+    if cached is None:
+        cache.count(False)
+    else:
+        listing = db.session.execute(listing_query(cached.stashpoint_ids, search_params)).all()
+        if cache.is_listing_current(key, cached, listing):
+            return page_from(cached.value, listing)
+
+    generation = cache.generation()
+    response_data, next_cursor = search_page(shared, after)
+    page = (response_data, next_cursor, page_etag(response_data, next_cursor))
+    # a booking at any listed stashpoint can take it off this page
+    stashpoint_ids = [stashpoint['id'] for stashpoint in response_data]
+    cache.set(key, page, generation, stashpoint_ids)
+    if shared == search_params:
+        return page
+    return page_from(page, db.session.execute(listing_query(stashpoint_ids, search_params)).all())
+
+
+def search_page(search_params, after):
+    """One page of search results as dicts, plus the cursor of the next page"""
+    # run the search, sorted by distance - one extra row tells us if there's another page
+    page_size = search_params.limit or current_app.config['STASHPOINTS_PAGE_SIZE']
+    with request_phase('query'):
+        results = search_stashpoints(search_params, current_app.config, limit=page_size + 1, after=after)
+    with request_phase('serialization'):
+        return format_search_page(results, page_size)
+
+
+@bp.route("/search:batch", methods=["POST"])
+def batch_search_stashpoints_route():
+    """
+    Run several searches in one request, answered by a single query.
+
+    Body: {"searches": [...]}, each search taking the same fields as the
+    query params of GET / except `cursor` (up to 50 searches). Each search
+    returns its `limit` (default STASHPOINTS_PAGE_SIZE) nearest available
+    stashpoints, with the same filters and distance ordering.
+
+    Returns {"results": [[...], ...]}, one list per search in request order.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    try:
+        batch_params = BatchSearchParams(**body)
     except (ValueError, ValidationError) as e:
-        if isinstance(e, ValidationError):
-            errors = []
-            for error in e.errors():
-                field = '.'.join(str(x) for x in error['loc'])
-                errors.append({
-                    'field': field,
-                    'message': error['msg'],
-                    'type': error['type']
-                })
-            return jsonify({'error': 'Validation failed', 'details': errors}), 400
-        else:
-            return jsonify({'error': str(e)}), 400
-
-    # start building query
-    query = Stashpoint.query
-
-    # calculate distance using PostGIS
-    # ST_Distance returns meters for geography types
-    distance_meters = func.ST_Distance(
-        Stashpoint.location,
-        func.ST_GeogFromText(f'POINT({search_params.lng} {search_params.lat})')
+        return validation_error_response(e)
+
+    results = batch_search_stashpoints(
+        batch_params.searches,
+        current_app.config,
+        default_limit=current_app.config['STASHPOINTS_PAGE_SIZE']
     )
 
-    # convert to km, handle nulls just in case
-    distance_km = func.coalesce(cast(distance_meters / 1000.0, Float), 0.0)
-
-    # add distance column
-    query = query.add_columns(distance_km.label('distance_km'))
-
-    # filter by radius if provided
-    if search_params.radius_km:
-        query = query.filter(distance_meters <= search_params.radius_km * 1000)
-
-    # check capacity - count existing bookings in the time period
-    booking_counts = db.session.query(
-        Booking.stashpoint_id,
-        func.sum(Booking.bag_count).label('booked_bags')
-    ).filter(
-        and_(
-            # overlapping bookings
-            Booking.dropoff_time < search_params.pickup,
-            Booking.pickup_time > search_params.dropoff,
-            # skip cancelled ones
-            Booking.is_cancelled == False
+    return jsonify({'results': [stashpoints_with_distance(rows) for rows in results]})
+
+
+@bp.route("/<stashpoint_id>/bookings", methods=["POST"])
+def create_booking_route(stashpoint_id):
+    """
+    Book bags into a stashpoint.
+
+    Body: {"customer_id", "dropoff", "pickup", "bag_count"}, times in ISO
+    format. Capacity is reserved atomically, so concurrent requests can
+    never overbook a stashpoint.
+
+    Returns 201 with the booking, 404 for an unknown stashpoint, 409 when
+    it's closed or full for the period, and 503 with Retry-After when the
+    stashpoint was too busy to lock in time.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    try:
+        params = BookingCreateParams(**body)
+        booking = create_booking(stashpoint_id, params, current_app.config)
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(e)
+    except StashpointNotFound:
+        return jsonify({'error': 'Stashpoint not found'}), 404
+    except BookingUnavailable as e:
+        return jsonify({'error': str(e)}), 409
+    except StashpointBusy:
+        return jsonify({'error': 'Stashpoint is busy, try again'}), 503, {'Retry-After': '1'}
+
+    return jsonify(booking.to_dict()), 201
+
+
+@bp.route("/clusters", methods=["GET"])
+def get_clusters():
+    """
+    Stashpoints for a map viewport, clustered at low zoom.
+
+    Query params:
+    - bbox: west,south,east,north in degrees
+    - zoom: map zoom level (0-22)
+
+    Returns every Web Mercator tile overlapping the bbox: below
+    CLUSTER_POINTS_ZOOM a grid of clusters per tile (count, centroid, total
+    capacity) in `clusters`, from it the individual stashpoints in `points`.
+    Tiles are cached per worker, so panning only queries new tiles.
+    """
+    query_params = request.args.to_dict()
+    try:
+        if 'bbox' in query_params:
+            query_params['bbox'] = [float(part) for part in query_params['bbox'].split(',')]
+        if 'zoom' in query_params:
+            query_params['zoom'] = int(query_params['zoom'])
+        params = ClusterParams(**query_params)
+        result = viewport_clusters(
+            *params.bbox, params.zoom, current_app.config, cache=current_app.extensions['cluster_cache']
         )
-    ).group_by(Booking.stashpoint_id).subquery()
-
-    # join and check available capacity
-    query = query.outerjoin(
-        booking_counts,
-        Stashpoint.id == booking_counts.c.stashpoint_id
-    ).filter(
-        # enough space left?
-        Stashpoint.capacity - func.coalesce(booking_counts.c.booked_bags, 0) >= search_params.bag_count
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(e)
+
+    return jsonify(result)
+
+
+def parse_availability_params(query_params, max_days):
+    """
+    Validate availability query params, returning the calendar's start and
+    end (naive UTC) and step. Raises ValueError or ValidationError.
+    """
+    query_params = dict(query_params)
+    for name in ('from', 'to'):
+        if name in query_params:
+            query_params[name] = datetime.fromisoformat(query_params[name].replace('Z', '+00:00'))
+    if 'step' in query_params:
+        query_params['step'] = int(query_params['step'])
+    params = AvailabilityParams(**query_params)
+
+    start = naive_utc(params.start) if params.start else datetime.utcnow().replace(
+        hour=0, minute=0, second=0, microsecond=0
     )
+    end = naive_utc(params.end) if params.end else start + timedelta(days=7)
+    if end <= start:
+        raise ValueError('to must be after from')
+    if end - start > timedelta(days=max_days):
+        raise ValueError(f'The calendar can span at most {max_days} days')
+    return start, end, timedelta(minutes=params.step)
 
-    # check if open at both times
-    dropoff_time = search_params.dropoff.time()
-    pickup_time = search_params.pickup.time()
-
-    # must be open for both dropoff and pickup
-    query = query.filter(
-        and_(
-            Stashpoint.open_from <= dropoff_time,
-            Stashpoint.open_until >= dropoff_time,
-            Stashpoint.open_from <= pickup_time,
-            Stashpoint.open_until >= pickup_time
+
+@bp.route("/<stashpoint_id>/availability", methods=["GET"])
+def get_availability(stashpoint_id):
+    """
+    Free capacity of one stashpoint per time slot.
+
+    Query params:
+    - from/to: ISO dates or datetimes, default today (UTC) and 7 days on
+    - step: minutes per slot, a multiple of 15 dividing a day (default 60)
+
+    Slots follow each day's grid from midnight UTC and every slot
+    overlapping [from, to) is listed with its free bags, or as closed
+    outside the opening hours. Days are cached per worker and responses
+    carry an ETag.
+    """
+    try:
+        start, end, step = parse_availability_params(
+            request.args.to_dict(), current_app.config['AVAILABILITY_MAX_DAYS']
         )
-    )
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(e)
 
-    # sort by distance
-    query = query.order_by(distance_km)
-    results = query.all()
+    cache = None
+    if current_app.config['AVAILABILITY_CACHE_ENABLED']:
+        cache = current_app.extensions['availability_cache']
+    try:
+        calendar = stashpoint_availability(stashpoint_id, start, end, step, cache=cache)
+    except StashpointNotFound:
+        return jsonify({'error': 'Stashpoint not found'}), 404
 
-    # format results
-    response_data = []
-    for stashpoint, distance in results:
-        stashpoint_dict = stashpoint.to_dict()
-        stashpoint_dict['distance_km'] = round(distance, 2) if distance is not None else 0.0
-        response_data.append(stashpoint_dict)
+    response = jsonify(calendar)
+    response.set_etag(page_etag(calendar, None))
+    return response.make_conditional(request)
+
+
+@bp.route("/<stashpoint_id>/opening-hours", methods=["GET"])
+def get_stashpoint_opening_hours(stashpoint_id):
+    """
+    A stashpoint's weekly opening hours: its (weekday, opens, closes)
+    openings, or none when it keeps open_from/open_until every day.
+    """
+    try:
+        return jsonify(get_opening_hours(stashpoint_id))
+    except StashpointNotFound:
+        return jsonify({'error': 'Stashpoint not found'}), 404
+
+
+def wants_ndjson(query_params, accept_header):
+    """Whether the client asked for NDJSON via `format` or the Accept header"""
+    if 'format' in query_params:
+        if query_params['format'] not in ('json', 'ndjson'):
+            raise ValueError('format must be "json" or "ndjson"')
+        return query_params['format'] == 'ndjson'
+    accept = parse_accept_header(accept_header, MIMEAccept)
+    return accept.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_stashpoint_catalog():
+    """Stream every stashpoint as NDJSON, writing rows as they're read"""
+    batch_size = current_app.config['STASHPOINTS_STREAM_BATCH_SIZE']
+
+    def generate():
+        for stashpoint in iter_stashpoints(batch_size):
+            yield current_app.json.dumps(stashpoint.to_dict()) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def get_stashpoint_catalog(query_params):
+    """A page of every stashpoint, in id order"""
+    try:
+        if wants_ndjson(query_params, request.headers.get('Accept')):
+            return stream_stashpoint_catalog()
+        page_params, after_id = parse_page_params(query_params)
+    except (ValueError, ValidationError) as e:
+        return validation_error_response(e)
 
-    return jsonify(response_data)
+    page_size = page_params.limit or current_app.config['STASHPOINTS_PAGE_SIZE']
+    with request_phase('query'):
+        stashpoints = list_stashpoints(page_size + 1, after_id)
+    with request_phase('serialization'):
+        return paginated_response(*format_catalog_page(stashpoints, page_size))
@@ -1,9 +1,28 @@
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, time
+from typing import List, Optional
+import pytz
 from pydantic import BaseModel, Field, field_validator, ConfigDict
+from app.models.booking import MAX_BOOKING, MAX_BOOKING_DAYS
 
 
-class StashpointSearchParams(BaseModel):
+# Most searches a single batch request may carry
+MAX_BATCH_SEARCHES = 50
+
+
+def check_timezone(value: str) -> str:
+    if value not in pytz.all_timezones_set:
+        raise ValueError('timezone must be an IANA timezone name such as Europe/London')
+    return value
+
+
+class PageParams(BaseModel):
+    """Validates keyset pagination params"""
+    
+    limit: Optional[int] = Field(None, gt=0, le=100, description="Page size")
+    cursor: Optional[str] = Field(None, description="Opaque cursor from the previous page")
+
+
+class StashpointSearchParams(PageParams):
     """Validates search params for the stashpoints endpoint"""
     
     lat: float = Field(..., description="Latitude")
@@ -49,6 +68,160 @@ class StashpointSearchParams(BaseModel):
     )
 
 
+class BatchSearchParams(BaseModel):
+    """Validates the body of the batch search endpoint"""
+    
+    searches: List[StashpointSearchParams] = Field(
+        ..., min_length=1, max_length=MAX_BATCH_SEARCHES, description="Searches, answered in order"
+    )
+    
+    @field_validator('searches')
+    @classmethod
+    def validate_no_cursors(cls, value: List[StashpointSearchParams]) -> List[StashpointSearchParams]:
+        if any(search.cursor for search in value):
+            raise ValueError('Batch searches return a single page and do not take a cursor')
+        return value
+
+
+class BookingCreateParams(BaseModel):
+    """Validates the body of a booking request"""
+    
+    customer_id: str = Field(..., min_length=1, description="Customer making the booking")
+    dropoff: datetime = Field(..., description="Dropoff time (ISO format)")
+    pickup: datetime = Field(..., description="Pickup time (ISO format)")
+    bag_count: int = Field(..., gt=0, description="Number of bags")
+    
+    @field_validator('pickup')
+    @classmethod
+    def validate_pickup_after_dropoff(cls, value: datetime, info) -> datetime:
+        if 'dropoff' in info.data and value <= info.data['dropoff']:
+            raise ValueError('Pickup time must be after dropoff time')
+        if 'dropoff' in info.data and value - info.data['dropoff'] > MAX_BOOKING:
+            raise ValueError(f'Bookings can last at most {MAX_BOOKING_DAYS} days')
+        return value
+
+
+class AvailabilityParams(BaseModel):
+    """Validates the query params of a stashpoint's availability calendar"""
+    
+    start: Optional[datetime] = Field(None, alias='from', description="Start of the calendar, default today")
+    end: Optional[datetime] = Field(None, alias='to', description="End of the calendar, default 7 days on")
+    step: int = Field(60, description="Minutes per slot")
+    
+    @field_validator('step')
+    @classmethod
+    def validate_step(cls, value: int) -> int:
+        # slots tile each day exactly and line up with the occupancy buckets
+        if value <= 0 or value % 15 or 1440 % value:
+            raise ValueError('Step must be a multiple of 15 minutes that divides a day')
+        return value
+    
+    @field_validator('end')
+    @classmethod
+    def validate_end_after_start(cls, value: Optional[datetime], info) -> Optional[datetime]:
+        if value is not None and info.data.get('start') is not None and value <= info.data['start']:
+            raise ValueError('to must be after from')
+        return value
+    
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class ClusterParams(BaseModel):
+    """Validates the query params of the map clustering endpoint"""
+    
+    bbox: List[float] = Field(..., description="west,south,east,north in degrees")
+    zoom: int = Field(..., ge=0, le=22, description="Map zoom level")
+    
+    @field_validator('bbox')
+    @classmethod
+    def validate_bbox(cls, value: List[float]) -> List[float]:
+        if len(value) != 4:
+            raise ValueError('bbox must be west,south,east,north')
+        west, south, east, north = value
+        if not (-180 <= west < east <= 180):
+            raise ValueError('bbox longitudes must be between -180 and 180, west before east')
+        if not (-90 <= south < north <= 90):
+            raise ValueError('bbox latitudes must be between -90 and 90, south before north')
+        return value
+
+
+class OpeningHoursInterval(BaseModel):
+    """Validates one opening of a weekly schedule"""
+    
+    weekday: int = Field(..., ge=0, le=6, description="Day the opening starts, 0 is Monday")
+    opens: time = Field(..., description="First open minute")
+    closes: time = Field(..., description="Last open minute, before opens to close after midnight")
+    
+    @field_validator('opens', 'closes')
+    @classmethod
+    def whole_minutes(cls, value: time) -> time:
+        # the compiled schedule has a bit per minute
+        return value.replace(second=0, microsecond=0, tzinfo=None)
+    
+    @field_validator('closes')
+    @classmethod
+    def validate_closes(cls, value: time, info) -> time:
+        if value == info.data.get('opens'):
+            raise ValueError('closes must differ from opens; use 00:00 to 23:59 for all day')
+        return value
+
+
+class OpeningHoursParams(BaseModel):
+    """Validates the body of a weekly opening hours update"""
+    
+    hours: List[OpeningHoursInterval] = Field(
+        ..., max_length=7 * 24, description="Openings of the week, empty for the daily open_from/open_until"
+    )
+    timezone: Optional[str] = Field(None, description="IANA timezone of the hours, default unchanged")
+    
+    @field_validator('timezone')
+    @classmethod
+    def validate_timezone(cls, value: Optional[str]) -> Optional[str]:
+        return check_timezone(value) if value is not None else value
+    
+    @field_validator('hours')
+    @classmethod
+    def validate_unique_openings(cls, value: List[OpeningHoursInterval]) -> List[OpeningHoursInterval]:
+        keys = [(hours.weekday, hours.opens) for hours in value]
+        if len(set(keys)) != len(keys):
+            raise ValueError('Two openings start on the same weekday and time')
+        return value
+
+
+class StashpointImportRow(BaseModel):
+    """Validates one row of a partner's stashpoint import file"""
+    
+    external_id: str = Field(..., min_length=1, max_length=255, description="Partner's id for the location")
+    name: str = Field(..., min_length=1, max_length=255)
+    description: Optional[str] = None
+    address: str = Field(..., min_length=1, max_length=255)
+    postal_code: str = Field(..., min_length=1, max_length=20)
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    capacity: int = Field(..., gt=0)
+    open_from: time
+    open_until: time
+    timezone: str = Field('UTC', description="IANA timezone of the opening hours")
+    
+    @field_validator('description', mode='before')
+    @classmethod
+    def blank_description_is_none(cls, value):
+        # CSV files can't tell an empty description from a missing one
+        return value or None
+    
+    @field_validator('timezone', mode='before')
+    @classmethod
+    def blank_timezone_is_utc(cls, value):
+        return value or 'UTC'
+    
+    @field_validator('timezone')
+    @classmethod
+    def validate_timezone(cls, value: str) -> str:
+        return check_timezone(value)
+    
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+
 class StashpointResponse(BaseModel):
     """Response model for stashpoints"""
     
@@ -62,6 +235,7 @@ class StashpointResponse(BaseModel):
     capacity: int
     open_from: str
     open_until: str
+    timezone: str
     distance_km: Optional[float] = Field(None, description="Distance in km")
     
     model_config = ConfigDict(
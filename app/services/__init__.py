@@ -0,0 +1 @@
+# Domain logic shared by the routes and CLI commands
@@ -0,0 +1,166 @@
+from datetime import timedelta
+from sqlalchemy import select
+from app import db
+from app.models import Booking, Stashpoint
+from app.models.booking import MAX_BOOKING
+from app.models.opening_hours import bits_to_mask, open_windows
+from app.services.bookings import StashpointNotFound
+from app.services.shared_cache import StashpointCache
+from app.signals import bookings_changed, stashpoints_changed
+
+
+DAY = timedelta(days=1)
+
+
+def availability_slots(bookings, capacity, windows, start, end, step):
+    """
+    Free bags in each `step`-wide slot of [start, end), in one pass over
+    the bookings.
+
+    `bookings` holds the (dropoff_time, pickup_time, bag_count) of a
+    stashpoint's non-cancelled bookings overlapping [start, end). A slot's
+    free bags are the capacity less the peak held at any moment in it,
+    with pickups freeing their bags before dropoffs at the same instant,
+    as in `peak_occupancy`. Slots overlapping none of the (opens_at,
+    closes_at) open `windows`, earliest first, are closed and have none.
+
+    Returns (slot_start, open, available) tuples.
+    """
+    events = []
+    for dropoff, pickup, bags in bookings:
+        events.append((dropoff, bags))
+        events.append((pickup, -bags))
+    events.sort()
+
+    window = 0
+
+    slots = []
+    held = position = 0
+    slot_start = start
+    while slot_start < end:
+        slot_end = slot_start + step
+        # bags held at the slot's first instant, then the peak until its end
+        while position < len(events) and events[position][0] <= slot_start:
+            held += events[position][1]
+            position += 1
+        peak = held
+        while position < len(events) and events[position][0] < slot_end:
+            held += events[position][1]
+            peak = max(peak, held)
+            position += 1
+
+        while window < len(windows) and windows[window][1] <= slot_start:
+            window += 1
+        is_open = window < len(windows) and windows[window][0] < slot_end
+        slots.append((slot_start, is_open, max(capacity - peak, 0) if is_open else 0))
+        slot_start = slot_end
+    return slots
+
+
+def days_availability(stashpoint, first_day, last_day, step):
+    """
+    Slot dicts for every day from `first_day` to `last_day` inclusive,
+    keyed by day, from a single query over the stashpoint's bookings.
+    """
+    start, end = first_day, last_day + DAY
+    query = select(Booking.dropoff_time, Booking.pickup_time, Booking.bag_count).where(
+        Booking.stashpoint_id == stashpoint.id,
+        Booking.is_cancelled == False,
+        Booking.dropoff_time < end,
+        Booking.pickup_time > start,
+        Booking.dropoff_time > start - MAX_BOOKING,
+    )
+    slots = availability_slots(
+        db.session.execute(query), stashpoint.capacity,
+        open_windows(bits_to_mask(stashpoint.open_minutes) or 0, stashpoint.timezone, start, end),
+        start, end, step
+    )
+
+    days = {}
+    for slot_start, is_open, available in slots:
+        day = slot_start.replace(hour=0, minute=0)
+        days.setdefault(day, []).append({
+            'start': slot_start.isoformat(),
+            'end': (slot_start + step).isoformat(),
+            'open': is_open,
+            'available': available,
+        })
+    return days
+
+
+def stashpoint_availability(stashpoint_id, start, end, step, cache=None):
+    """
+    A stashpoint's availability calendar from `start` to `end` (naive UTC),
+    in `step` slots on the grid of each day.
+
+    Whole days are computed, and kept in `cache` if one is given, then
+    trimmed to the slots overlapping [start, end). Days missing from the
+    cache, or stale against the stashpoint's cache_version, are computed
+    together in one pass and stored with the cache_version read before
+    them. Raises StashpointNotFound.
+    """
+    stashpoint = db.session.get(Stashpoint, stashpoint_id, populate_existing=True)
+    if stashpoint is None:
+        raise StashpointNotFound(stashpoint_id)
+
+    first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_count = (end - first_day - timedelta(microseconds=1)) // DAY + 1
+    days = [first_day + DAY * i for i in range(day_count)]
+
+    found = {}
+    if cache is not None:
+        for day in days:
+            key = (stashpoint_id, day, step)
+            cached = cache.entry(key)
+            if cached is None:
+                cache.count(False)
+            elif cache.is_current(key, cached, 1, stashpoint.cache_version):
+                found[day] = cached.value
+
+    missing = [day for day in days if day not in found]
+    if missing:
+        computed = days_availability(stashpoint, missing[0], missing[-1], step)
+        for day in missing:
+            found[day] = computed[day]
+            if cache is not None:
+                cache.set((stashpoint_id, day, step), computed[day], stashpoint.cache_version, [stashpoint_id])
+
+    # the slots overlapping [start, end), counted from the first day's midnight
+    first_slot = (start - first_day) // step
+    last_slot = -((first_day - end) // step)
+    slots = [slot for day in days for slot in found[day]][first_slot:last_slot]
+    return {
+        'stashpoint_id': stashpoint.id,
+        'capacity': stashpoint.capacity,
+        'open_from': stashpoint.open_from.strftime('%H:%M'),
+        'open_until': stashpoint.open_until.strftime('%H:%M'),
+        'timezone': stashpoint.timezone,
+        'step_minutes': step // timedelta(minutes=1),
+        'slots': slots,
+    }
+
+
+class AvailabilityCache(StashpointCache):
+    """
+    Days of availability calendars, checked against their stashpoint's
+    cache_version, which `stashpoint_availability` reads anyway.
+
+    A booking committed at a stashpoint, or a change to the stashpoint
+    itself, by any worker, makes its days stale; this worker's own commits
+    also drop them at once.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        super().__init__(
+            app.config['AVAILABILITY_CACHE_MAX_ENTRIES'], app.config['AVAILABILITY_CACHE_TTL_SECONDS']
+        )
+        app.extensions['availability_cache'] = self
+        bookings_changed.connect(self._on_changed, sender=app, weak=False)
+        stashpoints_changed.connect(self._on_changed, sender=app, weak=False)
+
+    def _on_changed(self, sender, stashpoint_ids, **extra):
+        self.invalidate_tags(stashpoint_ids)
@@ -0,0 +1,111 @@
+import re
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+from app.models.booking import DEFAULT_PARTITION, MAX_BOOKING
+from app.services.occupancy import rebuild_occupancy
+
+
+# Schema detached partitions are moved to, unless they're dropped
+ARCHIVE_SCHEMA = 'archive'
+
+PARTITION_NAME = re.compile(r'^bookings_(\d{4})_(\d{2})$')
+
+
+def month_start(moment):
+    """Midnight on the first of `moment`'s month"""
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month, months):
+    """The first of the month `months` after (or before, when negative) `month`"""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """The partition holding the bookings dropped off in `month`"""
+    return f'bookings_{month:%Y_%m}'
+
+
+def booking_partitions():
+    """The months with a partition of `bookings`, oldest first (the default partition left out)"""
+    names = db.session.execute(text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'bookings'::regclass"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_booking_partition(month):
+    """
+    Add the partition for `month`, moving the month's bookings out of the
+    default partition into it first so it can be attached.
+
+    The default partition is locked against writes until the commit, so a
+    booking for the month can't land in it between the move and the
+    attach, which would make the attach fail. Bookings going to other
+    partitions carry on; those going to the default one wait. Keeping
+    partitions far enough ahead makes that rare.
+    """
+    name, start, end = partition_name(month), month, add_months(month, 1)
+    bounds = {'start': start, 'end': end}
+    in_month = 'dropoff_time >= :start AND dropoff_time < :end'
+
+    db.session.execute(text(f'CREATE TABLE {name} (LIKE bookings INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    db.session.execute(text(f'LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE'))
+    db.session.execute(text(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}'), bounds)
+    db.session.execute(text(f'DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}'), bounds)
+    # bounds of DDL can't be bound parameters; both are dates we computed
+    db.session.execute(text(
+        f"ALTER TABLE bookings ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    db.session.commit()
+
+
+def archive_booking_partition(month, drop=False):
+    """Detach the partition for `month`, and move it to ARCHIVE_SCHEMA or drop it"""
+    name = partition_name(month)
+    db.session.execute(text(f'ALTER TABLE bookings DETACH PARTITION {name}'))
+    if drop:
+        db.session.execute(text(f'DROP TABLE {name}'))
+    else:
+        db.session.execute(text(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}'))
+        db.session.execute(text(f'ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}'))
+    db.session.commit()
+
+
+def maintain_booking_partitions(now=None, months_ahead=12, retain_months=24, drop=False):
+    """
+    Make sure `bookings` has a partition from the current month to
+    `months_ahead` months on, and archive (or drop) the partitions of the
+    months more than `retain_months` before the current one. The occupancy
+    buckets the archived bookings covered are rebuilt from the bookings
+    left, so check-occupancy stays clean.
+
+    Run daily, or at least monthly, with `months_ahead` beyond how far
+    ahead bookings are taken, so new bookings rarely land in the default
+    partition and creating a partition rarely has any to move. Returns the
+    months created and archived.
+    """
+    current = month_start(now or datetime.utcnow())
+    cutoff = add_months(current, -retain_months)
+    existing = booking_partitions()
+
+    created = [add_months(current, ahead) for ahead in range(months_ahead + 1)]
+    created = [month for month in created if month not in existing]
+    for month in created:
+        create_booking_partition(month)
+
+    archived = [month for month in existing if month < cutoff]
+    for month in archived:
+        archive_booking_partition(month, drop)
+    if archived:
+        # an archived booking ran until MAX_BOOKING after the cutoff at the latest
+        rebuild_occupancy(before=cutoff + MAX_BOOKING)
+
+    return {'created': created, 'archived': archived}
@@ -0,0 +1,100 @@
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import Booking, Customer, Stashpoint
+from app.models.opening_hours import bits_to_mask, is_open, local_time
+from app.services.capacity import capacity_subquery, naive_utc
+
+
+# SQLSTATE of a lock wait that ran past lock_timeout
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+class StashpointNotFound(LookupError):
+    """No stashpoint has the requested id"""
+
+
+class BookingUnavailable(Exception):
+    """The stashpoint is closed or hasn't enough room for the booking"""
+
+
+class StashpointBusy(Exception):
+    """The stashpoint's lock wasn't granted within BOOKING_LOCK_TIMEOUT_MS"""
+
+
+def lock_stashpoint(stashpoint_id, lock_timeout_ms=0):
+    """
+    Lock a stashpoint's row until the end of the transaction, returning its
+    capacity and compiled opening hours, or None if there is no such stashpoint.
+
+    FOR NO KEY UPDATE serializes reservations at the same stashpoint while
+    leaving the row's KEY SHARE locks, which the foreign key checks of
+    booking inserts take, free. Raises StashpointBusy after waiting
+    `lock_timeout_ms` (0 waits forever).
+    """
+    if lock_timeout_ms:
+        db.session.execute(text(f'SET LOCAL lock_timeout = {int(lock_timeout_ms)}'))
+    query = select(
+        Stashpoint.capacity, Stashpoint.open_minutes, Stashpoint.timezone
+    ).where(Stashpoint.id == stashpoint_id).with_for_update(key_share=True)
+    try:
+        return db.session.execute(query).one_or_none()
+    except OperationalError as e:
+        if getattr(e.orig, 'pgcode', None) == LOCK_NOT_AVAILABLE:
+            raise StashpointBusy(stashpoint_id) from e
+        raise
+
+
+def booked_bags(stashpoint_id, dropoff, pickup, source):
+    """Peak bags already booked at a stashpoint during [dropoff, pickup)"""
+    peak_occupancy = capacity_subquery(dropoff, pickup, source=source, stashpoint_ids=[stashpoint_id])
+    return db.session.scalar(select(peak_occupancy.c.peak_bags)) or 0
+
+
+def create_booking(stashpoint_id, params, config):
+    """
+    Book `params.bag_count` bags into a stashpoint, never past its capacity.
+
+    The stashpoint's row is locked while its booked bags are read and the
+    booking inserted, so concurrent bookings at the same stashpoint are
+    checked one after another against each other's committed bags. Capacity
+    is read from CAPACITY_SOURCE, like the search, and the opening hours are
+    checked the same way.
+
+    Returns the committed Booking. Raises ValueError for an unknown
+    customer, StashpointNotFound, BookingUnavailable or StashpointBusy.
+    """
+    dropoff, pickup = naive_utc(params.dropoff), naive_utc(params.pickup)
+
+    # checked before taking the lock, to keep the lock as short as possible
+    if db.session.get(Customer, params.customer_id) is None:
+        raise ValueError('Unknown customer')
+
+    try:
+        stashpoint = lock_stashpoint(stashpoint_id, config['BOOKING_LOCK_TIMEOUT_MS'])
+        if stashpoint is None:
+            raise StashpointNotFound(stashpoint_id)
+
+        capacity, open_minutes, timezone = stashpoint
+        mask = bits_to_mask(open_minutes) or 0
+        if not all(is_open(mask, local_time(moment, timezone)) for moment in (dropoff, pickup)):
+            raise BookingUnavailable('Stashpoint is closed at the dropoff or pickup time')
+
+        available = capacity - booked_bags(stashpoint_id, dropoff, pickup, config['CAPACITY_SOURCE'])
+        if available < params.bag_count:
+            raise BookingUnavailable(f'Only {max(available, 0)} bags of space left for that period')
+
+        booking = Booking(
+            stashpoint_id=stashpoint_id,
+            customer_id=params.customer_id,
+            bag_count=params.bag_count,
+            dropoff_time=dropoff,
+            pickup_time=pickup,
+        )
+        db.session.add(booking)
+        # releases the lock; the occupancy buckets are written in the same transaction
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return booking
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries also expire after `ttl_seconds`.
+
+    Entries can carry tags, and `invalidate_tags` drops every entry
+    carrying any of the given tags.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tagged = {}  # tag -> keys
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The cached value for `key`, or None"""
+        value = self.entry(key)
+        self.count(value is not None)
+        return value
+
+    def entry(self, key):
+        """The cached value for `key`, or None, without counting a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def count(self, hit):
+        """Count a lookup made through `entry` as a hit or a miss"""
+        with self._lock:
+            self.stats['hits' if hit else 'misses'] += 1
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tags = frozenset(tags)
+            self._entries[key] = (self._clock() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate_tags(self, tags):
+        """Drop every entry tagged with any of `tags`, returning how many went"""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tagged.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self.stats['invalidations'] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._tagged.clear()
+
+    def describe(self):
+        """Size, limits and hit statistics for the admin endpoints"""
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'stats': dict(self.stats),
+        }
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
@@ -0,0 +1,157 @@
+from datetime import timezone
+from sqlalchemy import func, select, union_all
+from sqlalchemy.sql.expression import ColumnElement
+from app.models import Booking, StashpointOccupancy
+from app.models.booking import MAX_BOOKING
+from app.models.occupancy import bucket_floor, bucket_floor_sql
+
+
+# Where the search reads booked capacity from (the CAPACITY_SOURCE setting)
+CAPACITY_SOURCES = ("occupancy", "bookings")
+
+
+def naive_utc(moment):
+    """Convert an aware datetime to the naive UTC form bookings are stored in"""
+    if isinstance(moment, ColumnElement) or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _for_stashpoints(query, table, stashpoint_ids, lateral):
+    """
+    Restrict `query` over `table` to `stashpoint_ids`: a list of ids, or
+    with `lateral` the id column of the enclosing query, which `query` is
+    then correlated to.
+    """
+    if lateral:
+        return query.where(table.c.stashpoint_id == stashpoint_ids).correlate_except(table)
+    if stashpoint_ids is not None:
+        return query.where(table.c.stashpoint_id.in_(stashpoint_ids))
+    return query
+
+
+def _peak_subquery(query, lateral):
+    return query.lateral('peak_occupancy') if lateral else query.subquery('peak_occupancy')
+
+
+def peak_occupancy(bookings, dropoff, pickup):
+    """
+    Peak number of bags held at any moment in [dropoff, pickup).
+
+    `bookings` is an iterable of (dropoff_time, pickup_time, bag_count) for a
+    single stashpoint. This is the reference for `peak_occupancy_subquery`,
+    following the same sweep in Python; the tests check the SQL against it.
+    """
+    events = []
+    for start, end, bags in bookings:
+        if start < pickup and end > dropoff:
+            events.append((start, bags))
+            if end < pickup:
+                events.append((end, -bags))
+
+    # pickups sort before dropoffs at the same instant (negative delta first)
+    events.sort()
+
+    peak = held = 0
+    for _, delta in events:
+        held += delta
+        peak = max(peak, held)
+    return peak
+
+
+def peak_occupancy_subquery(dropoff, pickup, stashpoint_ids=None, lateral=False):
+    """
+    Peak bags held per stashpoint during [dropoff, pickup), as one set-based query.
+
+    Each overlapping, non-cancelled booking becomes a +bag_count event at its
+    dropoff and a -bag_count event at its pickup (only if it picks up inside
+    the window). A running sum over the events gives the bags held at every
+    moment and its max is the peak. Bookings that started before the window
+    only add events, so the running sum at the window start already accounts
+    for them.
+
+    Returns a subquery with `stashpoint_id` and `peak_bags` columns.
+    """
+    dropoff, pickup = naive_utc(dropoff), naive_utc(pickup)
+    bookings = Booking.__table__
+
+    overlapping = [
+        Booking.dropoff_time < pickup,
+        Booking.pickup_time > dropoff,
+        # implied by the longest booking, and lets Postgres skip older partitions
+        Booking.dropoff_time > dropoff - MAX_BOOKING,
+        Booking.is_cancelled == False,
+    ]
+
+    arrivals = _for_stashpoints(select(
+        Booking.stashpoint_id,
+        Booking.dropoff_time.label('event_time'),
+        Booking.bag_count.label('delta')
+    ).where(*overlapping), bookings, stashpoint_ids, lateral)
+
+    departures = _for_stashpoints(select(
+        Booking.stashpoint_id,
+        Booking.pickup_time.label('event_time'),
+        (-Booking.bag_count).label('delta')
+    ).where(*overlapping, Booking.pickup_time < pickup), bookings, stashpoint_ids, lateral)
+
+    events = union_all(arrivals, departures).subquery('booking_events')
+
+    # order by delta too so a pickup frees its bags before a dropoff at the same time
+    running = select(
+        events.c.stashpoint_id,
+        func.sum(events.c.delta).over(
+            partition_by=events.c.stashpoint_id,
+            order_by=(events.c.event_time, events.c.delta)
+        ).label('bags_held')
+    ).subquery('running_occupancy')
+
+    return _peak_subquery(select(
+        running.c.stashpoint_id,
+        func.max(running.c.bags_held).label('peak_bags')
+    ).group_by(running.c.stashpoint_id), lateral)
+
+
+def occupancy_range_max_subquery(dropoff, pickup, stashpoint_ids=None, lateral=False):
+    """
+    Peak bags per stashpoint during [dropoff, pickup), read from `stashpoint_occupancy`.
+
+    A range-max over the pre-aggregated buckets instead of re-aggregating
+    `bookings`. A booking occupies every bucket it touches, so this is never
+    lower than the exact peak; it can only be more conservative around
+    bucket boundaries.
+
+    Returns a subquery with `stashpoint_id` and `peak_bags` columns.
+    """
+    dropoff, pickup = naive_utc(dropoff), naive_utc(pickup)
+    if isinstance(dropoff, ColumnElement):
+        first_bucket = bucket_floor_sql(dropoff)
+    else:
+        first_bucket = bucket_floor(dropoff)
+
+    query = _for_stashpoints(select(
+        StashpointOccupancy.stashpoint_id,
+        func.max(StashpointOccupancy.booked_bags).label('peak_bags')
+    ).where(
+        StashpointOccupancy.bucket_start >= first_bucket,
+        StashpointOccupancy.bucket_start < pickup,
+    ), StashpointOccupancy.__table__, stashpoint_ids, lateral)
+    return _peak_subquery(query.group_by(StashpointOccupancy.stashpoint_id), lateral)
+
+
+def capacity_subquery(dropoff, pickup, source='occupancy', stashpoint_ids=None, lateral=False):
+    """
+    Peak bags per stashpoint during the window, from the configured source.
+
+    With `lateral`, `stashpoint_ids` is the id column of the enclosing
+    query and the subquery is LATERAL-joined to it, so the peak is only
+    aggregated for the stashpoints that query reaches, one index probe
+    each, rather than for every stashpoint in the database. `dropoff` and
+    `pickup` can then also be naive UTC timestamp columns of the enclosing
+    query, such as a VALUES list of searches.
+    """
+    if source == 'bookings':
+        return peak_occupancy_subquery(dropoff, pickup, stashpoint_ids, lateral)
+    if source == 'occupancy':
+        return occupancy_range_max_subquery(dropoff, pickup, stashpoint_ids, lateral)
+    raise ValueError(f"Unknown capacity source: {source}")
@@ -0,0 +1,229 @@
+import math
+import sys
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func, select
+from app import db
+from app.models import Stashpoint
+from app.models.opening_hours import bits_to_mask, local_time, minute_of_week
+from app.signals import stashpoints_changed
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km on a spherical Earth"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CatalogEntry:
+    """The static attributes of one stashpoint, with its API payload pre-rendered"""
+
+    __slots__ = ('id', 'latitude', 'longitude', 'capacity', 'open_minutes', 'timezone', 'payload')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.latitude = row.latitude
+        self.longitude = row.longitude
+        self.capacity = row.capacity
+        # compiled weekly schedule, as an int with a bit per minute
+        self.open_minutes = bits_to_mask(row.open_minutes) or 0
+        self.timezone = row.timezone
+        self.payload = {
+            'id': row.id,
+            'name': row.name,
+            'description': row.description,
+            'address': row.address,
+            'postal_code': row.postal_code,
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'capacity': row.capacity,
+            'open_from': row.open_from.strftime('%H:%M') if row.open_from else None,
+            'open_until': row.open_until.strftime('%H:%M') if row.open_until else None,
+            'timezone': row.timezone,
+        }
+
+    def to_dict(self):
+        """Same shape as Stashpoint.to_dict()"""
+        return dict(self.payload)
+
+    def is_open_at(self, moment):
+        """Whether the stashpoint is open at `moment` (aware, or naive UTC)"""
+        return self.is_open_at_minute(minute_of_week(local_time(moment, self.timezone)))
+
+    def is_open_at_minute(self, minute):
+        """Whether the stashpoint is open at a minute of the week in its timezone"""
+        return bool(self.open_minutes >> minute & 1)
+
+
+class CatalogSnapshot:
+    """An immutable, grid-indexed copy of the stashpoint catalog"""
+
+    def __init__(self, entries, version, cell_degrees):
+        self.version = version
+        self.cell_degrees = cell_degrees
+        self.loaded_at = datetime.utcnow()
+        self.entries = entries
+
+        grid = {}
+        for entry in entries:
+            grid.setdefault(self._cell(entry.latitude, entry.longitude), []).append(entry)
+        self.grid = {cell: tuple(cell_entries) for cell, cell_entries in grid.items()}
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def _candidate_cells(self, lat, lng, radius_km):
+        """Grid cells that can hold points within `radius_km` of (lat, lng)"""
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + lat_span)))
+        lng_span = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 0 else 360
+
+        min_row, min_col = self._cell(lat - lat_span, lng - lng_span)
+        max_row, max_col = self._cell(lat + lat_span, lng + lng_span)
+
+        # a wide box over a sparse grid is cheaper to answer from the occupied cells
+        if lng_span >= 180 or (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.grid):
+            return [
+                cell for cell in self.grid
+                if min_row <= cell[0] <= max_row and (lng_span >= 180 or min_col <= cell[1] <= max_col)
+            ]
+        return [
+            (row, col)
+            for row in range(min_row, max_row + 1)
+            for col in range(min_col, max_col + 1)
+            if (row, col) in self.grid
+        ]
+
+    def nearby(self, lat, lng, radius_km=None):
+        """
+        (entry, distance_km) pairs within `radius_km` (all when None),
+        nearest first with id breaking ties.
+        """
+        if radius_km is None:
+            entries = self.entries
+        else:
+            entries = [
+                entry
+                for cell in self._candidate_cells(lat, lng, radius_km)
+                for entry in self.grid[cell]
+            ]
+
+        matches = []
+        for entry in entries:
+            distance = haversine_km(lat, lng, entry.latitude, entry.longitude)
+            if radius_km is None or distance <= radius_km:
+                matches.append((entry, distance))
+        matches.sort(key=lambda match: (match[1], match[0].id))
+        return matches
+
+    def memory_bytes(self):
+        """Rough deep size of the entries and the grid index"""
+        total = sys.getsizeof(self.entries) + sys.getsizeof(self.grid)
+        for entry in self.entries:
+            total += sys.getsizeof(entry) + sys.getsizeof(entry.payload) + sys.getsizeof(entry.open_minutes)
+            total += sum(sys.getsizeof(value) for value in entry.payload.values())
+        for cell, cell_entries in self.grid.items():
+            total += sys.getsizeof(cell) + sys.getsizeof(cell_entries)
+        return total
+
+
+class StashpointCatalog:
+    """
+    Per-worker, versioned copy of the stashpoint catalog.
+
+    The version is the row count plus the latest `updated_at`. It is
+    re-checked at most every `refresh_seconds`, and commits made by this
+    worker invalidate the snapshot right away.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._invalidated = True
+        self._next_check = 0.0
+        self.stats = {'hits': 0, 'reloads': 0, 'version_checks': 0, 'invalidations': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_seconds = app.config['STASHPOINT_CATALOG_REFRESH_SECONDS']
+        self.cell_degrees = app.config['STASHPOINT_CATALOG_CELL_DEGREES']
+        app.extensions['stashpoint_catalog'] = self
+        stashpoints_changed.connect(self._on_stashpoints_changed, sender=app, weak=False)
+
+    def _on_stashpoints_changed(self, sender, **extra):
+        self.invalidate()
+
+    def invalidate(self):
+        self._invalidated = True
+        self.stats['invalidations'] += 1
+
+    def _current_version(self):
+        self.stats['version_checks'] += 1
+        count, last_updated = db.session.execute(
+            select(func.count(Stashpoint.id), func.max(Stashpoint.updated_at))
+        ).one()
+        return (count, last_updated.isoformat() if last_updated else None)
+
+    def _load(self, version):
+        rows = db.session.execute(select(
+            Stashpoint.id,
+            Stashpoint.name,
+            Stashpoint.description,
+            Stashpoint.address,
+            Stashpoint.postal_code,
+            Stashpoint.latitude,
+            Stashpoint.longitude,
+            Stashpoint.capacity,
+            Stashpoint.open_from,
+            Stashpoint.open_until,
+            Stashpoint.open_minutes,
+            Stashpoint.timezone,
+        ))
+        self.stats['reloads'] += 1
+        return CatalogSnapshot([CatalogEntry(row) for row in rows], version, self.cell_degrees)
+
+    def snapshot(self):
+        """The current snapshot, reloading it first if it is stale"""
+        now = time.monotonic()
+        if self._snapshot is not None and not self._invalidated and now < self._next_check:
+            self.stats['hits'] += 1
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is None or self._invalidated or time.monotonic() >= self._next_check:
+                self._invalidated = False
+                version = self._current_version()
+                if self._snapshot is None or self._snapshot.version != version:
+                    self._snapshot = self._load(version)
+                else:
+                    self.stats['hits'] += 1
+                self._next_check = time.monotonic() + self.refresh_seconds
+            else:
+                self.stats['hits'] += 1
+            return self._snapshot
+
+    def describe(self):
+        """Version, size and hit statistics for the admin endpoint"""
+        snapshot = self._snapshot
+        info = {'stats': dict(self.stats), 'loaded': snapshot is not None}
+        if snapshot is not None:
+            info.update({
+                'version': {'count': snapshot.version[0], 'last_updated': snapshot.version[1]},
+                'loaded_at': snapshot.loaded_at.isoformat(),
+                'entries': len(snapshot.entries),
+                'grid_cells': len(snapshot.grid),
+                'cell_degrees': snapshot.cell_degrees,
+                'memory_bytes': snapshot.memory_bytes(),
+            })
+        return info
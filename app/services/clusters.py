@@ -0,0 +1,190 @@
+import math
+from sqlalchemy import cast, func, select
+from geoalchemy2.types import Geography
+from app import db
+from app.models import Stashpoint
+from app.services.cache import TTLCache
+from app.signals import stashpoints_changed
+
+
+# Latitudes beyond this don't fit on a square Web Mercator map
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def tile_x(lng, zoom):
+    """Column of the zoom-level Web Mercator (XYZ) tile containing `lng`"""
+    return min(int((lng + 180) / 360 * 2 ** zoom), 2 ** zoom - 1)
+
+
+def tile_y(lat, zoom):
+    """Row of the zoom-level Web Mercator (XYZ) tile containing `lat`, from the north"""
+    lat = math.radians(max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT))
+    row = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * 2 ** zoom
+    return min(max(int(row), 0), 2 ** zoom - 1)
+
+
+def tile_lng(x, zoom):
+    """Longitude of a tile column's west edge"""
+    return x / 2 ** zoom * 360 - 180
+
+
+def tile_lat(y, zoom):
+    """Latitude of a tile row's north edge"""
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / 2 ** zoom))))
+
+
+def tiles_covering(west, south, east, north, zoom):
+    """(x, y) of every tile at `zoom` overlapping the bounding box"""
+    columns = range(tile_x(west, zoom), tile_x(east, zoom) + 1)
+    rows = range(tile_y(north, zoom), tile_y(south, zoom) + 1)
+    return [(x, y) for x in columns for y in rows]
+
+
+def tiles_envelope(tiles, zoom):
+    """(west, south, east, north) of the rectangle holding all of `tiles`"""
+    xs, ys = [x for x, _ in tiles], [y for _, y in tiles]
+    return (
+        tile_lng(min(xs), zoom), tile_lat(max(ys) + 1, zoom),
+        tile_lng(max(xs) + 1, zoom), tile_lat(min(ys), zoom),
+    )
+
+
+def envelope_filter(west, south, east, north):
+    """
+    `location && envelope` for a longitude/latitude rectangle, answered
+    from the spatial index, or None when the rectangle is too wide for one.
+
+    A geography envelope's edges are great circles, which run poleward of
+    the parallels between its corners, so the rectangle is widened by that
+    much to keep every point inside it.
+    """
+    half_width = math.radians(east - west) / 2
+    if half_width >= math.pi / 2:
+        return None
+
+    def poleward(lat):
+        lat = math.radians(lat)
+        return math.degrees(math.atan(math.tan(abs(lat)) / math.cos(half_width)) - abs(lat))
+
+    south = max(south - poleward(south), -90)
+    north = min(north + poleward(north), 90)
+    envelope = cast(func.ST_MakeEnvelope(west, south, east, north, 4326), Geography)
+    return Stashpoint.location.op('&&')(envelope)
+
+
+def cell_columns(zoom, cells_per_tile):
+    """
+    SQL for the global column and row of a stashpoint's cell, on a grid
+    of `cells_per_tile` by `cells_per_tile` cells per tile at `zoom`.
+    Integer-dividing them by `cells_per_tile` gives the tile.
+    """
+    scale = 2 ** zoom * cells_per_tile
+    lat = func.radians(func.least(func.greatest(Stashpoint.latitude, -MAX_MERCATOR_LAT), MAX_MERCATOR_LAT))
+    mercator_y = (1 - func.ln(func.tan(lat) + 1 / func.cos(lat)) / func.pi()) / 2
+    return (
+        func.least(func.floor((Stashpoint.longitude + 180) / 360 * scale), scale - 1).label('cell_x'),
+        func.least(func.floor(mercator_y * scale), scale - 1).label('cell_y'),
+    )
+
+
+def query_tiles(tiles, zoom, clustered, cells_per_tile):
+    """
+    Clusters (or points) of each of `tiles`, keyed by tile, from one query
+    over the rectangle holding them all.
+    """
+    if not clustered:
+        cells_per_tile = 1
+    cell_x, cell_y = cell_columns(zoom, cells_per_tile)
+
+    if clustered:
+        query = select(
+            cell_x, cell_y,
+            func.count().label('count'),
+            func.avg(Stashpoint.latitude).label('lat'),
+            func.avg(Stashpoint.longitude).label('lng'),
+            func.sum(Stashpoint.capacity).label('capacity'),
+        ).group_by('cell_x', 'cell_y')
+    else:
+        query = select(
+            cell_x, cell_y, Stashpoint.id, Stashpoint.name,
+            Stashpoint.latitude.label('lat'), Stashpoint.longitude.label('lng'), Stashpoint.capacity,
+        ).order_by(Stashpoint.id)
+
+    in_envelope = envelope_filter(*tiles_envelope(tiles, zoom))
+    if in_envelope is not None:
+        query = query.where(in_envelope)
+
+    results = {tile: [] for tile in tiles}
+    for row in db.session.execute(query):
+        tile = (int(row.cell_x) // cells_per_tile, int(row.cell_y) // cells_per_tile)
+        # the envelope can reach into neighbouring tiles that weren't asked for
+        if tile not in results:
+            continue
+        if clustered:
+            item = {'count': row.count, 'capacity': int(row.capacity)}
+        else:
+            item = {'id': row.id, 'name': row.name, 'capacity': row.capacity}
+        item['lat'], item['lng'] = round(row.lat, 6), round(row.lng, 6)
+        results[tile].append(item)
+    return results
+
+
+def viewport_clusters(west, south, east, north, zoom, config, cache=None):
+    """
+    Stashpoints of every tile overlapping the bounding box at `zoom`: grid
+    clusters (count, centroid, total capacity) below CLUSTER_POINTS_ZOOM,
+    individual stashpoints from it.
+
+    Tiles are cached by (zoom, x, y) in `cache` if one is given, so panning
+    only queries the tiles that came into view. Whole tiles are returned,
+    which can reach past the bounding box. Raises ValueError when the box
+    covers more than CLUSTER_MAX_TILES tiles.
+    """
+    tiles = tiles_covering(west, south, east, north, zoom)
+    if len(tiles) > config['CLUSTER_MAX_TILES']:
+        raise ValueError('The bounding box covers too many tiles at this zoom')
+    clustered = zoom < config['CLUSTER_POINTS_ZOOM']
+
+    found = {}
+    if cache is not None:
+        for tile in tiles:
+            items = cache.get((zoom, *tile))
+            if items is not None:
+                found[tile] = items
+
+    missing = [tile for tile in tiles if tile not in found]
+    if missing:
+        computed = query_tiles(missing, zoom, clustered, config['CLUSTER_CELLS_PER_TILE'])
+        found.update(computed)
+        if cache is not None:
+            for tile, items in computed.items():
+                cache.set((zoom, *tile), items)
+
+    items = [item for tile in tiles for item in found[tile]]
+    return {
+        'zoom': zoom,
+        'tiles': len(tiles),
+        'clusters': items if clustered else [],
+        'points': [] if clustered else items,
+    }
+
+
+class ClusterCache(TTLCache):
+    """
+    Clusters and points of map tiles, keyed by (zoom, x, y).
+
+    A stashpoint change can move a stashpoint between any two tiles, so it
+    clears the cache; bookings don't change what a tile shows.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        super().__init__(app.config['CLUSTER_CACHE_MAX_ENTRIES'], app.config['CLUSTER_CACHE_TTL_SECONDS'])
+        app.extensions['cluster_cache'] = self
+        stashpoints_changed.connect(self._on_stashpoints_changed, sender=app, weak=False)
+
+    def _on_stashpoints_changed(self, sender, **extra):
+        self.clear()
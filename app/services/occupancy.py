@@ -0,0 +1,89 @@
+from datetime import timedelta
+from sqlalchemy import and_, func, select, text, true
+from app import db
+from app.models import Booking, StashpointOccupancy
+from app.models.occupancy import BUCKET, bucket_floor_sql
+
+
+def expected_occupancy(stashpoint_id=None, before=None):
+    """
+    Per-bucket booked bags computed from the raw `bookings` table, for the
+    buckets starting before `before` if given
+    """
+    buckets = func.generate_series(
+        bucket_floor_sql(Booking.dropoff_time),
+        bucket_floor_sql(Booking.pickup_time - timedelta(microseconds=1)),
+        BUCKET,
+    ).table_valued('bucket_start').render_derived(name='buckets').lateral()
+
+    query = select(
+        Booking.stashpoint_id,
+        buckets.c.bucket_start,
+        func.sum(Booking.bag_count).label('booked_bags')
+    ).join(buckets, true()).where(Booking.is_cancelled == False)
+    if stashpoint_id is not None:
+        query = query.where(Booking.stashpoint_id == stashpoint_id)
+    if before is not None:
+        query = query.where(Booking.dropoff_time < before, buckets.c.bucket_start < before)
+
+    return query.group_by(Booking.stashpoint_id, buckets.c.bucket_start)
+
+
+def rebuild_occupancy(stashpoint_id=None, before=None):
+    """
+    Recompute `stashpoint_occupancy` from the bookings, for backfills and
+    repairs, or only its buckets starting before `before`.
+
+    Holds a SHARE lock on `bookings` so no booking can change mid-rebuild.
+    Returns the number of buckets written.
+    """
+    db.session.execute(text('LOCK TABLE bookings IN SHARE MODE'))
+
+    delete = StashpointOccupancy.__table__.delete()
+    if stashpoint_id is not None:
+        delete = delete.where(StashpointOccupancy.stashpoint_id == stashpoint_id)
+    if before is not None:
+        delete = delete.where(StashpointOccupancy.bucket_start < before)
+    db.session.execute(delete)
+
+    insert = StashpointOccupancy.__table__.insert().from_select(
+        ['stashpoint_id', 'bucket_start', 'booked_bags'],
+        expected_occupancy(stashpoint_id, before)
+    )
+    written = db.session.execute(insert).rowcount
+    db.session.commit()
+    return written
+
+
+def check_occupancy(stashpoint_id=None):
+    """
+    Compare `stashpoint_occupancy` with the raw bookings.
+
+    Returns a list of drifted buckets as dicts with the stored and expected
+    bag counts. Empty buckets left behind by cancellations match "no bookings".
+    """
+    expected = expected_occupancy(stashpoint_id).subquery('expected')
+    stored = select(StashpointOccupancy)
+    if stashpoint_id is not None:
+        stored = stored.where(StashpointOccupancy.stashpoint_id == stashpoint_id)
+    stored = stored.subquery('stored')
+
+    stored_bags = func.coalesce(stored.c.booked_bags, 0)
+    expected_bags = func.coalesce(expected.c.booked_bags, 0)
+    query = select(
+        func.coalesce(stored.c.stashpoint_id, expected.c.stashpoint_id).label('stashpoint_id'),
+        func.coalesce(stored.c.bucket_start, expected.c.bucket_start).label('bucket_start'),
+        stored_bags.label('stored'),
+        expected_bags.label('expected')
+    ).select_from(
+        stored.join(
+            expected,
+            and_(
+                stored.c.stashpoint_id == expected.c.stashpoint_id,
+                stored.c.bucket_start == expected.c.bucket_start
+            ),
+            full=True
+        )
+    ).where(stored_bags != expected_bags).order_by('stashpoint_id', 'bucket_start')
+
+    return [dict(row._mapping) for row in db.session.execute(query)]
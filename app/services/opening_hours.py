@@ -0,0 +1,125 @@
+from sqlalchemy import delete, exists, insert, select, update
+from app import db
+from app.models import Stashpoint, StashpointOpeningHours, StashpointOpenWindow
+from app.models.opening_hours import (
+    bits_to_mask, compile_open_minutes, daily_open_minutes_sql, open_windows, window_horizon
+)
+from app.services.bookings import StashpointNotFound
+
+
+def opening_hours(stashpoint):
+    """A stashpoint's weekly schedule and compiled form for the API"""
+    return {
+        'stashpoint_id': stashpoint.id,
+        'open_from': stashpoint.open_from.strftime('%H:%M'),
+        'open_until': stashpoint.open_until.strftime('%H:%M'),
+        'timezone': stashpoint.timezone,
+        'weekly': bool(stashpoint.opening_hours),
+        'hours': [hours.to_dict() for hours in stashpoint.opening_hours],
+        'open_minutes_per_week': (stashpoint.open_minutes or '').count('1'),
+    }
+
+
+def get_opening_hours(stashpoint_id):
+    """`opening_hours` of a stashpoint. Raises StashpointNotFound."""
+    stashpoint = db.session.get(Stashpoint, stashpoint_id)
+    if stashpoint is None:
+        raise StashpointNotFound(stashpoint_id)
+    return opening_hours(stashpoint)
+
+
+def set_opening_hours(stashpoint_id, openings, timezone=None):
+    """
+    Replace a stashpoint's weekly schedule with (weekday, opens, closes)
+    `openings`, or drop it for the daily open_from/open_until hours when
+    there are none, and move it to `timezone` if one is given.
+    `open_minutes` and the open windows are recomputed as the change is
+    flushed. Raises StashpointNotFound.
+    """
+    stashpoint = db.session.get(Stashpoint, stashpoint_id)
+    if stashpoint is None:
+        raise StashpointNotFound(stashpoint_id)
+
+    if timezone is not None:
+        stashpoint.timezone = timezone
+
+    stashpoint.opening_hours = []
+    # the replaced rows go first, so an unchanged opening can be re-added
+    db.session.flush()
+    stashpoint.opening_hours = [
+        StashpointOpeningHours(weekday=weekday, opens=opens, closes=closes)
+        for weekday, opens, closes in openings
+    ]
+    db.session.commit()
+    return opening_hours(stashpoint)
+
+
+def recompile_open_minutes(stashpoint_id=None):
+    """
+    Recompute `open_minutes` of every stashpoint, or just `stashpoint_id`,
+    after raw SQL writes that bypassed the session: stashpoints without a
+    weekly schedule in one UPDATE from open_from/open_until, the others
+    through the model. Commits, returning the number recompiled.
+    """
+    has_schedule = exists().where(StashpointOpeningHours.stashpoint_id == Stashpoint.id)
+    daily = update(Stashpoint).where(~has_schedule).values(
+        open_minutes=daily_open_minutes_sql(Stashpoint.open_from, Stashpoint.open_until)
+    )
+    weekly = select(Stashpoint).where(has_schedule)
+    if stashpoint_id is not None:
+        daily = daily.where(Stashpoint.id == stashpoint_id)
+        weekly = weekly.where(Stashpoint.id == stashpoint_id)
+
+    count = db.session.execute(daily.execution_options(synchronize_session=False)).rowcount
+    for stashpoint in db.session.scalars(weekly):
+        compile_open_minutes(stashpoint)
+        count += 1
+    db.session.commit()
+    refresh_open_windows([stashpoint_id] if stashpoint_id is not None else None)
+    return count
+
+
+def refresh_open_windows(stashpoint_ids=None, now=None, batch_size=1000):
+    """
+    Recompute the stored open windows of every stashpoint, or of
+    `stashpoint_ids`, for the horizon from the day before `now`, and move
+    their open_windows_from/open_windows_until to it.
+
+    Run daily so the horizon keeps rolling forward, and after raw SQL
+    writes to the hours or timezones. Stashpoints with the same schedule
+    and timezone share one computation. Commits a batch at a time,
+    returning the number of windows written.
+    """
+    start, end = window_horizon(now)
+    query = select(Stashpoint.id, Stashpoint.open_minutes, Stashpoint.timezone).order_by(Stashpoint.id)
+    if stashpoint_ids is not None:
+        query = query.where(Stashpoint.id.in_(list(stashpoint_ids)))
+    rows = db.session.execute(query).all()
+
+    computed = {}
+    written = 0
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        ids = [row.id for row in batch]
+        values = []
+        for row in batch:
+            key = (row.open_minutes, row.timezone)
+            if key not in computed:
+                computed[key] = open_windows(bits_to_mask(row.open_minutes) or 0, row.timezone, start, end)
+            values.extend(
+                {'stashpoint_id': row.id, 'opens_at': opens_at, 'closes_at': closes_at}
+                for opens_at, closes_at in computed[key]
+            )
+
+        db.session.execute(delete(StashpointOpenWindow).where(StashpointOpenWindow.stashpoint_id.in_(ids)))
+        if values:
+            db.session.execute(insert(StashpointOpenWindow), values)
+        # updated_at is kept, as nothing a client sees has changed
+        db.session.execute(
+            update(Stashpoint).where(Stashpoint.id.in_(ids)).values(
+                open_windows_from=start, open_windows_until=end, updated_at=Stashpoint.updated_at
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        written += len(values)
+    return written
@@ -0,0 +1,34 @@
+import base64
+import binascii
+import json
+
+
+def encode_cursor(kind, *key):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps([kind, *key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode()
+
+
+def _reject_constant(name):
+    raise ValueError(f'Unexpected {name}')
+
+
+def decode_cursor(cursor, kind, *types):
+    """
+    Decode a cursor made by `encode_cursor`, checking it is a `kind` key
+    whose values are instances of `types`, in order
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()), parse_constant=_reject_constant)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(payload, list) or len(payload) != len(types) + 1 or payload[0] != kind:
+        raise ValueError('Invalid cursor')
+    key = payload[1:]
+    for value, expected in zip(key, types):
+        # JSON booleans would pass as numbers
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError('Invalid cursor')
+    return key
@@ -0,0 +1,420 @@
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import (
+    DateTime, Float, Integer, String, and_, bindparam, case, cast, column, func, or_, select, true, tuple_,
+    values
+)
+from geoalchemy2.types import Geography
+from app import db
+from app.models import Stashpoint, StashpointOpenWindow
+from app.models.opening_hours import is_open_sql, local_time, minute_of_week, minute_of_week_sql
+from app.services.capacity import capacity_subquery, naive_utc
+
+
+# How much the radius grows each time a nearest-k search comes up short
+RADIUS_GROWTH = 4
+
+# Catalog candidates sent to the database per capacity check
+CATALOG_CAPACITY_BATCH = 500
+
+# Fields of a stashpoint in API responses, in StashpointResponse order
+RESPONSE_FIELDS = (
+    'id', 'name', 'description', 'address', 'postal_code',
+    'latitude', 'longitude', 'capacity', 'open_from', 'open_until', 'timezone',
+)
+
+
+def response_columns(stashpoint=Stashpoint):
+    """
+    The RESPONSE_FIELDS of `stashpoint` as plain columns, with the opening
+    hours formatted as HH:MM by Postgres, so results can be serialized
+    without loading ORM instances.
+    """
+    return [
+        *(getattr(stashpoint, field) for field in RESPONSE_FIELDS[:-3]),
+        func.to_char(stashpoint.open_from, 'HH24:MI').label('open_from'),
+        func.to_char(stashpoint.open_until, 'HH24:MI').label('open_until'),
+        stashpoint.timezone,
+    ]
+
+
+class StashpointRow:
+    """A stashpoint read through `response_columns`, standing in for the model"""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    @property
+    def id(self):
+        return self.values[0]
+
+    def to_dict(self):
+        return dict(zip(RESPONSE_FIELDS, self.values))
+
+
+def search_rows(rows):
+    """(StashpointRow, distance_km, sort_distance) from flat search result rows"""
+    width = len(RESPONSE_FIELDS)
+    return [(StashpointRow(row[:width]), *row[width:]) for row in rows]
+
+
+def search_point_sql(lat, lng):
+    """A geography point from SQL latitude/longitude expressions"""
+    return cast(func.ST_SetSRID(func.ST_MakePoint(lng, lat), 4326), Geography)
+
+
+def distance_km_sql(point):
+    """Kilometres from a stashpoint to the geography `point`, as ST_Distance measures them"""
+    # ST_Distance returns meters for geography types, convert to km and handle nulls just in case
+    return func.coalesce(cast(func.ST_Distance(Stashpoint.location, point) / 1000.0, Float), 0.0)
+
+
+def open_at(moment):
+    """
+    Whether a stashpoint is open at `moment`, a naive UTC value or column.
+
+    Within the stashpoint's precomputed open windows that's one index probe
+    for the last window opening by then, and a comparison. Outside them the
+    moment is converted to the stashpoint's timezone and its compiled
+    schedule tested.
+    """
+    last_closes_at = select(StashpointOpenWindow.closes_at).where(
+        StashpointOpenWindow.stashpoint_id == Stashpoint.id,
+        StashpointOpenWindow.opens_at <= moment
+    ).order_by(StashpointOpenWindow.opens_at.desc()).limit(1).correlate_except(
+        StashpointOpenWindow
+    ).scalar_subquery()
+    local = func.timezone(Stashpoint.timezone, func.timezone('UTC', moment))
+    return case(
+        (
+            and_(Stashpoint.open_windows_from <= moment, Stashpoint.open_windows_until > moment),
+            last_closes_at > moment
+        ),
+        else_=is_open_sql(Stashpoint.open_minutes, minute_of_week_sql(local))
+    )
+
+
+def availability_filters(peak_occupancy, bag_count, dropoff, pickup):
+    """
+    Conditions for a stashpoint outer-joined to `peak_occupancy` to have
+    room for `bag_count` bags and be open at both `dropoff` and `pickup`
+    (naive UTC).
+    """
+    return [
+        # enough space left?
+        Stashpoint.capacity - func.coalesce(peak_occupancy.c.peak_bags, 0) >= bag_count,
+        # must be open for both dropoff and pickup
+        open_at(dropoff),
+        open_at(pickup),
+    ]
+
+
+@lru_cache(maxsize=None)
+def search_statement(capacity_source, radius=False, limit=False, after=False):
+    """
+    The availability search as a select of `response_columns` plus
+    distance_km and sort_distance, nearest first, with the search's values
+    left as bound parameters (see `search_parameters`).
+
+    Built once per combination of capacity source and optional clauses
+    and reused, so a search only binds its values: the statement isn't
+    rebuilt, SQLAlchemy finds it compiled in its cache, and the SQL text is
+    the same for every search, which lets drivers that prepare statements
+    (asyncpg) reuse them.
+
+    The radius is filtered with ST_DWithin and rows are ordered by the `<->`
+    KNN operator, so both can be answered from the spatial index on
+    `location`. With `after`, rows continue after the (sort_distance, id)
+    of the last row already returned, for keyset pagination.
+    """
+    point = search_point_sql(bindparam('lat', type_=Float), bindparam('lng', type_=Float))
+    dropoff = bindparam('dropoff', type_=DateTime)
+    pickup = bindparam('pickup', type_=DateTime)
+
+    distance_km = distance_km_sql(point)
+    sort_distance = Stashpoint.location.op('<->', return_type=Float)(point)
+
+    query = select(
+        *response_columns(), distance_km.label('distance_km'), sort_distance.label('sort_distance')
+    )
+
+    # filter by radius if provided
+    if radius:
+        query = query.where(func.ST_DWithin(Stashpoint.location, point, bindparam('radius_m', type_=Float)))
+
+    # check capacity - peak bags held at any moment during the time period,
+    # aggregated only for the stashpoints that pass the radius and hours
+    peak_occupancy = capacity_subquery(
+        dropoff, pickup, source=capacity_source, stashpoint_ids=Stashpoint.id, lateral=True
+    )
+    query = query.outerjoin(peak_occupancy, true()).where(*availability_filters(
+        peak_occupancy, bindparam('bag_count', type_=Integer), dropoff, pickup
+    ))
+
+    # continue after the previous page
+    if after:
+        query = query.where(tuple_(sort_distance, Stashpoint.id) > tuple_(
+            bindparam('after_distance', type_=Float), bindparam('after_id', type_=String)
+        ))
+
+    # nearest first, id breaks ties so the order is stable
+    query = query.order_by(sort_distance, Stashpoint.id)
+    if limit:
+        query = query.limit(bindparam('limit', type_=Integer))
+
+    return query
+
+
+def search_parameters(search_params, radius_km=None, limit=None, after=None):
+    """The values to bind to `search_statement` for a search"""
+    params = {
+        'lat': search_params.lat,
+        'lng': search_params.lng,
+        'dropoff': naive_utc(search_params.dropoff),
+        'pickup': naive_utc(search_params.pickup),
+        'bag_count': search_params.bag_count,
+    }
+    if radius_km:
+        params['radius_m'] = radius_km * 1000
+    if limit:
+        params['limit'] = limit
+    if after:
+        params['after_distance'], params['after_id'] = after
+    return params
+
+
+def build_search_query(search_params, config, radius_km=None, limit=None, after=None):
+    """
+    The availability search for `search_params` as the cached
+    `search_statement` and the parameters to execute it with.
+    """
+    statement = search_statement(config['CAPACITY_SOURCE'], bool(radius_km), bool(limit), bool(after))
+    return statement, search_parameters(search_params, radius_km, limit, after)
+
+
+def search_queries(search_params, config, limit=None, after=None):
+    """
+    The availability search as the (statement, parameters) to run in turn
+    until one returns `limit` rows (or the last one has run).
+
+    When the client asked for the nearest `limit` and gave no `radius_km`,
+    this starts with a small radius and widens it until enough available
+    stashpoints are found, so a dense city never has to rank the whole
+    catalog. Otherwise it's a single query.
+    """
+    if search_params.radius_km or not search_params.limit:
+        yield build_search_query(
+            search_params, config, radius_km=search_params.radius_km, limit=limit, after=after
+        )
+        return
+
+    radius_km = config['SEARCH_INITIAL_RADIUS_KM']
+    if after:
+        # later pages start beyond the previous one
+        radius_km = max(radius_km, after[0] / 1000.0 * RADIUS_GROWTH)
+
+    while True:
+        if radius_km >= config['SEARCH_MAX_RADIUS_KM']:
+            # last pass without a radius so far-away matches are still found
+            radius_km = None
+
+        yield build_search_query(
+            search_params, config, radius_km=radius_km, limit=limit, after=after
+        )
+        if radius_km is None:
+            return
+
+        radius_km *= RADIUS_GROWTH
+
+
+def search_stashpoints(search_params, config, limit=None, after=None):
+    """
+    Run the availability search, returning up to `limit` rows of
+    (StashpointRow, distance_km, sort_distance) after the `after` key.
+    """
+    if config['STASHPOINT_CATALOG_ENABLED']:
+        return search_catalog(search_params, config, limit=limit, after=after)
+
+    for query, params in search_queries(search_params, config, limit=limit, after=after):
+        results = db.session.execute(query, params).all()
+        if limit and len(results) >= limit:
+            break
+    return search_rows(results)
+
+
+def build_batch_search_query(searches, config, default_limit):
+    """
+    Answer every search in `searches` with one statement, as a select of
+    search_index, `response_columns` and distance_km, ordered by search and
+    then nearest first.
+
+    The searches are sent once, as a VALUES list in a CTE, and each one is
+    LATERAL-joined to the same radius, capacity and opening-hours logic as
+    `build_search_query`, keeping its `limit` (or `default_limit`) nearest
+    rows. Capacity is aggregated per search for the stashpoints it reaches.
+    """
+    rows = [
+        (
+            index,
+            search.lat,
+            search.lng,
+            naive_utc(search.dropoff),
+            naive_utc(search.pickup),
+            search.bag_count,
+            search.radius_km * 1000 if search.radius_km else None,
+            search.limit or default_limit,
+        )
+        for index, search in enumerate(searches)
+    ]
+    batch = select(values(
+        column('search_index', Integer),
+        column('lat', Float),
+        column('lng', Float),
+        column('dropoff', DateTime),
+        column('pickup', DateTime),
+        column('bag_count', Integer),
+        column('radius_m', Float),
+        column('max_rows', Integer),
+        name='search_values'
+    ).data(rows)).cte('searches')
+
+    point = search_point_sql(batch.c.lat, batch.c.lng)
+    # a VALUES column holding only NULLs is typed text
+    radius_m = cast(batch.c.radius_m, Float)
+    distance_km = func.coalesce(cast(func.ST_Distance(Stashpoint.location, point) / 1000.0, Float), 0.0)
+    sort_distance = Stashpoint.location.op('<->', return_type=Float)(point)
+
+    # peak bags per search and candidate stashpoint, each search reading its own slice
+    peak_occupancy = capacity_subquery(
+        batch.c.dropoff,
+        batch.c.pickup,
+        source=config['CAPACITY_SOURCE'],
+        stashpoint_ids=Stashpoint.id,
+        lateral=True
+    )
+    matches = select(
+        *response_columns(),
+        distance_km.label('distance_km'),
+        sort_distance.label('sort_distance')
+    ).outerjoin(peak_occupancy, true()).where(
+        or_(radius_m.is_(None), func.ST_DWithin(Stashpoint.location, point, radius_m)),
+        *availability_filters(peak_occupancy, batch.c.bag_count, batch.c.dropoff, batch.c.pickup)
+    ).order_by(sort_distance, Stashpoint.id).limit(batch.c.max_rows).lateral('matches')
+
+    return select(
+        batch.c.search_index,
+        *(matches.c[field] for field in RESPONSE_FIELDS),
+        matches.c.distance_km
+    ).select_from(batch).join(matches, true()).order_by(
+        batch.c.search_index, matches.c.sort_distance, matches.c.id
+    )
+
+
+def batch_search_stashpoints(searches, config, default_limit):
+    """
+    Run `searches` in one round trip, returning a list of
+    (StashpointRow, distance_km) rows for each, in the same order.
+    """
+    query = build_batch_search_query(searches, config, default_limit)
+    return group_batch_results(db.session.execute(query), len(searches))
+
+
+def group_batch_results(rows, search_count):
+    """Split (search index, *response fields, distance_km) rows into a list of rows per search"""
+    results = [[] for _ in range(search_count)]
+    for search_index, *values, distance in rows:
+        results[search_index].append((StashpointRow(values), distance))
+    return results
+
+
+def available_capacity(search_params, config, stashpoint_ids):
+    """Peak bags booked during the search window for each of `stashpoint_ids`"""
+    peak_occupancy = capacity_subquery(
+        search_params.dropoff,
+        search_params.pickup,
+        source=config['CAPACITY_SOURCE'],
+        stashpoint_ids=stashpoint_ids
+    )
+    rows = db.session.execute(select(peak_occupancy.c.stashpoint_id, peak_occupancy.c.peak_bags))
+    return {stashpoint_id: peak_bags for stashpoint_id, peak_bags in rows}
+
+
+def search_catalog(search_params, config, limit=None, after=None):
+    """
+    `search_stashpoints` against the in-process catalog: radius, opening
+    hours and distance ranking run in Python, and the database is only
+    asked for the peak occupancy of the nearest candidates, a batch at a
+    time until `limit` available rows are found.
+
+    Returns (CatalogEntry, distance_km, sort_distance) rows, where
+    sort_distance is in meters like the `<->` operator's.
+    """
+    snapshot = current_app.extensions['stashpoint_catalog'].snapshot()
+    matches = snapshot.nearby(search_params.lat, search_params.lng, search_params.radius_km)
+
+    # dropoff and pickup minutes of the week, converted once per timezone
+    local_minutes = {}
+
+    candidates = []
+    for entry, distance_km in matches:
+        sort_key = (distance_km * 1000.0, entry.id)
+        if after and sort_key <= after:
+            continue
+        minutes = local_minutes.get(entry.timezone)
+        if minutes is None:
+            minutes = local_minutes[entry.timezone] = [
+                minute_of_week(local_time(moment, entry.timezone))
+                for moment in (search_params.dropoff, search_params.pickup)
+            ]
+        # must be open for both dropoff and pickup
+        if all(entry.is_open_at_minute(minute) for minute in minutes):
+            candidates.append((entry, distance_km, sort_key[0]))
+
+    batch_size = max(limit or 0, CATALOG_CAPACITY_BATCH)
+    results = []
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        peak_bags = available_capacity(search_params, config, [entry.id for entry, _, _ in batch])
+        for row in batch:
+            entry = row[0]
+            # enough space left?
+            if entry.capacity - (peak_bags.get(entry.id) or 0) >= search_params.bag_count:
+                results.append(row)
+                if limit and len(results) >= limit:
+                    return results
+    return results
+
+
+def build_list_query(limit=None, after_id=None):
+    """
+    The `response_columns` of the full catalog in id order, `limit` rows at
+    most starting after `after_id`
+    """
+    query = select(*response_columns()).order_by(Stashpoint.id).limit(limit)
+    if after_id is not None:
+        query = query.where(Stashpoint.id > after_id)
+    return query
+
+
+def list_stashpoints(limit, after_id=None):
+    """Run `build_list_query`, returning StashpointRows"""
+    return [StashpointRow(row) for row in db.session.execute(build_list_query(limit, after_id))]
+
+
+def iter_stashpoints(batch_size):
+    """
+    Every stashpoint in id order, read in keyset pages of `batch_size` so
+    memory stays flat however big the catalog is. Each page is its own
+    short transaction, so a slow reader never leaves one open between
+    pages (and idle_in_transaction_session_timeout can't cut it off).
+    """
+    after_id = None
+    while True:
+        page = list_stashpoints(batch_size, after_id)
+        db.session.commit()
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_id = page[-1].id
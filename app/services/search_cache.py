@@ -0,0 +1,104 @@
+import hashlib
+import json
+from sqlalchemy import select
+from app.models import Stashpoint
+from app.services.search import distance_km_sql, search_point_sql
+from app.services.shared_cache import StashpointCache
+from app.signals import bookings_changed, stashpoints_changed
+
+
+def quantize_search(search_params, decimals):
+    """
+    The search with its coordinates rounded to `decimals` places, so
+    searches a few metres apart share one cache entry (3 decimals is a cell
+    of roughly 110m by 70m in London). The cached page is searched from the
+    rounded point.
+    """
+    return search_params.model_copy(update={
+        'lat': round(search_params.lat, decimals),
+        'lng': round(search_params.lng, decimals),
+    })
+
+
+def search_cache_key(search_params):
+    """Cache key for an already quantized search, including its page"""
+    return (
+        search_params.lat,
+        search_params.lng,
+        search_params.radius_km,
+        search_params.dropoff.isoformat(),
+        search_params.pickup.isoformat(),
+        search_params.bag_count,
+        search_params.limit,
+        search_params.cursor,
+    )
+
+
+def page_etag(items, next_cursor):
+    """Strong validator for a page of results"""
+    body = json.dumps([items, next_cursor], sort_keys=True, default=str)
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+def listing_query(stashpoint_ids, search_params):
+    """
+    The id, cache_version and distance_km from the search's own point of
+    each of a cached page's stashpoints, the distance as `search_statement`
+    works it out
+    """
+    point = search_point_sql(search_params.lat, search_params.lng)
+    return select(Stashpoint.id, Stashpoint.cache_version, distance_km_sql(point)).where(
+        Stashpoint.id.in_(stashpoint_ids)
+    )
+
+
+def page_from(page, listing):
+    """
+    A cached (items, next_cursor, etag) page with each distance_km from the
+    search's own point, given the page's `listing_query` rows. The ETag is
+    recomputed when that changes any of them.
+    """
+    items, next_cursor, etag = page
+    distances = {stashpoint_id: round(distance, 2) for stashpoint_id, _, distance in listing}
+    moved = [{**item, 'distance_km': distances.get(item['id'], item['distance_km'])} for item in items]
+    if moved == items:
+        return page
+    return moved, next_cursor, page_etag(moved, next_cursor)
+
+
+class SearchCache(StashpointCache):
+    """
+    Search pages, checked against the cache_version of the stashpoints
+    they list on every hit.
+
+    A page is searched from the rounded point of `quantize_search`, so all
+    the searches sharing it get the same order, radius cut-off and cursors;
+    only the distances shown are each search's own.
+
+    A booking committed at one of those stashpoints, by any worker, makes
+    the pages stale, so a sold-out stashpoint is never served from the
+    cache. This worker's own commits also drop the pages at once, and a
+    stashpoint change drops everything, since it can move a stashpoint
+    into any result; other workers' new stashpoints show up by the TTL.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        super().__init__(app.config['SEARCH_CACHE_MAX_ENTRIES'], app.config['SEARCH_CACHE_TTL_SECONDS'])
+        app.extensions['search_cache'] = self
+        bookings_changed.connect(self._on_bookings_changed, sender=app, weak=False)
+        stashpoints_changed.connect(self._on_stashpoints_changed, sender=app, weak=False)
+
+    def is_listing_current(self, key, cached, listing):
+        """`is_current`, given the page's `listing_query` rows"""
+        newest = max((version for _, version, _ in listing), default=0)
+        return self.is_current(key, cached, len(listing), newest)
+
+    def _on_bookings_changed(self, sender, stashpoint_ids, **extra):
+        self.invalidate_tags(stashpoint_ids)
+
+    def _on_stashpoints_changed(self, sender, **extra):
+        self.clear()
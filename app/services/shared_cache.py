@@ -0,0 +1,102 @@
+from collections import namedtuple
+from sqlalchemy import func, select, update
+from app import db
+from app.models import Stashpoint
+from app.models.stashpoint import CACHE_VERSIONS
+from app.services.cache import TTLCache
+from app.signals import bookings_changed, stashpoints_changed
+
+
+# A cached value, with the generation read before it was computed and the
+# stashpoints it was computed from
+CachedValue = namedtuple('CachedValue', ['value', 'generation', 'stashpoint_ids'])
+
+
+def generation_query():
+    """
+    The highest cache_version of any stashpoint, the generation to store
+    with a value about to be computed, read in the same session before
+    computing it. A bump only starts once its change has committed, and
+    CACHE_VERSIONS only grows, so any change the value misses is bumped
+    above every version visible here. Unlike the sequence itself, which a
+    replica reads up to 32 values ahead, this holds on a replica too.
+    """
+    return select(func.coalesce(func.max(Stashpoint.cache_version), 0))
+
+
+def bump_cache_versions(stashpoint_ids):
+    """
+    Give the stashpoints a new cache_version from CACHE_VERSIONS, leaving
+    updated_at alone. Called after the commit that changed them, so any
+    value computed from a snapshot without that change read an older
+    generation than the new version.
+    """
+    stashpoints = Stashpoint.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(stashpoints)
+            .where(stashpoints.c.id.in_(sorted(stashpoint_ids)))
+            .values(cache_version=CACHE_VERSIONS.next_value(), updated_at=stashpoints.c.updated_at)
+        )
+
+
+class CacheVersions:
+    """
+    Bumps the cache_version of the stashpoints each commit changed, or
+    booked, through the change signals. Workers only hear their own
+    signals; the versions are how they hear about each other's commits.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config['SEARCH_CACHE_ENABLED'] or app.config['AVAILABILITY_CACHE_ENABLED']:
+            bookings_changed.connect(self._on_changed, sender=app, weak=False)
+            stashpoints_changed.connect(self._on_changed, sender=app, weak=False)
+        app.extensions['cache_versions'] = self
+
+    def _on_changed(self, sender, stashpoint_ids, **extra):
+        bump_cache_versions(stashpoint_ids)
+
+
+class StashpointCache(TTLCache):
+    """
+    A TTLCache of values computed from stashpoints, shared by every worker
+    in effect: a value is only served while none of its stashpoints has a
+    cache_version newer than the generation read before computing it, and
+    none has been deleted. Checking takes one primary key lookup per hit,
+    on the replica the request reads from (or the primary), so a value is
+    at most as stale as REPLICA_MAX_LAG_SECONDS lets that replica be. The
+    TTL is left to catch raw SQL writes.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, **kwargs):
+        super().__init__(max_entries, ttl_seconds, **kwargs)
+        self.stats['stale'] = 0
+
+    def is_current(self, key, cached, found, newest):
+        """
+        Whether `cached`, looked up with `entry`, still holds, given how
+        many of its stashpoints were `found` and their `newest`
+        cache_version. Counts the lookup as a hit, or drops the entry and
+        counts a miss.
+        """
+        current = found == len(cached.stashpoint_ids) and newest <= cached.generation
+        if not current:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is cached:
+                    self._remove(key)
+                self.stats['stale'] += 1
+        self.count(current)
+        return current
+
+    def generation(self):
+        """The generation to store with a value about to be computed in this session"""
+        return db.session.execute(generation_query()).scalar()
+
+    def set(self, key, value, generation, stashpoint_ids):
+        stashpoint_ids = tuple(stashpoint_ids)
+        super().set(key, CachedValue(value, generation, stashpoint_ids), tags=stashpoint_ids)
@@ -0,0 +1,284 @@
+import csv
+import io
+import itertools
+import json
+import time
+from flask import current_app, has_app_context
+from pydantic import ValidationError
+from sqlalchemy import column, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models.opening_hours import daily_open_minutes_sql
+from app.schemas.stashpoints import StashpointImportRow
+from app.services.opening_hours import refresh_open_windows
+from app.signals import stashpoints_changed
+
+
+IMPORT_FORMATS = ('csv', 'json')
+
+# Per-row errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+_COLUMNS = list(StashpointImportRow.model_fields)
+# every imported column except the key, compared to skip no-op updates
+_UPDATED = [column for column in _COLUMNS if column != 'external_id']
+
+_CREATE_STAGING = text("""
+    CREATE TEMP TABLE IF NOT EXISTS stashpoint_import (
+        external_id varchar(255) PRIMARY KEY,
+        name varchar(255),
+        description text,
+        address varchar(255),
+        postal_code varchar(20),
+        latitude double precision,
+        longitude double precision,
+        capacity integer,
+        open_from time,
+        open_until time,
+        timezone varchar(64)
+    ) ON COMMIT DELETE ROWS
+""")
+
+# the daily hours compiled in SQL, as the merge bypasses the session events
+_OPEN_MINUTES = daily_open_minutes_sql(column('open_from'), column('open_until')).compile(
+    dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}
+)
+
+_MERGE = text(f"""
+    INSERT INTO stashpoints (id, created_at, updated_at, location, open_minutes, {', '.join(_COLUMNS)})
+    SELECT replace(gen_random_uuid()::text, '-', ''), now() at time zone 'utc', now() at time zone 'utc',
+           ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography, {_OPEN_MINUTES}, {', '.join(_COLUMNS)}
+    FROM stashpoint_import
+    ON CONFLICT (external_id) DO UPDATE SET
+        updated_at = EXCLUDED.updated_at,
+        location = EXCLUDED.location,
+        -- a weekly schedule overrides the daily hours
+        open_minutes = CASE
+            WHEN EXISTS (SELECT 1 FROM stashpoint_opening_hours WHERE stashpoint_id = stashpoints.id)
+            THEN stashpoints.open_minutes ELSE EXCLUDED.open_minutes
+        END,
+        {', '.join(f'{column} = EXCLUDED.{column}' for column in _UPDATED)}
+    WHERE ({', '.join(f'stashpoints.{column}' for column in _UPDATED)})
+        IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in _UPDATED)})
+    RETURNING id, xmax = 0 AS inserted
+""")
+
+
+def detect_format(filename=None, mimetype=None):
+    """'csv' or 'json' from a file name or MIME type, or None"""
+    if mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if mimetype in ('application/json', 'application/x-ndjson'):
+        return 'json'
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('json', 'ndjson', 'jsonl'):
+        return 'json'
+    return None
+
+
+def iter_csv_rows(stream):
+    """Dicts for the rows of a CSV text stream with a header line"""
+    yield from csv.DictReader(stream)
+
+
+def iter_json_rows(stream, read_size=65536):
+    """
+    Objects from a JSON array or from newline-delimited JSON, decoded as
+    the text stream is read rather than loaded whole.
+
+    A record only cut off by the end of what has been read is retried with
+    more of the stream. Any other decode error raises a ValueError naming
+    the record and its character offset in the stream straight away.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    # characters of the stream before the buffer, and records decoded
+    consumed = records = 0
+    eof = False
+    while True:
+        # skip the array's brackets and commas, and the whitespace between objects
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            consumed += len(buffer)
+            buffer, position = stream.read(read_size), 0
+            eof = not buffer
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if eof or not is_truncated(e, buffer):
+                raise ValueError(
+                    f'Invalid JSON in record {records + 1} at character {consumed + position}: '
+                    f'{e.msg} (character {consumed + e.pos})'
+                ) from None
+            more = stream.read(read_size)
+            eof = not more
+            consumed += position
+            buffer, position = buffer[position:] + more, 0
+            continue
+        records += 1
+        yield value
+        position = end
+
+
+def is_truncated(error, buffer):
+    """
+    Whether a decode error may just be the buffer ending mid-record: an
+    unterminated string (raw newlines aren't allowed in one, so it ran to
+    the end), or a failure within the last few characters, where a literal
+    or number may be cut short.
+    """
+    return error.msg.startswith('Unterminated string') or len(buffer) - error.pos < 16
+
+
+def validate_rows(rows, start):
+    """
+    Split raw rows, numbered from `start`, into (row number, validated row)
+    pairs and error dicts. Later rows win over earlier ones with the same
+    external id.
+    """
+    valid, errors = {}, []
+    for number, raw in zip(itertools.count(start), rows):
+        external_id = raw.get('external_id') if isinstance(raw, dict) else None
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError('Row must be an object')
+            row = StashpointImportRow(**raw)
+        except (ValueError, ValidationError) as e:
+            errors.append({'row': number, 'external_id': external_id, 'errors': row_errors(e)})
+            continue
+        valid[row.external_id] = (number, row)
+    return list(valid.values()), errors
+
+
+def row_errors(e):
+    """Field and message of each problem with a row"""
+    if isinstance(e, ValidationError):
+        return [{'field': '.'.join(str(x) for x in error['loc']), 'message': error['msg']} for error in e.errors()]
+    return [{'field': None, 'message': str(e)}]
+
+
+def copy_to_staging(rows):
+    """COPY validated rows into this transaction's staging table"""
+    db.session.execute(_CREATE_STAGING)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for _, row in rows:
+        writer.writerow(getattr(row, column) for column in _COLUMNS)
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY stashpoint_import ({', '.join(_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+class ImportReport:
+    """Running totals of an import"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_errors(self, errors):
+        self.failed += len(errors)
+        self.errors.extend(errors[:MAX_REPORTED_ERRORS - len(self.errors)])
+
+    def to_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.rows / seconds, 1) if seconds else None,
+            'errors': self.errors,
+        }
+
+
+def import_stashpoints(rows, chunk_size=5000, on_chunk=None):
+    """
+    Upsert stashpoints from an iterable of raw row dicts, keyed by
+    external_id, a chunk at a time.
+
+    Each chunk is validated, COPYed into a staging table and merged into
+    `stashpoints` in one statement, with `location` computed in SQL, then
+    committed. Invalid rows, and the rows the database rejects, are
+    reported and skipped without stopping the load. `on_chunk` is called with the
+    report after every chunk. Returns the ImportReport.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return report
+
+        valid, errors = validate_rows(chunk, start=report.rows + 1)
+        report.rows += len(chunk)
+        report.add_errors(errors)
+        if valid:
+            merge_chunk(valid, report)
+        if on_chunk is not None:
+            on_chunk(report)
+
+
+def merge_chunk(valid, report):
+    """
+    Stage and merge one chunk of (row number, row) pairs, adding to
+    `report`. When the database rejects the chunk each half is merged on
+    its own, down to single rows, so only the rows it rejects are reported.
+    """
+    try:
+        copy_to_staging(valid)
+        merged = db.session.execute(_MERGE).all()
+        db.session.commit()
+    except (SQLAlchemyError, db.engine.dialect.dbapi.Error) as e:
+        # the COPY goes straight to psycopg2, so its errors aren't wrapped
+        db.session.rollback()
+        if len(valid) > 1:
+            middle = len(valid) // 2
+            merge_chunk(valid[:middle], report)
+            merge_chunk(valid[middle:], report)
+            return
+        (number, row), = valid
+        message = str(getattr(e, 'orig', e)).strip()
+        report.add_errors([
+            {'row': number, 'external_id': row.external_id, 'errors': [{'field': None, 'message': message}]}
+        ])
+        return
+
+    # the merge compiled the hours, but the UTC windows are computed in Python
+    if merged:
+        refresh_open_windows([row.id for row in merged])
+
+    inserted = sum(1 for row in merged if row.inserted)
+    report.inserted += inserted
+    report.updated += len(merged) - inserted
+    report.unchanged += len(valid) - len(merged)
+
+    # raw SQL doesn't go through the session events, so tell the caches directly
+    if merged and has_app_context():
+        stashpoints_changed.send(current_app._get_current_object(), stashpoint_ids={row.id for row in merged})
+
+
+def read_rows(stream, import_format):
+    """Raw row dicts from a text stream in the given format"""
+    if import_format == 'csv':
+        return iter_csv_rows(stream)
+    if import_format == 'json':
+        return iter_json_rows(stream)
+    raise ValueError(f'format must be one of {", ".join(IMPORT_FORMATS)}')
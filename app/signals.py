@@ -0,0 +1,52 @@
+from flask import current_app, has_app_context
+from flask.signals import Namespace
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.models import Booking, Stashpoint
+
+
+_signals = Namespace()
+
+# Sent by the app after a commit that created, changed or deleted stashpoints,
+# with `stashpoint_ids`. Raw SQL and bulk query updates don't send it.
+stashpoints_changed = _signals.signal("stashpoints-changed")
+
+# Sent by the app after a commit that created, changed or deleted bookings,
+# with the `stashpoint_ids` they were (or are now) booked at. Same caveats.
+bookings_changed = _signals.signal("bookings-changed")
+
+_SIGNALS = {
+    "changed_stashpoints": stashpoints_changed,
+    "changed_bookings": bookings_changed,
+}
+
+
+def _booked_stashpoints(booking):
+    """The stashpoint a booking is at, plus the one it was moved from"""
+    history = inspect(booking).attrs.stashpoint_id.history
+    return {booking.stashpoint_id, *history.deleted} - {None}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    stashpoints = session.info.setdefault("changed_stashpoints", set())
+    bookings = session.info.setdefault("changed_bookings", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Stashpoint):
+            stashpoints.add(obj.id)
+        elif isinstance(obj, Booking):
+            bookings.update(_booked_stashpoints(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _send_changes(session):
+    for key, signal in _SIGNALS.items():
+        changed = session.info.pop(key, None)
+        if changed and has_app_context():
+            signal.send(current_app._get_current_object(), stashpoint_ids=changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    for key in _SIGNALS:
+        session.info.pop(key, None)
@@ -14,6 +14,8 @@ def app():
         yield app
         db.session.remove()
         db.drop_all()
+        # close this app's pooled connections rather than leaving them to the garbage collector
+        db.engine.dispose()
 
 
 @pytest.fixture
@@ -22,6 +24,15 @@ def client(app):
     return app.test_client()
 
 
+@pytest.fixture
+def other_worker(app):
+    """A client of a second app on the same database, standing in for another worker"""
+    other = create_app(TestConfig)
+    yield other.test_client()
+    with other.app_context():
+        db.engine.dispose()
+
+
 @pytest.fixture
 def sample_stashpoints(app):
     """Create sample stashpoints for testing"""
@@ -0,0 +1,104 @@
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("starlette")
+
+from starlette.testclient import TestClient  # noqa: E402
+from app.asgi import create_asgi_app  # noqa: E402
+from app.services.pagination import encode_cursor  # noqa: E402
+from config import TestConfig  # noqa: E402
+
+
+SEARCH = {
+    'lat': 51.5074,
+    'lng': -0.1278,
+    'dropoff': '2024-01-15T10:00:00Z',
+    'pickup': '2024-01-15T12:00:00Z',
+    'bag_count': 2,
+}
+
+
+@pytest.fixture
+def async_client(app):
+    """A client for the ASGI app, on the same database as `app`"""
+    with TestClient(create_asgi_app(TestConfig)) as client:
+        yield client
+
+
+class TestAsgiApp:
+
+    @pytest.mark.parametrize('params', [
+        SEARCH,
+        {**SEARCH, 'radius_km': 5.0},
+        {**SEARCH, 'limit': 1},
+        {**SEARCH, 'dropoff': '2024-01-15T08:30:00Z'},
+        {},
+        {'limit': 2},
+    ])
+    def test_matches_flask(self, client, async_client, sample_stashpoints, params):
+        """Test that searches and listings return what the Flask app returns"""
+        expected = client.get('/api/v1/stashpoints/', query_string=params)
+        response = async_client.get('/api/v1/stashpoints/', params=params)
+
+        assert response.status_code == expected.status_code
+        assert response.json() == expected.get_json()
+        assert response.headers.get('X-Next-Cursor') == expected.headers.get('X-Next-Cursor')
+        assert response.headers.get('ETag') == expected.headers.get('ETag')
+
+    def test_pagination(self, async_client, sample_stashpoints):
+        """Test that cursors resume after the last row"""
+        response = async_client.get('/api/v1/stashpoints/', params={**SEARCH, 'limit': 2})
+        assert [sp['id'] for sp in response.json()] == ['sp1', 'sp2']
+        assert response.headers['Link'].startswith('<http://testserver/api/v1/stashpoints/?')
+
+        next_page = async_client.get(
+            '/api/v1/stashpoints/', params={**SEARCH, 'limit': 2, 'cursor': response.headers['X-Next-Cursor']}
+        )
+        assert [sp['id'] for sp in next_page.json()] == ['sp3']
+
+    def test_not_modified(self, async_client, sample_stashpoints):
+        """Test that a matching If-None-Match gets a 304"""
+        etag = async_client.get('/api/v1/stashpoints/', params=SEARCH).headers['ETag']
+        response = async_client.get('/api/v1/stashpoints/', params=SEARCH, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+    def test_validation_errors(self, client, async_client):
+        """Test that invalid searches get the same 400 as on Flask"""
+        params = {**SEARCH, 'lat': 100}
+        response = async_client.get('/api/v1/stashpoints/', params=params)
+        assert response.status_code == 400
+        assert response.json() == client.get('/api/v1/stashpoints/', query_string=params).get_json()
+
+    def test_malformed_cursor(self, client, async_client):
+        """Test that a cursor with the wrong value types gets the same 400 as on Flask"""
+        params = {**SEARCH, 'cursor': encode_cursor('search', None, 'x')}
+        response = async_client.get('/api/v1/stashpoints/', params=params)
+        assert response.status_code == 400
+        assert response.json() == client.get('/api/v1/stashpoints/', query_string=params).get_json()
+
+    def test_ndjson_stream(self, async_client, sample_stashpoints):
+        """Test that the catalog streams as NDJSON"""
+        response = async_client.get('/api/v1/stashpoints/', params={'format': 'ndjson'})
+        assert response.headers['Content-Type'].startswith('application/x-ndjson')
+        assert [line for line in response.text.splitlines()][0].startswith('{')
+        assert len(response.text.splitlines()) == 3
+
+    def test_batch_search(self, client, async_client, sample_stashpoints):
+        """Test that batch searches return what the Flask app returns"""
+        body = {'searches': [SEARCH, {**SEARCH, 'lat': 52.0, 'lng': -1.0, 'limit': 1}]}
+        response = async_client.post('/api/v1/stashpoints/search:batch', json=body)
+        assert response.status_code == 200
+        assert response.json() == client.post('/api/v1/stashpoints/search:batch', json=body).get_json()
+
+    def test_other_routes_fall_through_to_flask(self, async_client):
+        """Test that routes without an async handler are served by Flask"""
+        response = async_client.get('/healthcheck')
+        assert response.status_code == 200
+        assert response.json() == {'status': 'healthy'}
+
+    def test_pool_stats(self, async_client, sample_stashpoints):
+        """Test that the admin endpoint reports the asyncpg pool too"""
+        async_client.get('/api/v1/stashpoints/', params=SEARCH)
+        pools = async_client.get('/api/v1/admin/db-pool').json()['pools']
+        assert pools['async']['pool'] == 'InstrumentedAsyncQueuePool'
+        assert pools['async']['checkouts']['checkouts'] > 0
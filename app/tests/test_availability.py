@@ -0,0 +1,144 @@
+from datetime import datetime, time, timedelta
+from app import db
+from app.models import Booking
+from app.models.opening_hours import compile_schedule, daily_schedule, open_windows
+from app.services.availability import availability_slots
+
+
+HOUR = timedelta(hours=1)
+ALWAYS_OPEN = [(datetime(2024, 1, 1), datetime(2024, 2, 1))]
+
+
+def add_booking(customer_id, stashpoint_id, dropoff, pickup, bag_count, is_cancelled=False):
+    db.session.add(Booking(
+        stashpoint_id=stashpoint_id, customer_id=customer_id, bag_count=bag_count,
+        dropoff_time=dropoff, pickup_time=pickup, is_cancelled=is_cancelled,
+    ))
+    db.session.commit()
+
+
+def get_availability(client, stashpoint_id, **params):
+    return client.get(f'/api/v1/stashpoints/{stashpoint_id}/availability', query_string=params)
+
+
+class TestAvailabilitySlots:
+
+    def test_peak_within_each_slot(self):
+        """Test that each slot loses the peak bags held at any moment in it"""
+        day = datetime(2024, 1, 15)
+        bookings = [
+            (day.replace(hour=9, minute=30), day.replace(hour=11), 3),
+            (day.replace(hour=10), day.replace(hour=10, minute=15), 4),
+            # picked up at 12:00 exactly, so the 12:00 slot is free again
+            (day.replace(hour=11), day.replace(hour=12), 2),
+        ]
+        slots = availability_slots(bookings, 10, ALWAYS_OPEN, day.replace(hour=9), day.replace(hour=13), HOUR)
+        assert [available for _, _, available in slots] == [7, 3, 8, 10]
+
+    def test_bookings_from_before_the_calendar(self):
+        """Test that bookings dropped off before the first slot still count"""
+        day = datetime(2024, 1, 15)
+        bookings = [(day - timedelta(days=2), day + timedelta(hours=10), 5)]
+        slots = availability_slots(bookings, 10, ALWAYS_OPEN, day.replace(hour=9), day.replace(hour=11), HOUR)
+        assert [available for _, _, available in slots] == [5, 10]
+
+    def test_closed_slots(self):
+        """Test that slots outside the opening hours are closed with nothing free"""
+        day = datetime(2024, 1, 15)
+        start, end = day.replace(hour=7), day.replace(hour=23, minute=30)
+        windows = open_windows(compile_schedule(daily_schedule(time(8), time(22))), 'UTC', start, end)
+        slots = availability_slots([], 10, windows, start, end, timedelta(minutes=30))
+        closed = [start.strftime('%H:%M') for start, is_open, available in slots if not is_open and available == 0]
+        assert closed == ['07:00', '07:30', '22:30', '23:00']
+
+
+class TestAvailabilityRoute:
+
+    def test_hourly_calendar(self, client, sample_stashpoints, sample_customer):
+        """Test that the calendar lists every slot of the range with its free bags"""
+        add_booking(sample_customer.id, 'sp1', datetime(2024, 1, 15, 10), datetime(2024, 1, 15, 12), 20)
+        add_booking(sample_customer.id, 'sp1', datetime(2024, 1, 15, 11), datetime(2024, 1, 15, 12), 30, True)
+
+        response = get_availability(client, 'sp1', **{'from': '2024-01-15T09:00:00Z', 'to': '2024-01-15T13:00:00Z'})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['capacity'] == 50
+        assert data['step_minutes'] == 60
+        assert [(slot['start'], slot['available']) for slot in data['slots']] == [
+            ('2024-01-15T09:00:00', 50),
+            ('2024-01-15T10:00:00', 30),
+            ('2024-01-15T11:00:00', 30),
+            ('2024-01-15T12:00:00', 50),
+        ]
+
+    def test_defaults_to_a_week_of_hours(self, client, sample_stashpoints):
+        """Test that without params the calendar covers 7 days from today in hourly slots"""
+        data = get_availability(client, 'sp3').get_json()
+        assert len(data['slots']) == 7 * 24
+        assert data['slots'][0]['start'].endswith('T00:00:00')
+        # open 09:00-17:00
+        assert sum(slot['open'] for slot in data['slots'][:24]) == 9
+
+    def test_slots_follow_the_day_grid(self, client, sample_stashpoints):
+        """Test that a range off the step grid is widened to the slots overlapping it"""
+        response = get_availability(
+            client, 'sp2', **{'from': '2024-01-15T09:20:00Z', 'to': '2024-01-16T00:10:00Z', 'step': 30}
+        )
+        slots = response.get_json()['slots']
+        assert slots[0]['start'] == '2024-01-15T09:00:00'
+        assert slots[-1]['start'] == '2024-01-16T00:00:00'
+        assert len(slots) == 31
+
+    def test_booking_invalidates_cached_days(self, app, client, sample_stashpoints, sample_customer):
+        """Test that a new booking drops the stashpoint's cached days"""
+        params = {'from': '2024-01-15', 'to': '2024-01-17', 'step': 1440}
+        before = get_availability(client, 'sp1', **params)
+        assert [slot['available'] for slot in before.get_json()['slots']] == [50, 50]
+        assert get_availability(client, 'sp1', **params).get_json() == before.get_json()
+        assert app.extensions['availability_cache'].stats['hits'] == 2
+
+        response = client.post('/api/v1/stashpoints/sp1/bookings', json={
+            'customer_id': sample_customer.id, 'bag_count': 5,
+            'dropoff': '2024-01-16T10:00:00Z', 'pickup': '2024-01-16T12:00:00Z',
+        })
+        assert response.status_code == 201
+
+        after = get_availability(client, 'sp1', **params)
+        assert [slot['available'] for slot in after.get_json()['slots']] == [50, 45]
+        assert after.headers['ETag'] != before.headers['ETag']
+
+    def test_other_workers_booking_makes_days_stale(self, app, client, other_worker, sample_stashpoints,
+                                                    sample_customer):
+        """Test that a booking committed by another worker is not served from this worker's cached days"""
+        params = {'from': '2024-01-15', 'to': '2024-01-16', 'step': 1440}
+        assert get_availability(client, 'sp1', **params).get_json()['slots'][0]['available'] == 50
+
+        response = other_worker.post('/api/v1/stashpoints/sp1/bookings', json={
+            'customer_id': sample_customer.id, 'bag_count': 5,
+            'dropoff': '2024-01-15T10:00:00Z', 'pickup': '2024-01-15T12:00:00Z',
+        })
+        assert response.status_code == 201
+
+        assert get_availability(client, 'sp1', **params).get_json()['slots'][0]['available'] == 45
+        assert app.extensions['availability_cache'].stats['stale'] == 1
+
+    def test_etag(self, client, sample_stashpoints):
+        """Test that an unchanged calendar answers If-None-Match with 304"""
+        first = get_availability(client, 'sp1', **{'from': '2024-01-15'})
+        second = client.get(
+            '/api/v1/stashpoints/sp1/availability?from=2024-01-15',
+            headers={'If-None-Match': first.headers['ETag']}
+        )
+        assert second.status_code == 304
+
+    def test_unknown_stashpoint(self, client, sample_stashpoints):
+        """Test that an unknown stashpoint gets a 404"""
+        assert get_availability(client, 'nope').status_code == 404
+
+    def test_invalid_params(self, client, sample_stashpoints):
+        """Test that bad ranges and steps get a 400"""
+        assert get_availability(client, 'sp1', step=50).status_code == 400
+        assert get_availability(client, 'sp1', step='hourly').status_code == 400
+        assert get_availability(client, 'sp1', **{'from': '2024-01-15', 'to': '2024-01-14'}).status_code == 400
+        assert get_availability(client, 'sp1', **{'from': '2024-01-01', 'to': '2024-03-01'}).status_code == 400
+        assert get_availability(client, 'sp1', **{'from': 'soon'}).status_code == 400
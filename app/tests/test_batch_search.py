@@ -0,0 +1,98 @@
+import pytest
+from datetime import datetime
+from app import db
+from app.models import Booking
+
+
+SEARCHES = [
+    {
+        'lat': 51.5074,
+        'lng': -0.1278,
+        'dropoff': '2024-01-15T10:00:00Z',
+        'pickup': '2024-01-15T12:00:00Z',
+        'bag_count': 2,
+    },
+    {
+        'lat': 52.0,
+        'lng': -1.0,
+        'dropoff': '2024-01-15T08:30:00Z',
+        'pickup': '2024-01-15T12:00:00Z',
+        'bag_count': 2,
+        'radius_km': 80.0,
+    },
+    {
+        'lat': 51.5144,
+        'lng': -0.1226,
+        'dropoff': '2024-01-15T10:00:00Z',
+        'pickup': '2024-01-15T12:00:00Z',
+        'bag_count': 10,
+        'limit': 2,
+    },
+]
+
+
+def batch_search(client, searches):
+    return client.post('/api/v1/stashpoints/search:batch', json={'searches': searches})
+
+
+class TestBatchSearch:
+
+    @pytest.mark.parametrize('capacity_source', ['occupancy', 'bookings'])
+    def test_results_match_single_searches(self, app, client, sample_stashpoints, sample_customer, capacity_source):
+        """Test that each batch result equals the same search made on its own"""
+        app.config['CAPACITY_SOURCE'] = capacity_source
+        # compare against exact, uncached single searches
+        app.config['SEARCH_CACHE_ENABLED'] = False
+        with client.application.app_context():
+            db.session.add(Booking(
+                stashpoint_id="sp2",
+                customer_id=sample_customer.id,
+                bag_count=95,
+                dropoff_time=datetime(2024, 1, 15, 9, 0),
+                pickup_time=datetime(2024, 1, 15, 11, 0),
+            ))
+            db.session.commit()
+
+        response = batch_search(client, SEARCHES)
+        assert response.status_code == 200
+        results = response.get_json()['results']
+        assert len(results) == len(SEARCHES)
+
+        for search, result in zip(SEARCHES, results):
+            single = client.get('/api/v1/stashpoints/', query_string=search).get_json()
+            assert result == single
+
+    def test_results_in_request_order(self, client, sample_stashpoints):
+        """Test that results line up with the searches they answer"""
+        results = batch_search(client, SEARCHES[::-1]).get_json()['results']
+        assert [sp['id'] for sp in results[0]] == ['sp2', 'sp1']
+        assert [sp['id'] for sp in results[-1]] == ['sp1', 'sp2', 'sp3']
+
+    def test_searches_without_radius(self, client, sample_stashpoints):
+        """Test a batch where no search has a radius"""
+        response = batch_search(client, [SEARCHES[0], SEARCHES[2]])
+        assert response.status_code == 200
+        assert [len(result) for result in response.get_json()['results']] == [3, 2]
+
+    def test_validation_errors_name_the_search(self, client):
+        """Test that an invalid search is reported with its position"""
+        response = batch_search(client, [SEARCHES[0], {**SEARCHES[1], 'lat': 100}])
+        assert response.status_code == 400
+        fields = [detail['field'] for detail in response.get_json()['details']]
+        assert fields == ['searches.1.lat']
+
+    def test_rejects_empty_and_oversized_batches(self, client):
+        """Test the limits on the number of searches"""
+        assert batch_search(client, []).status_code == 400
+        assert batch_search(client, SEARCHES * 17).status_code == 400
+
+    def test_rejects_cursor(self, client):
+        """Test that batch searches can't be paginated"""
+        response = batch_search(client, [{**SEARCHES[0], 'cursor': 'abc'}])
+        assert response.status_code == 400
+
+    def test_requires_json_object(self, client):
+        """Test that a non-object body is a 400"""
+        response = client.post('/api/v1/stashpoints/search:batch', data='nope')
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
@@ -0,0 +1,117 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import Booking
+from app.services.booking_partitions import (
+    ARCHIVE_SCHEMA, add_months, booking_partitions, create_booking_partition, maintain_booking_partitions
+)
+from app.services.capacity import peak_occupancy_subquery
+from app.services.occupancy import check_occupancy, rebuild_occupancy
+
+
+def partition_of(booking_id):
+    return db.session.execute(
+        text("SELECT tableoid::regclass::text FROM bookings WHERE id = :id"), {'id': booking_id}
+    ).scalar()
+
+
+@pytest.fixture
+def bookings(app, sample_stashpoints, sample_customer):
+    """A booking at sp1 on the 15th of each month from January 2024 to March 2026, in the default partition"""
+    month = datetime(2024, 1, 1)
+    while month <= datetime(2026, 3, 1):
+        db.session.add(Booking(
+            id=f"b{month:%Y%m}",
+            stashpoint_id="sp1",
+            customer_id=sample_customer.id,
+            dropoff_time=month.replace(day=15, hour=10),
+            pickup_time=month.replace(day=15, hour=12),
+        ))
+        month = add_months(month, 1)
+    db.session.commit()
+    yield
+    db.session.rollback()
+    db.session.execute(text(f"DROP SCHEMA IF EXISTS {ARCHIVE_SCHEMA} CASCADE"))
+    db.session.commit()
+
+
+class TestBookingPartitions:
+
+    def test_add_months(self):
+        """Test that months are added across year ends both ways"""
+        assert add_months(datetime(2024, 11, 1), 3) == datetime(2025, 2, 1)
+        assert add_months(datetime(2024, 1, 1), -1) == datetime(2023, 12, 1)
+
+    def test_new_partition_takes_its_bookings(self, bookings):
+        """Test that a new month's partition takes that month's bookings out of the default partition"""
+        assert partition_of("b202403") == "bookings_default"
+        create_booking_partition(datetime(2024, 3, 1))
+        assert booking_partitions() == [datetime(2024, 3, 1)]
+        assert partition_of("b202403") == "bookings_2024_03"
+        assert partition_of("b202404") == "bookings_default"
+        assert db.session.scalar(select(db.func.count()).select_from(Booking)) == 27
+
+    def test_default_partition_locked_until_attached(self, bookings, sample_customer, monkeypatch):
+        """Test that no booking can reach the default partition between the move and the attach"""
+        blocked = []
+        execute = db.session.execute
+
+        def insert_before_attach(statement, *args, **kwargs):
+            if 'ATTACH PARTITION' in str(statement):
+                with db.engine.connect() as other:
+                    other.exec_driver_sql("SET lock_timeout = '200ms'")
+                    try:
+                        other.execute(text(
+                            "INSERT INTO bookings (id, created_at, bag_count, dropoff_time, pickup_time, is_paid, "
+                            "is_cancelled, checked_in, checked_out, stashpoint_id, customer_id) VALUES ('late', "
+                            "now(), 1, '2024-03-20 10:00', '2024-03-20 12:00', false, false, false, false, 'sp1', "
+                            ":customer)"
+                        ), {'customer': sample_customer.id})
+                    except OperationalError:
+                        blocked.append(True)
+            return execute(statement, *args, **kwargs)
+
+        monkeypatch.setattr(db.session, 'execute', insert_before_attach)
+        create_booking_partition(datetime(2024, 3, 1))
+        assert blocked == [True]
+        assert partition_of("b202403") == "bookings_2024_03"
+
+    def test_maintain_creates_and_archives(self, bookings):
+        """Test that maintenance adds the months ahead and archives the months past retention"""
+        maintain_booking_partitions(now=datetime(2024, 1, 10), months_ahead=26, retain_months=24)
+        assert booking_partitions()[0] == datetime(2024, 1, 1)
+
+        result = maintain_booking_partitions(now=datetime(2026, 3, 10), months_ahead=3, retain_months=24)
+        assert result['created'] == [datetime(2026, 4, 1), datetime(2026, 5, 1), datetime(2026, 6, 1)]
+        assert result['archived'] == [datetime(2024, 1, 1), datetime(2024, 2, 1)]
+        assert booking_partitions()[0] == datetime(2024, 3, 1)
+        assert db.session.get(Booking, "b202402") is None
+        assert db.session.execute(text(f"SELECT id FROM {ARCHIVE_SCHEMA}.bookings_2024_02")).scalar() == "b202402"
+
+    def test_archived_bookings_leave_occupancy(self, bookings):
+        """Test that archiving rebuilds the occupancy buckets the archived bookings covered"""
+        rebuild_occupancy()
+        maintain_booking_partitions(now=datetime(2026, 3, 10), months_ahead=0, retain_months=24, drop=True)
+        assert check_occupancy("sp1") == []
+        assert db.session.execute(text("SELECT to_regclass('bookings_2024_01')")).scalar() is None
+
+    def test_searches_skip_old_partitions(self, bookings):
+        """Test that the capacity query only reads the partitions a window's bookings can be in"""
+        maintain_booking_partitions(now=datetime(2024, 1, 10), months_ahead=26, retain_months=24)
+        query = select(peak_occupancy_subquery(datetime(2025, 6, 2, 10), datetime(2025, 6, 2, 12)))
+        compiled = query.compile(db.engine)
+        plan = "\n".join(db.session.connection().exec_driver_sql(f"EXPLAIN {compiled}", compiled.params).scalars())
+        assert "bookings_2025_06" in plan and "bookings_2025_05" in plan
+        assert "bookings_2025_04" not in plan and "bookings_2025_07" not in plan
+        assert "bookings_default" not in plan
+
+    def test_booking_too_long(self, client, sample_stashpoints, sample_customer):
+        """Test that bookings longer than the maximum are rejected with 400"""
+        response = client.post('/api/v1/stashpoints/sp2/bookings', json={
+            'customer_id': sample_customer.id, 'bag_count': 1,
+            'dropoff': '2024-01-15T10:00:00Z', 'pickup': '2024-02-16T10:00:00Z',
+        })
+        assert response.status_code == 400
+        assert '31 days' in response.get_data(as_text=True)
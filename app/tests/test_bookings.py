@@ -0,0 +1,112 @@
+import threading
+from datetime import datetime
+from sqlalchemy import func, select
+from app import db
+from app.models import Booking
+from app.services.occupancy import check_occupancy
+
+
+def booking_body(customer_id, bag_count=2, dropoff='2024-01-15T10:00:00Z', pickup='2024-01-15T12:00:00Z'):
+    return {'customer_id': customer_id, 'dropoff': dropoff, 'pickup': pickup, 'bag_count': bag_count}
+
+
+def book(client, stashpoint_id, body):
+    return client.post(f'/api/v1/stashpoints/{stashpoint_id}/bookings', json=body)
+
+
+class TestCreateBooking:
+
+    def test_creates_booking(self, client, sample_stashpoints, sample_customer):
+        """Test that a booking is created and returned with 201"""
+        response = book(client, 'sp1', booking_body(sample_customer.id, bag_count=3))
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['stashpoint_id'] == 'sp1'
+        assert data['bag_count'] == 3
+        assert data['dropoff_time'] == '2024-01-15T10:00:00'
+        assert data['days'] == 1
+        assert data['is_active'] is True
+        assert db.session.get(Booking, data['id']) is not None
+        assert check_occupancy('sp1') == []
+
+    def test_full_stashpoint_is_rejected(self, client, sample_stashpoints, sample_customer):
+        """Test that a booking past the remaining capacity gets a 409"""
+        assert book(client, 'sp1', booking_body(sample_customer.id, bag_count=45)).status_code == 201
+
+        response = book(client, 'sp1', booking_body(sample_customer.id, bag_count=6))
+        assert response.status_code == 409
+        assert 'Only 5 bags' in response.get_json()['error']
+
+        # a later period is unaffected
+        later = booking_body(sample_customer.id, bag_count=6, dropoff='2024-01-15T13:00:00Z',
+                             pickup='2024-01-15T15:00:00Z')
+        assert book(client, 'sp1', later).status_code == 201
+
+    def test_cancelled_bookings_free_capacity(self, app, client, sample_stashpoints, sample_customer):
+        """Test that cancelled bookings don't count against the capacity"""
+        db.session.add(Booking(
+            stashpoint_id='sp1', customer_id=sample_customer.id, bag_count=50, is_cancelled=True,
+            dropoff_time=datetime(2024, 1, 15, 9), pickup_time=datetime(2024, 1, 15, 13),
+        ))
+        db.session.commit()
+
+        assert book(client, 'sp1', booking_body(sample_customer.id, bag_count=50)).status_code == 201
+
+    def test_closed_stashpoint_is_rejected(self, client, sample_stashpoints, sample_customer):
+        """Test that a booking outside the opening hours gets a 409"""
+        response = book(client, 'sp3', booking_body(sample_customer.id, pickup='2024-01-15T18:00:00Z'))
+        assert response.status_code == 409
+        assert 'closed' in response.get_json()['error']
+
+    def test_unknown_stashpoint(self, client, sample_stashpoints, sample_customer):
+        """Test that booking an unknown stashpoint gets a 404"""
+        assert book(client, 'nope', booking_body(sample_customer.id)).status_code == 404
+
+    def test_invalid_bodies(self, client, sample_stashpoints, sample_customer):
+        """Test that invalid booking requests get a 400"""
+        assert client.post('/api/v1/stashpoints/sp1/bookings', data='x').status_code == 400
+        assert book(client, 'sp1', booking_body('nobody')).status_code == 400
+        assert book(client, 'sp1', booking_body(sample_customer.id, bag_count=0)).status_code == 400
+
+        response = book(client, 'sp1', booking_body(sample_customer.id, pickup='2024-01-15T09:00:00Z'))
+        assert response.status_code == 400
+        assert response.get_json()['details'][0]['field'] == 'pickup'
+
+    def test_invalidates_search_cache(self, client, sample_stashpoints, sample_customer):
+        """Test that a booking drops the cached search pages listing its stashpoint"""
+        search = {'lat': 51.5074, 'lng': -0.1278, 'dropoff': '2024-01-15T10:00:00Z',
+                  'pickup': '2024-01-15T12:00:00Z', 'bag_count': 10}
+        before = client.get('/api/v1/stashpoints/', query_string=search).get_json()
+        assert 'sp1' in [stashpoint['id'] for stashpoint in before]
+
+        assert book(client, 'sp1', booking_body(sample_customer.id, bag_count=45)).status_code == 201
+
+        after = client.get('/api/v1/stashpoints/', query_string=search).get_json()
+        assert 'sp1' not in [stashpoint['id'] for stashpoint in after]
+
+    def test_concurrent_bookings_never_overbook(self, app, sample_stashpoints, sample_customer):
+        """Test that concurrent bookings for the last spaces never exceed the capacity"""
+        statuses = []
+        body = booking_body(sample_customer.id, bag_count=5)
+
+        def worker():
+            with app.app_context():
+                response = book(app.test_client(), 'sp1', body)
+                statuses.append(response.status_code)
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # the threads' pooled connections would otherwise outlive the test
+        db.engine.dispose()
+
+        # capacity 50 takes 10 bookings of 5 bags
+        assert statuses.count(201) == 10
+        assert statuses.count(409) == 2
+        booked = db.session.scalar(select(func.sum(Booking.bag_count)).where(Booking.stashpoint_id == 'sp1'))
+        assert booked == 50
+        assert check_occupancy('sp1') == []
@@ -0,0 +1,96 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import select, true
+from sqlalchemy.dialects import postgresql
+from app import db
+from app.models import Booking, Customer, Stashpoint
+from app.services.capacity import capacity_subquery, peak_occupancy, peak_occupancy_subquery
+
+
+def at(hour):
+    return datetime(2024, 1, 15, hour, 0)
+
+
+# (bookings as (dropoff, pickup, bags), peak bags in the 09:00-18:00 window)
+SCENARIOS = {
+    'no bookings': ([], 0),
+    # bookings at different times in the window are not summed
+    'disjoint': ([(at(10), at(11), 30), (at(14), at(15), 30)], 30),
+    # bookings held at the same moment are summed
+    'overlapping': ([(at(10), at(14), 3), (at(12), at(16), 4), (at(15), at(17), 5)], 9),
+    # a pickup frees its bags before a dropoff at the same time
+    'back to back': ([(at(10), at(12), 5), (at(12), at(14), 5)], 5),
+    # only bookings overlapping the window count, ending at its start or starting at its end don't
+    'outside window': ([(at(6), at(9), 10), (at(18), at(20), 10), (at(8), at(11), 2)], 2),
+    # bookings that started before the window are held from its start
+    'partial overlap': ([(at(7), at(10), 3), (at(8), at(12), 4), (at(11), at(19), 2)], 7),
+    # a booking covering the whole window counts throughout
+    'spanning window': ([(at(6), at(20), 4), (at(12), at(13), 1)], 5),
+    # a pickup at the window's end still holds its bags until then
+    'pickup at window end': ([(at(16), at(18), 6), (at(17), at(18), 1)], 7),
+}
+
+
+def sql_peak(bookings, stashpoint_id='sp1'):
+    """Peak bags at `stashpoint_id` by `peak_occupancy_subquery` after storing `bookings` there"""
+    customer_id = Customer.query.first().id
+    for dropoff, pickup, bags in bookings:
+        db.session.add(Booking(
+            stashpoint_id=stashpoint_id, customer_id=customer_id, bag_count=bags,
+            dropoff_time=dropoff, pickup_time=pickup,
+        ))
+    db.session.commit()
+    peak = peak_occupancy_subquery(at(9), at(18), stashpoint_ids=[stashpoint_id])
+    return db.session.execute(select(peak.c.peak_bags)).scalar() or 0
+
+
+class TestPeakOccupancy:
+
+    @pytest.mark.parametrize('bookings, expected', SCENARIOS.values(), ids=SCENARIOS.keys())
+    def test_reference_sweep(self, bookings, expected):
+        """Test the in-Python sweep the SQL is checked against"""
+        assert peak_occupancy(bookings, at(9), at(18)) == expected
+
+    @pytest.mark.parametrize('bookings, expected', SCENARIOS.values(), ids=SCENARIOS.keys())
+    def test_subquery_matches_reference(self, app, sample_stashpoints, sample_customer, bookings, expected):
+        """Test that the SQL peak is the reference sweep's on the same bookings"""
+        assert sql_peak(bookings) == peak_occupancy(bookings, at(9), at(18)) == expected
+
+    def test_subquery_ignores_cancelled_and_other_stashpoints(self, app, sample_stashpoints, sample_customer):
+        """Test that cancelled bookings and other stashpoints' bookings don't count"""
+        db.session.add(Booking(
+            stashpoint_id='sp1', customer_id=sample_customer.id, bag_count=8,
+            dropoff_time=at(10), pickup_time=at(12), is_cancelled=True,
+        ))
+        sql_peak([(at(10), at(12), 9)], stashpoint_id='sp2')
+        assert sql_peak([(at(11), at(13), 2)]) == 2
+
+
+class TestCandidateCapacity:
+
+    @pytest.mark.parametrize('source', ['occupancy', 'bookings'])
+    def test_lateral_subquery_is_correlated(self, source):
+        """Test that the LATERAL capacity subquery reads only the outer stashpoint, not every stashpoint"""
+        peak = capacity_subquery(at(9), at(18), source=source, stashpoint_ids=Stashpoint.id, lateral=True)
+        query = select(Stashpoint.id, peak.c.peak_bags).outerjoin(peak, true())
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        assert 'LEFT OUTER JOIN LATERAL' in sql
+        assert sql.count('FROM stashpoints') == 1
+        assert '.stashpoint_id = stashpoints.id' in sql
+
+    @pytest.mark.parametrize('source', ['occupancy', 'bookings'])
+    def test_search_only_counts_each_stashpoints_bookings(self, app, client, sample_stashpoints, sample_customer, source):
+        """Test that a full stashpoint is left out of searches without affecting its neighbours"""
+        app.config['CAPACITY_SOURCE'] = source
+        db.session.add(Booking(
+            stashpoint_id='sp1', customer_id=sample_customer.id, bag_count=50,
+            dropoff_time=at(9), pickup_time=at(13),
+        ))
+        db.session.commit()
+
+        response = client.get('/api/v1/stashpoints/', query_string={
+            'lat': 51.5074, 'lng': -0.1278, 'bag_count': 1, 'radius_km': 5,
+            'dropoff': '2024-01-15T10:00:00Z', 'pickup': '2024-01-15T12:00:00Z',
+        })
+        assert response.status_code == 200
+        assert [stashpoint['id'] for stashpoint in response.get_json()] == ['sp2']
@@ -0,0 +1,104 @@
+import pytest
+from datetime import datetime
+from app import db
+from app.models import Booking, Stashpoint
+from app.services.catalog import haversine_km
+
+
+SEARCH = {
+    'lat': 51.5074,
+    'lng': -0.1278,
+    'dropoff': '2024-01-15T10:00:00Z',
+    'pickup': '2024-01-15T12:00:00Z',
+    'bag_count': 2,
+}
+
+
+@pytest.fixture(autouse=True)
+def no_search_cache(app):
+    """Compare fresh searches rather than cached pages"""
+    app.config['SEARCH_CACHE_ENABLED'] = False
+
+
+@pytest.fixture
+def catalog(app):
+    app.config['STASHPOINT_CATALOG_ENABLED'] = True
+    return app.extensions['stashpoint_catalog']
+
+
+def search(client, **params):
+    response = client.get('/api/v1/stashpoints/', query_string={**SEARCH, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+class TestStashpointCatalog:
+
+    def test_haversine(self):
+        """Test the spherical distance between two London points"""
+        assert haversine_km(51.5074, -0.1278, 51.5144, -0.1226) == pytest.approx(0.86, abs=0.01)
+
+    def test_matches_database_search(self, app, client, sample_stashpoints, sample_customer):
+        """Test that the catalog returns the same results as the SQL search"""
+        db.session.add(Booking(
+            stashpoint_id="sp2",
+            customer_id=sample_customer.id,
+            bag_count=99,
+            dropoff_time=datetime(2024, 1, 15, 9, 0),
+            pickup_time=datetime(2024, 1, 15, 11, 0),
+        ))
+        db.session.commit()
+
+        for params in ({}, {'radius_km': 5.0}, {'limit': 1}, {'dropoff': '2024-01-15T08:30:00Z'}):
+            from_database = search(client, **params)
+            app.config['STASHPOINT_CATALOG_ENABLED'] = True
+            from_catalog = search(client, **params)
+            app.config['STASHPOINT_CATALOG_ENABLED'] = False
+
+            assert [sp['id'] for sp in from_catalog] == [sp['id'] for sp in from_database]
+            for catalog_sp, database_sp in zip(from_catalog, from_database):
+                assert catalog_sp['distance_km'] == pytest.approx(database_sp['distance_km'], abs=0.05)
+
+    def test_pagination(self, client, sample_stashpoints, catalog):
+        """Test that cursors from the catalog resume after the last row"""
+        response = client.get('/api/v1/stashpoints/', query_string={**SEARCH, 'limit': 1})
+        assert [sp['id'] for sp in response.get_json()] == ['sp1']
+
+        next_page = search(client, limit=1, cursor=response.headers['X-Next-Cursor'])
+        assert [sp['id'] for sp in next_page] == ['sp2']
+
+    def test_refreshes_on_stashpoint_change(self, client, sample_stashpoints, catalog):
+        """Test that committing a stashpoint change reloads the catalog"""
+        assert [sp['id'] for sp in search(client)] == ['sp1', 'sp2', 'sp3']
+
+        stashpoint = db.session.get(Stashpoint, 'sp1')
+        stashpoint.capacity = 1
+        db.session.commit()
+
+        assert [sp['id'] for sp in search(client)] == ['sp2', 'sp3']
+        assert catalog.stats['reloads'] == 2
+
+    def test_reuses_snapshot(self, client, sample_stashpoints, catalog):
+        """Test that repeated searches don't reload the catalog"""
+        search(client)
+        search(client)
+        assert catalog.stats['reloads'] == 1
+        assert catalog.stats['hits'] == 1
+
+    def test_stats_endpoint(self, client, sample_stashpoints, catalog):
+        """Test that the admin endpoint reports the catalog's size"""
+        search(client)
+        response = client.get('/api/v1/admin/catalog')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['enabled'] is True
+        assert data['entries'] == 3
+        assert data['version']['count'] == 3
+        assert data['memory_bytes'] > 0
+
+    def test_admin_token(self, app, client):
+        """Test that a configured admin token is required"""
+        app.config['ADMIN_TOKEN'] = 'secret'
+        assert client.get('/api/v1/admin/catalog').status_code == 403
+        response = client.get('/api/v1/admin/catalog', headers={'X-Admin-Token': 'secret'})
+        assert response.status_code == 200
@@ -0,0 +1,97 @@
+from app import db
+from app.models import Stashpoint
+from app.services.clusters import envelope_filter, tile_lat, tile_lng, tile_x, tile_y, tiles_covering
+
+
+LONDON_BBOX = '-0.13,51.505,-0.12,51.515'
+UK_BBOX = '-2,51,0,53'
+
+
+def get_clusters(client, bbox, zoom):
+    return client.get('/api/v1/stashpoints/clusters', query_string={'bbox': bbox, 'zoom': zoom})
+
+
+class TestTiles:
+
+    def test_tile_of_a_point(self):
+        """Test that points map to their XYZ tiles and back to the tile edges"""
+        x, y = tile_x(-0.1278, 10), tile_y(51.5074, 10)
+        assert (x, y) == (511, 340)
+        assert tile_lng(x, 10) <= -0.1278 < tile_lng(x + 1, 10)
+        assert tile_lat(y + 1, 10) <= 51.5074 < tile_lat(y, 10)
+
+    def test_tiles_covering(self):
+        """Test that every tile overlapping a bounding box is listed"""
+        assert tiles_covering(-180, -85, 180, 85, 1) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+        assert len(tiles_covering(-0.2, 51.45, -0.05, 51.55, 12)) == 3 * 3
+
+    def test_wide_envelopes_are_not_filtered(self):
+        """Test that envelopes a geography box can't hold skip the && filter"""
+        assert envelope_filter(-180, -85, 180, 85) is None
+        assert envelope_filter(-1, 51, 1, 52) is not None
+
+
+class TestClustersRoute:
+
+    def test_clusters_at_low_zoom(self, client, sample_stashpoints):
+        """Test that low zooms return clusters with counts, centroids and capacity"""
+        response = get_clusters(client, UK_BBOX, 8)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['points'] == []
+        assert len(data['clusters']) > 1
+        assert sum(cluster['count'] for cluster in data['clusters']) == 3
+        assert sum(cluster['capacity'] for cluster in data['clusters']) == 180
+
+    def test_cluster_centroid(self, client, sample_stashpoints):
+        """Test that a cluster sits at the mean position of its stashpoints"""
+        data = get_clusters(client, '-180,-85,180,85', 3).get_json()
+        assert data['clusters'] == [{'count': 3, 'capacity': 180, 'lat': 51.673933, 'lng': -0.4168}]
+
+    def test_points_at_high_zoom(self, client, sample_stashpoints):
+        """Test that high zooms return individual stashpoints"""
+        data = get_clusters(client, LONDON_BBOX, 14).get_json()
+        assert data['clusters'] == []
+        points = {point['id']: point for point in data['points']}
+        assert sorted(points) == ['sp1', 'sp2']
+        assert points['sp1'] == {
+            'id': 'sp1', 'name': 'Central Station Storage', 'capacity': 50, 'lat': 51.5074, 'lng': -0.1278,
+        }
+
+    def test_tiles_are_cached(self, app, client, sample_stashpoints):
+        """Test that panning only queries the tiles that came into view"""
+        cache = app.extensions['cluster_cache']
+        get_clusters(client, '-0.2,51.45,-0.15,51.55', 12)
+        first_tiles = len(cache)
+
+        # pan east: the western tiles are served from the cache
+        get_clusters(client, '-0.2,51.45,-0.05,51.55', 12)
+        assert cache.stats['hits'] == first_tiles
+        assert len(cache) == 9
+
+    def test_stashpoint_change_clears_tiles(self, app, client, sample_stashpoints):
+        """Test that a stashpoint change drops the cached tiles"""
+        before = get_clusters(client, LONDON_BBOX, 14).get_json()
+        assert len(before['points']) == 2
+
+        stashpoint = db.session.get(Stashpoint, 'sp2')
+        db.session.delete(stashpoint)
+        db.session.commit()
+
+        after = get_clusters(client, LONDON_BBOX, 14).get_json()
+        assert [point['id'] for point in after['points']] == ['sp1']
+
+    def test_invalid_params(self, client, sample_stashpoints):
+        """Test that malformed boxes and zooms get a 400"""
+        assert get_clusters(client, '1,2,3', 5).status_code == 400
+        assert get_clusters(client, '10,50,5,52', 5).status_code == 400
+        assert get_clusters(client, '0,52,1,51', 5).status_code == 400
+        assert get_clusters(client, 'a,b,c,d', 5).status_code == 400
+        assert get_clusters(client, LONDON_BBOX, 30).status_code == 400
+        assert client.get('/api/v1/stashpoints/clusters', query_string={'zoom': 5}).status_code == 400
+
+    def test_too_many_tiles(self, client, sample_stashpoints):
+        """Test that a box covering too many tiles at its zoom gets a 400"""
+        response = get_clusters(client, '-10,40,10,60', 12)
+        assert response.status_code == 400
+        assert 'too many tiles' in response.get_json()['error']
@@ -0,0 +1,165 @@
+import io
+import json
+import pytest
+from app import db
+from app.models import Stashpoint
+from app.services.stashpoint_import import import_stashpoints, iter_csv_rows, iter_json_rows
+
+
+CSV = """external_id,name,description,address,postal_code,latitude,longitude,capacity,open_from,open_until
+partner-1,Kings Cross Lockers,,1 Euston Road,N1 9AL,51.5308,-0.1238,40,07:00,23:00
+partner-2,Soho Cafe,Bags behind the counter,2 Dean Street,W1D 3RP,51.5136,-0.1320,15,09:00,18:00
+partner-3,Broken Row,,3 Nowhere,N1,95.0,-0.1,abc,09:00,18:00
+"""
+
+ROW = {
+    'external_id': 'partner-1',
+    'name': 'Kings Cross Lockers',
+    'address': '1 Euston Road',
+    'postal_code': 'N1 9AL',
+    'latitude': 51.5308,
+    'longitude': -0.1238,
+    'capacity': 40,
+    'open_from': '07:00',
+    'open_until': '23:00',
+}
+
+
+def search_ids(client, **params):
+    response = client.get('/api/v1/stashpoints/', query_string={
+        'lat': 51.5308, 'lng': -0.1238, 'dropoff': '2024-01-15T10:00:00Z',
+        'pickup': '2024-01-15T12:00:00Z', 'bag_count': 1, 'radius_km': 5.0, **params,
+    })
+    return [sp['name'] for sp in response.get_json()]
+
+
+class TestImportParsing:
+
+    def test_json_array_and_ndjson(self):
+        """Test that arrays and newline-delimited objects decode the same, across reads"""
+        rows = [{**ROW, 'external_id': f'partner-{i}'} for i in range(20)]
+        as_array = json.dumps(rows, indent=2)
+        as_ndjson = '\n'.join(json.dumps(row) for row in rows)
+        assert list(iter_json_rows(io.StringIO(as_array), read_size=7)) == rows
+        assert list(iter_json_rows(io.StringIO(as_ndjson), read_size=7)) == rows
+
+    def test_malformed_json_fails_at_the_record(self):
+        """Test that a malformed record is reported with its position without reading on to the end"""
+        lines = [json.dumps({**ROW, 'external_id': f'partner-{i}'}) for i in range(200)]
+        lines[1] = '{"external_id": "partner-1", "name": oops}'
+        stream = io.StringIO('\n'.join(lines))
+        rows = iter_json_rows(stream, read_size=256)
+        assert next(rows)['external_id'] == 'partner-0'
+        with pytest.raises(ValueError, match=f'record 2 at character {len(lines[0]) + 1}:'):
+            next(rows)
+        assert stream.tell() < 1024
+
+    def test_csv_rows(self):
+        """Test that CSV rows come out as dicts keyed by the header"""
+        rows = list(iter_csv_rows(io.StringIO(CSV)))
+        assert [row['external_id'] for row in rows] == ['partner-1', 'partner-2', 'partner-3']
+
+
+class TestImportStashpoints:
+
+    def test_inserts_valid_rows_and_reports_errors(self, app, client):
+        """Test that bad rows are reported while the rest load, with a searchable location"""
+        report = import_stashpoints(iter_csv_rows(io.StringIO(CSV)), chunk_size=2).to_dict()
+
+        assert report['rows'] == 3
+        assert report['inserted'] == 2
+        assert report['failed'] == 1
+        error = report['errors'][0]
+        assert error['row'] == 3
+        assert error['external_id'] == 'partner-3'
+        assert {e['field'] for e in error['errors']} == {'latitude', 'capacity'}
+
+        stashpoint = Stashpoint.query.filter_by(external_id='partner-2').one()
+        assert stashpoint.description == 'Bags behind the counter'
+        assert stashpoint.open_from.hour == 9
+        assert search_ids(client) == ['Kings Cross Lockers', 'Soho Cafe']
+
+    def test_reports_only_the_rows_the_database_rejects(self, app):
+        """Test that a row the database rejects fails alone, and the rest of its chunk loads"""
+        rows = [{**ROW, 'external_id': f'partner-{i}'} for i in range(5)]
+        rows[3]['capacity'] = 2 ** 31
+        report = import_stashpoints(rows, chunk_size=5).to_dict()
+
+        assert (report['inserted'], report['failed']) == (4, 1)
+        error, = report['errors']
+        assert (error['row'], error['external_id']) == (4, 'partner-3')
+        assert 'out of range' in error['errors'][0]['message']
+
+    def test_upserts_by_external_id(self, app):
+        """Test that re-imports update changed rows and leave the rest alone"""
+        import_stashpoints([ROW, {**ROW, 'external_id': 'partner-2'}])
+        first = Stashpoint.query.filter_by(external_id='partner-1').one()
+        first_id, first_updated = first.id, first.updated_at
+        db.session.expire_all()
+
+        report = import_stashpoints([{**ROW, 'capacity': 5}, {**ROW, 'external_id': 'partner-2'}]).to_dict()
+        assert (report['inserted'], report['updated'], report['unchanged']) == (0, 1, 1)
+
+        updated = Stashpoint.query.filter_by(external_id='partner-1').one()
+        assert updated.id == first_id
+        assert updated.capacity == 5
+        assert updated.updated_at >= first_updated
+        assert Stashpoint.query.count() == 2
+
+    def test_last_duplicate_wins(self, app):
+        """Test that a file repeating an external id keeps its last row"""
+        report = import_stashpoints([ROW, {**ROW, 'name': 'Renamed'}]).to_dict()
+        assert report['inserted'] == 1
+        assert Stashpoint.query.one().name == 'Renamed'
+
+    def test_invalidates_search_cache(self, app, client):
+        """Test that imported changes show up in cached searches straight away"""
+        import_stashpoints([ROW])
+        assert search_ids(client) == ['Kings Cross Lockers']
+        import_stashpoints([{**ROW, 'name': 'Renamed'}])
+        assert search_ids(client) == ['Renamed']
+
+
+class TestImportInterfaces:
+
+    def test_timezone_moves_the_opening_hours(self, app, client):
+        """Test that an imported timezone is applied to the hours searches check"""
+        import_stashpoints([{**ROW, 'timezone': 'Asia/Tokyo'}])
+        stashpoint = Stashpoint.query.one()
+        assert stashpoint.timezone == 'Asia/Tokyo'
+        assert stashpoint.open_windows_until is not None
+        # 07:00-23:00 in Tokyo is 22:00-14:00 UTC
+        assert search_ids(client) == ['Kings Cross Lockers']
+        assert search_ids(client, dropoff='2024-01-15T15:00:00Z', pickup='2024-01-15T17:00:00Z') == []
+
+    def test_admin_endpoint_raw_body(self, client):
+        """Test that a CSV request body is imported and reported"""
+        response = client.post('/api/v1/admin/stashpoints/import', data=CSV, content_type='text/csv')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert (data['inserted'], data['failed']) == (2, 1)
+        assert data['rows_per_second'] > 0
+
+    def test_admin_endpoint_upload(self, client):
+        """Test that an uploaded NDJSON file is imported"""
+        body = '\n'.join(json.dumps({**ROW, 'external_id': f'partner-{i}'}) for i in range(3))
+        response = client.post('/api/v1/admin/stashpoints/import', data={
+            'file': (io.BytesIO(body.encode()), 'partners.ndjson'),
+        })
+        assert response.status_code == 200
+        assert response.get_json()['inserted'] == 3
+
+    def test_admin_endpoint_unknown_format(self, client):
+        """Test that a body of unknown format is rejected"""
+        response = client.post('/api/v1/admin/stashpoints/import', data='x', content_type='text/plain')
+        assert response.status_code == 400
+
+    def test_cli(self, app, tmp_path):
+        """Test that the command imports a file, prints row errors and fails"""
+        path = tmp_path / 'partners.csv'
+        path.write_text(CSV)
+        result = app.test_cli_runner().invoke(args=['stashpoints', 'import', str(path), '--chunk-size', '1'])
+        assert result.exit_code == 1
+        assert 'row 3 (partner-3)' in result.output
+        assert '2 inserted' in result.output
+        assert Stashpoint.query.count() == 2
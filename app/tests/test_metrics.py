@@ -0,0 +1,63 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+
+SEARCH = {
+    'lat': 51.5074,
+    'lng': -0.1278,
+    'dropoff': '2024-01-15T10:00:00Z',
+    'pickup': '2024-01-15T12:00:00Z',
+    'bag_count': 2,
+}
+
+
+def scrape(client):
+    """The /metrics samples as {(name, labels): value}"""
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.get_data(as_text=True))
+        for sample in family.samples
+    }
+
+
+def sample(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+class TestMetrics:
+
+    def test_request_metrics(self, app, client, sample_stashpoints):
+        """Test that requests are counted by endpoint and status, with latency and size"""
+        app.config['SEARCH_CACHE_ENABLED'] = False
+        client.get('/api/v1/stashpoints/', query_string=SEARCH)
+        client.get('/api/v1/stashpoints/', query_string={**SEARCH, 'lat': 'abc'})
+
+        samples = scrape(client)
+        endpoint = {'method': 'GET', 'endpoint': 'stashpoints.get_stashpoints'}
+        assert sample(samples, 'http_requests_total', status='200', **endpoint) == 1
+        assert sample(samples, 'http_requests_total', status='400', **endpoint) == 1
+        assert sample(samples, 'http_request_duration_seconds_count', **endpoint) == 2
+        assert sample(samples, 'http_response_size_bytes_sum', **endpoint) > 0
+
+    def test_sql_by_phase(self, app, client, sample_stashpoints):
+        """Test that the search's SQL is attributed to its query phase"""
+        app.config['SEARCH_CACHE_ENABLED'] = False
+        client.get('/api/v1/stashpoints/', query_string=SEARCH)
+
+        samples = scrape(client)
+        endpoint = 'stashpoints.get_stashpoints'
+        assert sample(samples, 'db_statements_total', endpoint=endpoint, phase='query') >= 1
+        assert sample(samples, 'db_statements_total', endpoint=endpoint, phase='serialization') == 0
+        assert sample(samples, 'db_statement_duration_seconds_count', endpoint=endpoint, phase='query') >= 1
+        for phase in ('parsing', 'validation', 'query', 'serialization'):
+            assert sample(
+                samples, 'http_request_phase_duration_seconds_count', endpoint=endpoint, phase=phase
+            ) >= 1
+
+    def test_pool_gauges(self, client, sample_stashpoints):
+        """Test that the pool's size and checkouts are exported"""
+        samples = scrape(client)
+        assert sample(samples, 'db_pool_size', pool='default') == 5
+        assert sample(samples, 'db_pool_checkouts_total', pool='default') > 0
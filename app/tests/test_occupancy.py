@@ -0,0 +1,110 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+from app.models import Booking, StashpointOccupancy
+from app.services.occupancy import check_occupancy, rebuild_occupancy
+
+
+def buckets_for(stashpoint_id):
+    rows = StashpointOccupancy.query.filter_by(stashpoint_id=stashpoint_id).filter(
+        StashpointOccupancy.booked_bags != 0
+    ).order_by(StashpointOccupancy.bucket_start).all()
+    return [(row.bucket_start, row.booked_bags) for row in rows]
+
+
+@pytest.fixture
+def booking(app, sample_stashpoints, sample_customer):
+    """A 10:00-10:30 booking of 3 bags at sp1"""
+    booking = Booking(
+        id="b1",
+        stashpoint_id="sp1",
+        customer_id=sample_customer.id,
+        bag_count=3,
+        dropoff_time=datetime(2024, 1, 15, 10, 0),
+        pickup_time=datetime(2024, 1, 15, 10, 30),
+    )
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+class TestStashpointOccupancy:
+    
+    def test_booking_fills_buckets(self, booking):
+        """Test that a new booking adds its bags to every bucket it touches"""
+        assert buckets_for("sp1") == [
+            (datetime(2024, 1, 15, 10, 0), 3),
+            (datetime(2024, 1, 15, 10, 15), 3),
+        ]
+    
+    def test_partial_bucket_is_occupied(self, app, sample_stashpoints, sample_customer):
+        """Test that a booking occupies buckets it only partly covers"""
+        db.session.add(Booking(
+            stashpoint_id="sp1",
+            customer_id=sample_customer.id,
+            bag_count=2,
+            dropoff_time=datetime(2024, 1, 15, 10, 10),
+            pickup_time=datetime(2024, 1, 15, 10, 20),
+        ))
+        db.session.commit()
+        assert buckets_for("sp1") == [
+            (datetime(2024, 1, 15, 10, 0), 2),
+            (datetime(2024, 1, 15, 10, 15), 2),
+        ]
+    
+    def test_cancelling_frees_buckets(self, booking):
+        """Test that cancelling a booking removes its bags"""
+        booking.is_cancelled = True
+        db.session.commit()
+        assert buckets_for("sp1") == []
+    
+    def test_moving_booking(self, booking):
+        """Test that moving a booking shifts its bags to the new buckets and stashpoint"""
+        db.session.expire_all()
+        booking = db.session.get(Booking, "b1")
+        booking.stashpoint_id = "sp2"
+        booking.dropoff_time = datetime(2024, 1, 15, 12, 0)
+        booking.pickup_time = datetime(2024, 1, 15, 12, 15)
+        booking.bag_count = 4
+        db.session.commit()
+        assert buckets_for("sp1") == []
+        assert buckets_for("sp2") == [(datetime(2024, 1, 15, 12, 0), 4)]
+    
+    def test_deleting_booking(self, booking):
+        """Test that deleting a booking removes its bags"""
+        db.session.delete(booking)
+        db.session.commit()
+        assert buckets_for("sp1") == []
+    
+    def test_check_and_rebuild(self, booking):
+        """Test that drift is reported and repaired by a rebuild"""
+        assert check_occupancy() == []
+
+        # a raw SQL write bypasses the ORM events
+        db.session.execute(text("UPDATE bookings SET bag_count = 5 WHERE id = 'b1'"))
+        db.session.commit()
+        drift = check_occupancy()
+        assert len(drift) == 2
+        assert all(row['stored'] == 3 and row['expected'] == 5 for row in drift)
+
+        assert rebuild_occupancy() == 2
+        assert check_occupancy() == []
+        assert buckets_for("sp1")[0] == (datetime(2024, 1, 15, 10, 0), 5)
+    
+    def test_search_reads_occupancy(self, client, booking):
+        """Test that the search capacity filter sees the occupancy buckets"""
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:15:00Z',
+            'pickup': '2024-01-15T11:00:00Z',
+            'bag_count': 48
+        }
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 200
+        assert not any(sp['id'] == 'sp1' for sp in response.get_json())
+
+        params['bag_count'] = 47
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert any(sp['id'] == 'sp1' for sp in response.get_json())
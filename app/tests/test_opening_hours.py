@@ -0,0 +1,231 @@
+from datetime import datetime, time, timedelta
+import pytest
+from sqlalchemy import func, select, text
+from app import db
+from app.models import Stashpoint, StashpointOpenWindow
+from app.models.opening_hours import (
+    WEEK_MINUTES, bits_to_mask, compile_schedule, daily_schedule, is_open, mask_to_bits, minute_of_week,
+    open_windows, utc_time
+)
+from app.services.opening_hours import recompile_open_minutes, refresh_open_windows
+
+
+# Monday to Saturday 09:00-17:00, late bar hours 22:00-02:00 on Friday, closed on Sunday
+WEEKLY_HOURS = [
+    *({'weekday': weekday, 'opens': '09:00', 'closes': '17:00'} for weekday in range(6)),
+    {'weekday': 4, 'opens': '22:00', 'closes': '02:00'},
+]
+
+MONDAY = datetime(2024, 1, 15)
+
+NEW_YORK = 'America/New_York'
+
+# a Monday inside the precomputed open windows
+NEXT_MONDAY = datetime.combine(
+    datetime.utcnow().date() + timedelta(days=7 - datetime.utcnow().weekday()), time()
+)
+
+
+def put_hours(client, stashpoint_id, hours):
+    return client.put(f'/api/v1/admin/stashpoints/{stashpoint_id}/opening-hours', json={'hours': hours})
+
+
+def set_timezone(client, stashpoint_id, timezone):
+    return client.put(
+        f'/api/v1/admin/stashpoints/{stashpoint_id}/opening-hours', json={'hours': [], 'timezone': timezone}
+    )
+
+
+def count_windows(stashpoint_id):
+    return db.session.scalar(
+        select(func.count()).where(StashpointOpenWindow.stashpoint_id == stashpoint_id)
+    )
+
+
+def search_ids(client, dropoff, pickup):
+    response = client.get('/api/v1/stashpoints/', query_string={
+        'lat': 51.5074, 'lng': -0.1278, 'bag_count': 1,
+        'dropoff': dropoff.isoformat() + 'Z', 'pickup': pickup.isoformat() + 'Z',
+    })
+    assert response.status_code == 200
+    return sorted(stashpoint['id'] for stashpoint in response.get_json())
+
+
+class TestCompileSchedule:
+
+    def test_daily_hours(self):
+        """Test that daily hours are open from open_from through the open_until minute every day"""
+        mask = compile_schedule(daily_schedule(time(8), time(22)))
+        assert bin(mask).count('1') == 7 * (14 * 60 + 1)
+        assert is_open(mask, MONDAY.replace(hour=8))
+        assert is_open(mask, MONDAY.replace(hour=22))
+        assert not is_open(mask, MONDAY.replace(hour=22, minute=1))
+        assert not is_open(mask, MONDAY.replace(hour=7, minute=59))
+
+    def test_overnight_hours_wrap_the_week(self):
+        """Test that hours past midnight run into the next day, Sunday into Monday"""
+        mask = compile_schedule([(6, time(22), time(2))])
+        sunday = MONDAY.replace(day=21)
+        assert is_open(mask, sunday.replace(hour=23))
+        assert is_open(mask, MONDAY.replace(hour=1, minute=59))
+        assert not is_open(mask, MONDAY.replace(hour=2, minute=1))
+        assert not is_open(mask, sunday.replace(hour=1))
+
+    def test_bits_round_trip(self):
+        """Test that the BIT string keeps minute 0 first and converts back unchanged"""
+        mask = compile_schedule([(0, time(0), time(0, 1))])
+        bits = mask_to_bits(mask)
+        assert len(bits) == WEEK_MINUTES
+        assert bits.startswith('110')
+        assert bits_to_mask(bits) == mask
+        assert minute_of_week(MONDAY.replace(day=21, hour=23, minute=59)) == WEEK_MINUTES - 1
+
+
+class TestCompiledColumn:
+
+    def test_compiled_when_hours_change(self, app, sample_stashpoints):
+        """Test that changing open_from/open_until recompiles open_minutes on flush"""
+        stashpoint = db.session.get(Stashpoint, 'sp3')
+        assert stashpoint.open_minutes == mask_to_bits(compile_schedule(daily_schedule(time(9), time(17))))
+
+        stashpoint.open_until = time(18)
+        db.session.commit()
+        assert is_open(bits_to_mask(stashpoint.open_minutes), MONDAY.replace(hour=17, minute=30))
+
+    def test_sql_compile_matches_python(self, app, sample_stashpoints):
+        """Test that recompiling in SQL gives the same bits as the model"""
+        expected = {stashpoint.id: stashpoint.open_minutes for stashpoint in Stashpoint.query.all()}
+        db.session.execute(text('UPDATE stashpoints SET open_minutes = NULL'))
+        db.session.commit()
+
+        assert recompile_open_minutes() == 3
+        db.session.expire_all()
+        assert {stashpoint.id: stashpoint.open_minutes for stashpoint in Stashpoint.query.all()} == expected
+
+
+class TestWeeklyHoursRoutes:
+
+    def test_replace_and_read_weekly_hours(self, client, sample_stashpoints):
+        """Test that a weekly schedule replaces the daily hours and is listed by weekday"""
+        response = put_hours(client, 'sp2', WEEKLY_HOURS)
+        assert response.status_code == 200
+        data = client.get('/api/v1/stashpoints/sp2/opening-hours').get_json()
+        assert data['weekly'] is True
+        assert data['hours'][:2] == [
+            {'weekday': 0, 'opens': '09:00', 'closes': '17:00'},
+            {'weekday': 1, 'opens': '09:00', 'closes': '17:00'},
+        ]
+        assert data['open_minutes_per_week'] == 6 * 481 + 241
+
+        # an empty schedule goes back to the daily hours, open all day
+        data = put_hours(client, 'sp2', []).get_json()
+        assert data['weekly'] is False
+        assert data['open_minutes_per_week'] == WEEK_MINUTES
+
+    def test_search_follows_weekly_hours(self, client, sample_stashpoints):
+        """Test that searches see closed days and overnight hours of a weekly schedule"""
+        assert put_hours(client, 'sp2', WEEKLY_HOURS).status_code == 200
+
+        monday = search_ids(client, MONDAY.replace(hour=10), MONDAY.replace(hour=16))
+        assert 'sp2' in monday
+        sunday = MONDAY.replace(day=21)
+        assert 'sp2' not in search_ids(client, sunday.replace(hour=10), sunday.replace(hour=16))
+        # Friday 23:00 to Saturday 01:30, inside the late opening
+        friday = MONDAY.replace(day=19, hour=23)
+        assert search_ids(client, friday, friday.replace(day=20, hour=1, minute=30)) == ['sp2']
+
+    def test_catalog_search_follows_weekly_hours(self, app, client, sample_stashpoints):
+        """Test that the in-process catalog tests the same compiled schedule"""
+        app.config['STASHPOINT_CATALOG_ENABLED'] = True
+        assert put_hours(client, 'sp2', WEEKLY_HOURS).status_code == 200
+        sunday = MONDAY.replace(day=21)
+        assert 'sp2' not in search_ids(client, sunday.replace(hour=10), sunday.replace(hour=16))
+        friday = MONDAY.replace(day=19, hour=23)
+        assert search_ids(client, friday, friday.replace(day=20, hour=1, minute=30)) == ['sp2']
+
+    def test_booking_on_a_closed_day(self, client, sample_stashpoints, sample_customer):
+        """Test that bookings on a day the weekly schedule is closed get a 409"""
+        assert put_hours(client, 'sp2', WEEKLY_HOURS).status_code == 200
+        response = client.post('/api/v1/stashpoints/sp2/bookings', json={
+            'customer_id': sample_customer.id, 'bag_count': 1,
+            'dropoff': '2024-01-21T10:00:00Z', 'pickup': '2024-01-21T12:00:00Z',
+        })
+        assert response.status_code == 409
+
+    def test_invalid_hours(self, client, sample_stashpoints):
+        """Test that bad weekdays, empty openings and duplicates get a 400, unknown stashpoints a 404"""
+        assert put_hours(client, 'sp1', [{'weekday': 7, 'opens': '09:00', 'closes': '17:00'}]).status_code == 400
+        assert put_hours(client, 'sp1', [{'weekday': 0, 'opens': '09:00', 'closes': '09:00'}]).status_code == 400
+        duplicate = {'weekday': 0, 'opens': '09:00', 'closes': '17:00'}
+        assert put_hours(client, 'sp1', [duplicate, duplicate]).status_code == 400
+        assert put_hours(client, 'nope', []).status_code == 404
+        assert client.get('/api/v1/stashpoints/nope/opening-hours').status_code == 404
+
+
+class TestTimezones:
+
+    def test_windows_follow_clock_changes(self):
+        """Test that UTC windows shift by an hour when the clocks go forward"""
+        mask = compile_schedule(daily_schedule(time(8), time(22)))
+        windows = open_windows(mask, 'Europe/London', datetime(2024, 3, 30), datetime(2024, 4, 1))
+        assert windows == [
+            (datetime(2024, 3, 30, 8), datetime(2024, 3, 30, 22, 1)),
+            (datetime(2024, 3, 31, 7), datetime(2024, 3, 31, 21, 1)),
+        ]
+
+    def test_always_open_is_one_window(self):
+        """Test that touching windows are merged across days and weeks"""
+        mask = compile_schedule(daily_schedule(time(0), time(23, 59)))
+        assert len(open_windows(mask, 'Asia/Tokyo', datetime(2024, 1, 1), datetime(2024, 3, 1))) == 1
+
+    def test_windows_stored_for_the_horizon(self, app, sample_stashpoints):
+        """Test that new stashpoints get their UTC windows and window range written"""
+        stashpoint = db.session.get(Stashpoint, 'sp3')
+        assert stashpoint.open_windows_from <= datetime.utcnow() < stashpoint.open_windows_until
+        assert count_windows('sp3') == (stashpoint.open_windows_until - stashpoint.open_windows_from).days
+
+    @pytest.mark.parametrize('monday', [MONDAY, NEXT_MONDAY], ids=['converted', 'windows'])
+    def test_search_in_local_time(self, client, sample_stashpoints, monday):
+        """Test that hours are checked in the stashpoint's timezone, inside and outside the stored windows"""
+        assert set_timezone(client, 'sp3', NEW_YORK).status_code == 200
+        # open 09:00-17:00 New York time
+        local = [monday.replace(hour=10), monday.replace(hour=16)]
+        assert 'sp3' in search_ids(client, *(utc_time(moment, NEW_YORK, True) for moment in local))
+        assert 'sp3' not in search_ids(client, *local)
+
+    def test_catalog_search_in_local_time(self, app, client, sample_stashpoints):
+        """Test that the catalog converts the search times to each stashpoint's timezone"""
+        app.config['STASHPOINT_CATALOG_ENABLED'] = True
+        assert set_timezone(client, 'sp3', NEW_YORK).status_code == 200
+        local = [MONDAY.replace(hour=10), MONDAY.replace(hour=16)]
+        assert 'sp3' in search_ids(client, *(utc_time(moment, NEW_YORK, True) for moment in local))
+        assert 'sp3' not in search_ids(client, *local)
+
+    def test_booking_in_local_time(self, client, sample_stashpoints, sample_customer):
+        """Test that bookings are checked against the stashpoint's local hours"""
+        assert set_timezone(client, 'sp3', NEW_YORK).status_code == 200
+        body = {'customer_id': sample_customer.id, 'bag_count': 1}
+        closed = client.post('/api/v1/stashpoints/sp3/bookings', json={
+            **body, 'dropoff': '2024-01-15T10:00:00Z', 'pickup': '2024-01-15T12:00:00Z',
+        })
+        assert closed.status_code == 409
+        opened = client.post('/api/v1/stashpoints/sp3/bookings', json={
+            **body, 'dropoff': '2024-01-15T15:00:00Z', 'pickup': '2024-01-15T17:00:00Z',
+        })
+        assert opened.status_code == 201
+
+    def test_refresh_rolls_the_horizon(self, app, sample_stashpoints):
+        """Test that a refresh moves every stashpoint's windows forward without touching updated_at"""
+        stashpoint = db.session.get(Stashpoint, 'sp1')
+        updated_at, until = stashpoint.updated_at, stashpoint.open_windows_until
+
+        written = refresh_open_windows(now=datetime.utcnow() + timedelta(days=10))
+        # sp2 is always open, one window
+        assert written == count_windows('sp1') + count_windows('sp3') + 1
+        db.session.expire_all()
+        assert stashpoint.open_windows_until == until + timedelta(days=10)
+        assert stashpoint.updated_at == updated_at
+
+    def test_invalid_timezone(self, client, sample_stashpoints):
+        """Test that an unknown timezone gets a 400"""
+        assert set_timezone(client, 'sp3', 'Mars/Olympus_Mons').status_code == 400
@@ -0,0 +1,128 @@
+import importlib
+import os
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+import config
+from app import db
+from app.pool import InstrumentedQueuePool, dispose_after_fork, pool_status
+from config import TestConfig
+
+
+@pytest.fixture
+def reload_config(monkeypatch):
+    """Re-import config.py under the given environment"""
+    def reload(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        return importlib.reload(config)
+
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+class TestEngineOptions:
+
+    def test_per_environment_defaults(self):
+        """Test that production fails faster than development"""
+        dev = config.DevConfig.SQLALCHEMY_ENGINE_OPTIONS
+        prod = config.ProdConfig.SQLALCHEMY_ENGINE_OPTIONS
+        assert prod['pool_timeout'] < dev['pool_timeout']
+        assert dev['pool_pre_ping'] and prod['pool_pre_ping']
+        assert '-c statement_timeout=5000' in prod['connect_args']['options']
+        assert '-c idle_in_transaction_session_timeout=60000' in prod['connect_args']['options']
+
+    def test_environment_overrides(self, reload_config):
+        """Test that DB_* variables override the class defaults"""
+        reloaded = reload_config(DB_POOL_SIZE='3', DB_POOL_RECYCLE='600', DB_STATEMENT_TIMEOUT_MS='250')
+        options = reloaded.ProdConfig.SQLALCHEMY_ENGINE_OPTIONS
+        assert options['pool_size'] == 3
+        assert options['pool_recycle'] == 600
+        assert '-c statement_timeout=250' in options['connect_args']['options']
+
+    def test_production_pool_follows_threads(self, reload_config):
+        """Test that production pools a connection per gunicorn thread, plus a small overflow"""
+        options = reload_config(GUNICORN_THREADS='6').ProdConfig.SQLALCHEMY_ENGINE_OPTIONS
+        assert options['pool_size'] == 6
+        assert options['max_overflow'] == 2
+
+    def test_pgbouncer_mode(self, reload_config):
+        """Test that PgBouncer mode leaves pooling and session settings to PgBouncer"""
+        options = reload_config(DB_PGBOUNCER='true').ProdConfig.SQLALCHEMY_ENGINE_OPTIONS
+        assert options['poolclass'] is NullPool
+        assert 'pool_size' not in options
+        assert 'options' not in options['connect_args']
+
+
+class TestInstrumentedPool:
+
+    def test_app_pool_is_instrumented(self, app):
+        """Test that the app's engine uses the timed pool with the configured settings"""
+        pool = db.engine.pool
+        assert isinstance(pool, InstrumentedQueuePool)
+        assert pool.size() == TestConfig.SQLALCHEMY_ENGINE_OPTIONS['pool_size']
+
+    def test_session_settings_applied(self, app):
+        """Test that production connections get the statement timeout"""
+        engine = create_engine(TestConfig.SQLALCHEMY_DATABASE_URI, **config.ProdConfig.SQLALCHEMY_ENGINE_OPTIONS)
+        with engine.connect() as connection:
+            assert connection.execute(text('SHOW statement_timeout')).scalar() == '5s'
+        engine.dispose()
+
+    def test_counts_timeouts(self, app):
+        """Test that a checkout giving up on an exhausted pool is counted"""
+        engine = create_engine(
+            TestConfig.SQLALCHEMY_DATABASE_URI,
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+        )
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+            status = pool_status(engine.pool)
+            assert status['checked_out'] == 1
+
+        assert status['checkouts']['checkouts'] == 1
+        assert status['checkouts']['timeouts'] == 1
+        assert status['checkouts']['wait_ms_max'] >= 50
+
+        engine.dispose()
+        assert engine.pool.checkout_stats.checkouts == 1
+        engine.dispose()
+
+    def test_stats_endpoint(self, client, sample_stashpoints):
+        """Test that the admin endpoint reports the pool's size and checkouts"""
+        client.get('/api/v1/stashpoints/')
+        data = client.get('/api/v1/admin/db-pool').get_json()
+        pool = data['pools']['default']
+        assert data['pgbouncer'] is False
+        assert pool['pool'] == 'InstrumentedQueuePool'
+        assert pool['size'] == TestConfig.SQLALCHEMY_ENGINE_OPTIONS['pool_size']
+        assert pool['checked_out'] >= 0
+        assert pool['checkouts']['checkouts'] > 0
+
+    def test_forked_worker_opens_its_own_connections(self, app):
+        """Test that a forked worker gets new connections and leaves the parent's open"""
+        backend_pid = text('SELECT pg_backend_pid()')
+        parent_pid = db.session.execute(backend_pid).scalar()
+        db.session.commit()
+
+        read, write = os.pipe()
+        if os.fork() == 0:
+            try:
+                dispose_after_fork(app)
+                os.write(write, str(db.session.execute(backend_pid).scalar()).encode())
+            finally:
+                os._exit(0)
+        os.close(write)
+        child_pid = int(os.read(read, 32) or 0)
+        os.close(read)
+        os.wait()
+
+        assert child_pid and child_pid != parent_pid
+        # the parent's pooled connection survived the child
+        assert db.session.execute(backend_pid).scalar() == parent_pid
@@ -0,0 +1,97 @@
+import pytest
+from app.profiler import rows_scanned, seq_scans
+
+
+SEARCH = {
+    'lat': 51.5074,
+    'lng': -0.1278,
+    'dropoff': '2024-01-15T10:00:00Z',
+    'pickup': '2024-01-15T12:00:00Z',
+    'bag_count': 2,
+}
+
+
+@pytest.fixture
+def profiler(app):
+    app.config['QUERY_PROFILER_ENABLED'] = True
+    app.config['SEARCH_CACHE_ENABLED'] = False
+    return app.extensions['query_profiler']
+
+
+class TestQueryProfiler:
+
+    def test_seq_scans(self):
+        """Test that sequential scans are found in nested plan nodes"""
+        plan = {
+            'Node Type': 'Hash Join',
+            'Plans': [
+                {'Node Type': 'Seq Scan', 'Relation Name': 'bookings'},
+                {'Node Type': 'Index Scan', 'Relation Name': 'stashpoints'},
+            ],
+        }
+        assert seq_scans(plan) == ['bookings']
+
+    def test_rows_scanned(self):
+        """Test that filtered rows and repeated loops count as scanned"""
+        plan = {
+            'Node Type': 'Nested Loop',
+            'Actual Rows': 5,
+            'Plans': [
+                {'Node Type': 'Seq Scan', 'Relation Name': 'stashpoints', 'Actual Rows': 5,
+                 'Rows Removed by Filter': 95, 'Actual Loops': 1},
+                {'Node Type': 'Index Scan', 'Relation Name': 'bookings', 'Actual Rows': 3,
+                 'Actual Loops': 5},
+            ],
+        }
+        assert rows_scanned(plan) == 100 + 15
+
+    def test_query_headers(self, client, sample_stashpoints, profiler):
+        """Test that responses report their query count and database time"""
+        response = client.get('/api/v1/stashpoints/', query_string=SEARCH)
+        assert int(response.headers['X-Query-Count']) >= 1
+        assert float(response.headers['X-DB-Time']) > 0
+
+    def test_disabled(self, app, client, sample_stashpoints):
+        """Test that nothing is added with the profiler off"""
+        app.config['QUERY_PROFILER_ENABLED'] = False
+        response = client.get('/api/v1/stashpoints/', query_string=SEARCH)
+        assert 'X-Query-Count' not in response.headers
+
+    def test_captures_slow_search(self, app, client, sample_stashpoints, profiler):
+        """Test that a search over the threshold is captured with its plan"""
+        app.config['QUERY_PROFILER_THRESHOLD_MS'] = 0
+        client.get('/api/v1/stashpoints/', query_string=SEARCH)
+
+        captures = client.get('/api/v1/admin/slow-queries').get_json()['captures']
+        assert len(captures) == 1
+        capture = captures[0]
+        assert capture['endpoint'] == 'stashpoints.get_stashpoints'
+        assert capture['query_count'] >= 1
+
+        statement = capture['statements'][0]
+        assert 'bookings' in statement['sql'] or 'occupancy' in statement['sql']
+        assert 2 in statement['parameters'].values()
+        assert statement['plan'][0]['Plan']['Node Type']
+        assert 'Shared Hit Blocks' in statement['plan'][0]['Plan']
+        assert isinstance(statement['seq_scans'], list)
+        assert statement['rows_scanned'] >= 3
+
+    def test_fast_requests_not_captured(self, app, client, sample_stashpoints, profiler):
+        """Test that requests under the threshold are only counted"""
+        # well above a search on a fresh connection, so a slow test machine can't cross it
+        app.config['QUERY_PROFILER_THRESHOLD_MS'] = 10000
+        client.get('/api/v1/stashpoints/', query_string=SEARCH)
+        assert profiler.describe() == []
+
+    def test_ring_buffer(self, app, client, sample_stashpoints, profiler):
+        """Test that only the latest captures are kept"""
+        app.config['QUERY_PROFILER_THRESHOLD_MS'] = 0
+        profiler.captures = type(profiler.captures)(maxlen=2)
+        for bag_count in (1, 2, 3):
+            client.get('/api/v1/stashpoints/', query_string={**SEARCH, 'bag_count': bag_count})
+
+        captures = profiler.describe()
+        assert [c['url'].split('bag_count=')[1][0] for c in captures] == ['3', '2']
+
+        assert client.delete('/api/v1/admin/slow-queries').status_code == 204
+        assert profiler.describe() == []
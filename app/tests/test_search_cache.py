@@ -0,0 +1,191 @@
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+from app.models import Booking
+from app.services.cache import TTLCache
+
+
+SEARCH = {
+    'lat': 51.5074,
+    'lng': -0.1278,
+    'dropoff': '2024-01-15T10:00:00Z',
+    'pickup': '2024-01-15T12:00:00Z',
+    'bag_count': 10,
+}
+
+
+def search_ids(client, **params):
+    response = client.get('/api/v1/stashpoints/', query_string={**SEARCH, **params})
+    assert response.status_code == 200
+    return [sp['id'] for sp in response.get_json()]
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+
+    def test_evicts_least_recently_used(self):
+        """Test that the oldest unused entry goes when the cache is full"""
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.stats['evictions'] == 1
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after the TTL"""
+        clock = FakeClock()
+        cache = TTLCache(max_entries=10, ttl_seconds=30, clock=clock)
+        cache.set('a', 1)
+        clock.now = 29
+        assert cache.get('a') == 1
+        clock.now = 30
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_entry_is_not_counted(self):
+        """Test that entry() looks up without counting, leaving that to count()"""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+        cache.set('a', 1)
+        assert cache.entry('a') == 1
+        assert cache.entry('b') is None
+        assert cache.stats['hits'] == cache.stats['misses'] == 0
+        cache.count(False)
+        assert cache.stats['misses'] == 1
+
+    def test_invalidate_tags(self):
+        """Test that only entries with a matching tag are dropped"""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+        cache.set('a', 1, tags=['sp1', 'sp2'])
+        cache.set('b', 2, tags=['sp2'])
+        cache.set('c', 3, tags=['sp3'])
+        assert cache.invalidate_tags(['sp2']) == 2
+        assert cache.get('c') == 3
+        assert cache.get('a') is None
+
+
+class TestSearchCache:
+
+    def test_jittered_searches_share_entry(self, app, client, sample_stashpoints):
+        """Test that searches a few metres apart hit the same cache entry"""
+        cache = app.extensions['search_cache']
+        first = search_ids(client)
+        second = search_ids(client, lat=51.50742, lng=-0.12783)
+        assert first == second
+        assert cache.stats['hits'] == 1
+        assert cache.stats['misses'] == 1
+
+    def test_shared_page_distances_from_own_point(self, app, client, sample_stashpoints):
+        """Test that a page shared across a cell shows the distances an uncached search would"""
+        nearby = {**SEARCH, 'lat': 51.5071, 'lng': -0.1282}
+        app.config['SEARCH_CACHE_ENABLED'] = False
+        expected = client.get('/api/v1/stashpoints/', query_string=nearby).get_json()
+        app.config['SEARCH_CACHE_ENABLED'] = True
+
+        client.get('/api/v1/stashpoints/', query_string=SEARCH)
+        response = client.get('/api/v1/stashpoints/', query_string=nearby)
+        assert app.extensions['search_cache'].stats['hits'] == 1
+        assert [sp['distance_km'] for sp in response.get_json()] == [sp['distance_km'] for sp in expected]
+        assert response.get_json()[0]['distance_km'] > 0
+
+    def test_shared_page_searched_from_the_rounded_point(self, client, sample_stashpoints):
+        """Test that every search in a cell gets the rounded point's rows, radius and cursors"""
+        rounded = {**SEARCH, 'lat': 51.507, 'lng': -0.128, 'radius_km': 1.0}
+        expected = client.get('/api/v1/stashpoints/', query_string=rounded).get_json()
+
+        first = client.get('/api/v1/stashpoints/', query_string={**rounded, 'lat': 51.5074, 'limit': 1})
+        second = client.get('/api/v1/stashpoints/', query_string={
+            **rounded, 'lng': -0.1282, 'limit': 1, 'cursor': first.headers['X-Next-Cursor'],
+        })
+        assert [sp['id'] for sp in first.get_json() + second.get_json()] == [sp['id'] for sp in expected]
+
+    def test_booking_invalidates_listed_stashpoint(self, app, client, sample_stashpoints, sample_customer):
+        """Test that a booking selling out a cached stashpoint drops the page"""
+        assert search_ids(client) == ['sp1', 'sp2', 'sp3']
+
+        db.session.add(Booking(
+            stashpoint_id="sp1",
+            customer_id=sample_customer.id,
+            bag_count=45,
+            dropoff_time=datetime(2024, 1, 15, 9, 0),
+            pickup_time=datetime(2024, 1, 15, 13, 0),
+        ))
+        db.session.commit()
+
+        assert search_ids(client) == ['sp2', 'sp3']
+
+    def test_other_workers_booking_makes_page_stale(self, app, client, other_worker, sample_stashpoints,
+                                                    sample_customer):
+        """Test that a booking committed by another worker is not served from this worker's cache"""
+        assert search_ids(client) == ['sp1', 'sp2', 'sp3']
+
+        response = other_worker.post('/api/v1/stashpoints/sp1/bookings', json={
+            'customer_id': sample_customer.id, 'bag_count': 45,
+            'dropoff': '2024-01-15T09:00:00Z', 'pickup': '2024-01-15T13:00:00Z',
+        })
+        assert response.status_code == 201
+
+        assert search_ids(client) == ['sp2', 'sp3']
+        stats = app.extensions['search_cache'].stats
+        assert (stats['stale'], stats['hits'], stats['misses']) == (1, 0, 2)
+
+    def test_first_version_makes_page_stale(self, app, client, other_worker, sample_stashpoints, sample_customer):
+        """Test that the first cache version ever handed out makes pages cached before it stale"""
+        db.session.execute(text("ALTER SEQUENCE stashpoint_cache_version RESTART"))
+        db.session.execute(text("UPDATE stashpoints SET cache_version = 0"))
+        db.session.commit()
+        assert search_ids(client) == ['sp1', 'sp2', 'sp3']
+
+        response = other_worker.post('/api/v1/stashpoints/sp1/bookings', json={
+            'customer_id': sample_customer.id, 'bag_count': 45,
+            'dropoff': '2024-01-15T09:00:00Z', 'pickup': '2024-01-15T13:00:00Z',
+        })
+        assert response.status_code == 201
+        assert db.session.scalar(text("SELECT cache_version FROM stashpoints WHERE id = 'sp1'")) == 1
+
+        assert search_ids(client) == ['sp2', 'sp3']
+
+    def test_unrelated_booking_keeps_entry(self, app, client, sample_stashpoints, sample_customer):
+        """Test that bookings elsewhere leave cached pages alone"""
+        search_ids(client, radius_km=1.0)
+        db.session.add(Booking(
+            stashpoint_id="sp3",
+            customer_id=sample_customer.id,
+            bag_count=1,
+            dropoff_time=datetime(2024, 1, 15, 9, 0),
+            pickup_time=datetime(2024, 1, 15, 13, 0),
+        ))
+        db.session.commit()
+        assert len(app.extensions['search_cache']) == 1
+
+    def test_etag_not_modified(self, client, sample_stashpoints):
+        """Test that a matching If-None-Match gets a 304"""
+        response = client.get('/api/v1/stashpoints/', query_string=SEARCH)
+        etag = response.headers['ETag']
+        assert etag
+
+        response = client.get('/api/v1/stashpoints/', query_string=SEARCH, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        response = client.get(
+            '/api/v1/stashpoints/', query_string={**SEARCH, 'bag_count': 40}, headers={'If-None-Match': etag}
+        )
+        assert response.status_code == 200
+
+    def test_etag_without_cache(self, app, client, sample_stashpoints):
+        """Test that ETags are sent with the cache disabled too"""
+        app.config['SEARCH_CACHE_ENABLED'] = False
+        etag = client.get('/api/v1/stashpoints/', query_string=SEARCH).headers['ETag']
+        response = client.get('/api/v1/stashpoints/', query_string=SEARCH, headers={'If-None-Match': etag})
+        assert response.status_code == 304
@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+import pytest
+from app.json_provider import OrjsonProvider, orjson
+from app.models import Stashpoint
+from app.services.search import RESPONSE_FIELDS, StashpointRow, list_stashpoints
+
+
+class TestLeanRows:
+
+    def test_matches_model_to_dict(self, app, sample_stashpoints):
+        """Test that rows read as plain columns serialize like the model"""
+        rows = list_stashpoints(10)
+        models = Stashpoint.query.order_by(Stashpoint.id).all()
+        assert [row.to_dict() for row in rows] == [sp.to_dict() for sp in models]
+        assert list(rows[0].to_dict()) == list(RESPONSE_FIELDS)
+
+    def test_row_has_no_instance_dict(self):
+        """Test that rows only hold their values"""
+        row = StashpointRow(('sp1',) + (None,) * (len(RESPONSE_FIELDS) - 1))
+        assert row.id == 'sp1'
+        assert not hasattr(row, '__dict__')
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+class TestOrjsonProvider:
+
+    def test_used_by_app(self, app):
+        """Test that the app encodes with orjson when it's installed"""
+        assert isinstance(app.json, OrjsonProvider)
+
+    def test_same_output_as_flask(self, app):
+        """Test that keys are sorted and dates formatted as Flask would"""
+        data = {'b': 1, 'a': [1.5, None, 'ü'], 'when': datetime(2024, 1, 15, 10, 0)}
+        assert json.loads(app.json.dumps(data)) == {
+            'a': [1.5, None, 'ü'], 'b': 1, 'when': 'Mon, 15 Jan 2024 10:00:00 GMT',
+        }
+        assert app.json.dumps({'b': 1, 'a': 2}) == '{"a":2,"b":1}'
+
+    def test_response(self, client, sample_stashpoints):
+        """Test that responses are encoded by orjson with a trailing newline"""
+        response = client.get('/api/v1/stashpoints/')
+        assert response.mimetype == 'application/json'
+        assert response.data.endswith(b']\n')
+        assert [sp['id'] for sp in response.get_json()] == ['sp1', 'sp2', 'sp3']
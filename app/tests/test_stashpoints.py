@@ -1,7 +1,11 @@
+import json
 import pytest
 from datetime import datetime, timedelta
+from sqlalchemy import event
 from app import db
 from app.models import Booking
+from app.services.pagination import encode_cursor
+from app.services.search import iter_stashpoints
 
 
 @pytest.fixture
@@ -243,6 +247,39 @@ class TestStashpointsRoute:
         data = response.get_json()
         assert any(sp['id'] == 'sp2' for sp in data)
     
+    def test_capacity_uses_peak_occupancy(self, client, sample_stashpoints, sample_customer):
+        """Test that bookings at different times in the window don't count as overlapping"""
+        with client.application.app_context():
+            for dropoff_hour in (10, 14):
+                db.session.add(Booking(
+                    stashpoint_id="sp1",
+                    customer_id=sample_customer.id,
+                    bag_count=30,  # 60 in total, but never more than 30 at once
+                    dropoff_time=datetime(2024, 1, 15, dropoff_hour, 0),
+                    pickup_time=datetime(2024, 1, 15, dropoff_hour + 1, 0),
+                    is_paid=True,
+                    is_cancelled=False
+                ))
+            db.session.commit()
+
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T09:00:00Z',
+            'pickup': '2024-01-15T18:00:00Z',
+            'bag_count': 20
+        }
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 200
+        data = response.get_json()
+        # peak is 30 bags, so 20 of the 50 slots are still free
+        assert any(sp['id'] == 'sp1' for sp in data)
+
+        params['bag_count'] = 21
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        data = response.get_json()
+        assert not any(sp['id'] == 'sp1' for sp in data)
+    
     def test_radius_filter(self, client, sample_stashpoints):
         """Test that only stashpoints within the specified radius are returned"""
         params = {
@@ -269,6 +306,160 @@ class TestStashpointsRoute:
         # Should include Far Away Storage now
         assert any(sp['name'] == 'Far Away Storage' for sp in data_no_radius)
     
+    def test_limit_returns_nearest(self, client, sample_stashpoints):
+        """Test that limit returns only the nearest available stashpoints"""
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:00:00Z',
+            'pickup': '2024-01-15T16:00:00Z',
+            'bag_count': 1,
+            'radius_km': 200.0,
+            'limit': 2
+        }
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [sp['id'] for sp in data] == ['sp1', 'sp2']
+    
+    def test_limit_widens_search_without_radius(self, client, sample_stashpoints):
+        """Test that a nearest-k search without radius widens until k are found"""
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:00:00Z',
+            'pickup': '2024-01-15T16:00:00Z',
+            'bag_count': 1,
+            'limit': 3
+        }
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 200
+        data = response.get_json()
+        # Far Away Storage is well outside the initial radius
+        assert [sp['id'] for sp in data] == ['sp1', 'sp2', 'sp3']
+
+        # asking for more than exist returns everything available
+        params['limit'] = 10
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert len(response.get_json()) == 3
+    
+    def test_invalid_limit(self, client):
+        """Test with invalid limit values"""
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:00:00Z',
+            'pickup': '2024-01-15T18:00:00Z',
+            'bag_count': 2,
+            'limit': 0
+        }
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 400
+        assert any(error['field'] == 'limit' for error in response.get_json()['details'])
+
+        params['limit'] = 'ten'
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 400
+    
+    def test_catalog_pagination(self, client, sample_stashpoints):
+        """Test paging through the catalog with the next cursor"""
+        response = client.get('/api/v1/stashpoints/', query_string={'limit': 2})
+        assert response.status_code == 200
+        assert [sp['id'] for sp in response.get_json()] == ['sp1', 'sp2']
+        cursor = response.headers['X-Next-Cursor']
+        assert 'rel="next"' in response.headers['Link']
+
+        response = client.get('/api/v1/stashpoints/', query_string={'limit': 2, 'cursor': cursor})
+        assert [sp['id'] for sp in response.get_json()] == ['sp3']
+        assert 'X-Next-Cursor' not in response.headers
+    
+    def test_catalog_ndjson_stream(self, client, sample_stashpoints):
+        """Test streaming the whole catalog as NDJSON"""
+        response = client.get('/api/v1/stashpoints/', query_string={'format': 'ndjson'})
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [row['id'] for row in rows] == ['sp1', 'sp2', 'sp3']
+        assert 'X-Next-Cursor' not in response.headers
+
+        response = client.get('/api/v1/stashpoints/', headers={'Accept': 'application/x-ndjson'})
+        assert response.mimetype == 'application/x-ndjson'
+        assert len(response.get_data(as_text=True).splitlines()) == 3
+
+        response = client.get('/api/v1/stashpoints/', query_string={'format': 'xml'})
+        assert response.status_code == 400
+
+    def test_catalog_stream_pages_in_short_transactions(self, app, client, sample_stashpoints):
+        """Test that the NDJSON stream reads in pages and holds no transaction while the client reads"""
+        rows = iter_stashpoints(batch_size=2)
+        assert next(rows).id == 'sp1'
+        assert not db.session().in_transaction()
+        assert [row.id for row in rows] == ['sp2', 'sp3']
+
+        app.config['STASHPOINTS_STREAM_BATCH_SIZE'] = 1
+        response = client.get('/api/v1/stashpoints/', query_string={'format': 'ndjson'})
+        assert [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()] == ['sp1', 'sp2', 'sp3']
+    
+    def test_search_pagination(self, client, sample_stashpoints):
+        """Test paging through search results by distance"""
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:00:00Z',
+            'pickup': '2024-01-15T16:00:00Z',
+            'bag_count': 1,
+            'radius_km': 200.0,
+            'limit': 1
+        }
+        seen = []
+        while True:
+            response = client.get('/api/v1/stashpoints/', query_string=params)
+            assert response.status_code == 200
+            seen.extend(sp['id'] for sp in response.get_json())
+            if 'X-Next-Cursor' not in response.headers:
+                break
+            params['cursor'] = response.headers['X-Next-Cursor']
+        assert seen == ['sp1', 'sp2', 'sp3']
+    
+    def test_invalid_cursor(self, client, sample_stashpoints):
+        """Test that garbage or mismatched cursors are rejected"""
+        response = client.get('/api/v1/stashpoints/', query_string={'cursor': 'not-a-cursor'})
+        assert response.status_code == 400
+
+        catalog_page = client.get('/api/v1/stashpoints/', query_string={'limit': 1})
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:00:00Z',
+            'pickup': '2024-01-15T16:00:00Z',
+            'bag_count': 1,
+            'cursor': catalog_page.headers['X-Next-Cursor']
+        }
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid cursor'
+
+    @pytest.mark.parametrize('key', [
+        ['search', None, 'sp1'],
+        ['search', 1.5, 2],
+        ['search', True, 'sp1'],
+        ['catalog', {}],
+        ['catalog', 3],
+    ])
+    def test_cursor_with_wrong_value_types(self, client, sample_stashpoints, key):
+        """Test that cursors whose key values have the wrong types are rejected"""
+        params = {
+            'lat': 51.5074,
+            'lng': -0.1278,
+            'dropoff': '2024-01-15T10:00:00Z',
+            'pickup': '2024-01-15T16:00:00Z',
+            'bag_count': 1,
+        } if key[0] == 'search' else {}
+        params['cursor'] = encode_cursor(*key)
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid cursor'
+    
     def test_distance_calculation_and_ordering(self, client, sample_stashpoints):
         """Test that results are ordered by distance from search coordinates"""
         params = {
@@ -298,6 +489,24 @@ class TestStashpointsRoute:
         if len(data) > 1:
             assert data[1]['id'] == 'sp2'
 
+    def test_searches_share_one_statement(self, app, client, sample_stashpoints):
+        """Test that searches with the same shape reuse one statement with their values bound"""
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        for lat, lng in ((51.5074, -0.1278), (52.0, -1.0)):
+            response = client.get('/api/v1/stashpoints/', query_string={
+                'lat': lat, 'lng': lng, 'dropoff': '2024-01-15T10:00:00Z', 'pickup': '2024-01-15T12:00:00Z',
+                'bag_count': 1, 'radius_km': 1.0,
+            })
+            assert response.status_code == 200
+            assert response.get_json()[0]['distance_km'] < 0.1
+
+        searches = [statement for statement in statements if 'ST_DWithin' in statement]
+        assert len(searches) == 2 and searches[0] == searches[1]
+        assert '51.5074' not in searches[0]
+
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
\ No newline at end of file
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent search throughput of the ASGI app against the WSGI app.
+
+Starts `flask run` (the threaded server the Dockerfile uses) and
+`uvicorn asgi:app`, one process each, against the same database, then
+fires random searches around central London at each with increasing
+concurrency and reports requests per second and latency percentiles.
+The search cache is disabled so every request reaches Postgres. Reuses
+the data loaded by bench_capacity.py:
+
+    python benchmarks/bench_capacity.py --database-url postgresql://.../stasher_bench
+    python benchmarks/bench_async.py --database-url postgresql://.../stasher_bench
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASE_DATE = datetime(2024, 6, 1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, database_url):
+    env = {
+        **os.environ,
+        'DATABASE_URL': database_url,
+        'FLASK_APP': 'app.py',
+        'FLASK_ENV': 'production',
+        'SEARCH_CACHE_ENABLED': 'false',
+    }
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'flask', 'run', '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/healthcheck').status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server at {base_url} did not start')
+
+
+def random_search(rng):
+    dropoff = BASE_DATE + timedelta(days=rng.randint(0, 59), hours=rng.randint(8, 16))
+    return {
+        'lat': round(51.3 + rng.random() * 0.4, 5),
+        'lng': round(-0.5 + rng.random() * 0.7, 5),
+        'dropoff': dropoff.isoformat() + 'Z',
+        'pickup': (dropoff + timedelta(hours=rng.randint(1, 6))).isoformat() + 'Z',
+        'bag_count': rng.randint(1, 4),
+        'limit': 10,
+    }
+
+
+async def load(base_url, concurrency, requests, seed):
+    """Send `requests` searches with `concurrency` in flight, returning latencies in ms"""
+    rng = random.Random(seed)
+    searches = [random_search(rng) for _ in range(requests)]
+    latencies = []
+    errors = 0
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while searches:
+                params = searches.pop()
+                started = time.perf_counter()
+                response = await client.get('/api/v1/stashpoints/', params=params)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def run(database_url, concurrency_levels, requests, seed):
+    results = []
+    for mode in ('wsgi', 'asgi'):
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server = start_server(mode, port, database_url)
+        try:
+            wait_until_up(base_url)
+            # warm up connections and caches
+            asyncio.run(load(base_url, 4, 20, seed))
+            for concurrency in concurrency_levels:
+                latencies, errors, elapsed = asyncio.run(load(base_url, concurrency, requests, seed))
+                quantiles = statistics.quantiles(latencies, n=100)
+                result = {
+                    'mode': mode,
+                    'concurrency': concurrency,
+                    'requests': requests,
+                    'errors': errors,
+                    'requests_per_second': round(requests / elapsed, 1),
+                    'p50_ms': round(quantiles[49], 2),
+                    'p95_ms': round(quantiles[94], 2),
+                }
+                results.append(result)
+                print(f"{mode} | concurrency={concurrency:>3} | {result['requests_per_second']:8.1f} req/s "
+                      f"| p50={result['p50_ms']:8.2f}ms | p95={result['p95_ms']:8.2f}ms | errors={errors}")
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--requests', type=int, default=500, help='requests per concurrency level')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required')
+
+    results = run(args.database_url, args.concurrency, args.requests, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
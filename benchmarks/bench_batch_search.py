@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark the batch search against running the same searches one at a time.
+
+Runs batches of random searches around central London (default 20 per
+batch) both through `search_stashpoints`, one query each, and through
+`batch_search_stashpoints`, one query per batch, and reports wall-clock
+time per batch. Reuses the data loaded by bench_capacity.py:
+
+    python benchmarks/bench_capacity.py --database-url postgresql://.../stasher_bench
+    python benchmarks/bench_batch_search.py --database-url postgresql://.../stasher_bench
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.schemas.stashpoints import StashpointSearchParams  # noqa: E402
+from app.services.search import batch_search_stashpoints, search_stashpoints  # noqa: E402
+from config import Config  # noqa: E402
+
+
+BASE_DATE = datetime(2024, 6, 1)
+
+
+def random_searches(count, rng):
+    searches = []
+    for _ in range(count):
+        dropoff = BASE_DATE + timedelta(days=rng.randint(0, 59), hours=rng.randint(8, 16))
+        searches.append(StashpointSearchParams(
+            lat=51.3 + rng.random() * 0.4,
+            lng=-0.5 + rng.random() * 0.7,
+            dropoff=dropoff,
+            pickup=dropoff + timedelta(hours=rng.randint(1, 6)),
+            bag_count=rng.randint(1, 4),
+            radius_km=rng.choice([None, 2.0, 5.0]),
+            limit=10,
+        ))
+    return searches
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def run(config, batch_size, runs, seed):
+    rng = random.Random(seed)
+    one_by_one, batched = [], []
+    for _ in range(runs):
+        searches = random_searches(batch_size, rng)
+        one_by_one.append(timed(lambda: [
+            search_stashpoints(search, config, limit=search.limit) for search in searches
+        ]))
+        batched.append(timed(lambda: batch_search_stashpoints(searches, config, default_limit=10)))
+        db.session.rollback()
+
+    results = []
+    for mode, timings in (('one query per search', one_by_one), ('batch', batched)):
+        results.append({
+            'mode': mode,
+            'searches_per_batch': batch_size,
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+        })
+        print(f"{mode:>21} | {batch_size} searches | median={statistics.median(timings):9.2f}ms "
+              f"| min={min(timings):9.2f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        results = run(app.config, args.batch_size, args.runs, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Load test booking creation for oversell and sustained bookings per second.
+
+Recreates the busy period seed_test_data.py models: a handful of small
+stashpoints and every customer trying to drop bags off on the same day,
+mostly 10:00 to 18:00, one to four bags each. --processes worker
+processes, each with its own app, engine and --threads threads, post
+bookings through POST /api/v1/stashpoints/<id>/bookings for --seconds.
+
+Afterwards every stashpoint's exact peak occupancy is recomputed from the
+raw bookings and compared with its capacity, and the occupancy buckets
+are checked against the bookings. Any oversell or drift exits with status 1.
+
+    python benchmarks/bench_bookings.py --database-url postgresql://.../stasher_bench
+
+The target database's stashpoints, bookings and customers are wiped, so
+it refuses to run without an explicit URL.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, time as time_of_day, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Booking, Customer, Stashpoint, StashpointOccupancy  # noqa: E402
+from app.services.capacity import peak_occupancy_subquery  # noqa: E402
+from app.services.occupancy import check_occupancy  # noqa: E402
+from config import Config  # noqa: E402
+
+
+BUSY_DATE = datetime(2024, 6, 1)
+CUSTOMERS = 100
+# seed_test_data.py's bag counts and weights
+BAG_COUNTS = [1, 2, 3, 4]
+BAG_WEIGHTS = [50, 30, 15, 5]
+
+
+def bench_config(database_url, capacity_source):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        CAPACITY_SOURCE = capacity_source
+        SEARCH_CACHE_ENABLED = False
+    return BenchConfig
+
+
+def setup(stashpoints, capacity):
+    """Wipe the booking tables and create the stashpoints and customers"""
+    db.create_all()
+    for model in (StashpointOccupancy, Booking, Customer, Stashpoint):
+        db.session.query(model).delete()
+    rng = random.Random(0)
+    for i in range(stashpoints):
+        db.session.add(Stashpoint(
+            id=f'busy{i}', name=f'Busy Storage {i}', address=f'{i} Busy Street', postal_code='EC1A 1AA',
+            latitude=51.5 + rng.random() * 0.05, longitude=-0.13 + rng.random() * 0.05,
+            capacity=capacity, open_from=time_of_day(8), open_until=time_of_day(22),
+        ))
+    for i in range(CUSTOMERS):
+        db.session.add(Customer(id=f'load{i}', email=f'load{i}@example.com', name=f'Load Customer {i}'))
+    db.session.commit()
+
+
+def busy_booking(rng, stashpoints):
+    """A booking request in the seed's busy period"""
+    if rng.random() < 0.7:
+        dropoff, pickup = BUSY_DATE.replace(hour=10), BUSY_DATE.replace(hour=18)
+    else:
+        dropoff = BUSY_DATE.replace(hour=rng.randint(8, 15))
+        pickup = dropoff + timedelta(hours=rng.randint(2, 6))
+    return f'busy{rng.randrange(stashpoints)}', {
+        'customer_id': f'load{rng.randrange(CUSTOMERS)}',
+        'dropoff': dropoff.isoformat() + 'Z',
+        'pickup': pickup.isoformat() + 'Z',
+        'bag_count': rng.choices(BAG_COUNTS, weights=BAG_WEIGHTS)[0],
+    }
+
+
+def worker(process_index, args, start_at, results):
+    """One process: --threads threads posting bookings from `start_at` for --seconds"""
+    app = create_app(bench_config(args.database_url, args.capacity_source))
+    statuses, latencies, lock = Counter(), [], threading.Lock()
+    deadline = start_at + args.seconds
+    time.sleep(max(0.0, start_at - time.time()))
+
+    def run_thread(thread_index):
+        rng = random.Random(process_index * 1000 + thread_index)
+        client = app.test_client()
+        with app.app_context():
+            while time.time() < deadline:
+                stashpoint_id, body = busy_booking(rng, args.stashpoints)
+                started = time.perf_counter()
+                response = client.post(f'/api/v1/stashpoints/{stashpoint_id}/bookings', json=body)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    statuses[response.status_code] += 1
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=run_thread, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((dict(statuses), latencies))
+
+
+def peak_bags():
+    """(id, capacity, peak_bags) of each booked stashpoint, the exact peak over the busy day"""
+    peaks = peak_occupancy_subquery(BUSY_DATE, BUSY_DATE + timedelta(days=1))
+    query = select(Stashpoint.id, Stashpoint.capacity, peaks.c.peak_bags).join(
+        peaks, peaks.c.stashpoint_id == Stashpoint.id
+    )
+    return db.session.execute(query).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--stashpoints', type=int, default=20)
+    parser.add_argument('--capacity', type=int, default=200, help='bags per stashpoint')
+    parser.add_argument('--capacity-source', choices=['occupancy', 'bookings'], default='occupancy')
+    parser.add_argument('--startup-seconds', type=float, default=5,
+                        help='time allowed for the worker processes to start')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required; the booking tables are wiped')
+
+    app = create_app(bench_config(args.database_url, args.capacity_source))
+    with app.app_context():
+        setup(args.stashpoints, args.capacity)
+        db.engine.dispose()
+
+    # processes start with their own app and pool, not copies of this one's
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    # every worker starts at the same moment, once they've all had time to import the app
+    start_at = time.time() + args.startup_seconds
+    processes = [
+        context.Process(target=worker, args=(i, args, start_at, results)) for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    statuses, latencies = Counter(), []
+    for process_statuses, process_latencies in collected:
+        statuses.update(process_statuses)
+        latencies.extend(process_latencies)
+    latencies.sort()
+
+    with app.app_context():
+        booked = db.session.query(Booking).count()
+        peaks = peak_bags()
+        drifted = check_occupancy()
+
+    report = {
+        'processes': args.processes,
+        'threads': args.threads,
+        'capacity_source': args.capacity_source,
+        'requests': sum(statuses.values()),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'bookings': booked,
+        'bookings_per_second': round(statuses[201] / args.seconds, 1),
+        'full_stashpoints': sum(1 for _, capacity, peak in peaks if peak == capacity),
+        'p50_ms': round(latencies[len(latencies) // 2], 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)], 2) if latencies else None,
+        'oversold_stashpoints': [
+            {'id': stashpoint_id, 'capacity': capacity, 'peak_bags': peak}
+            for stashpoint_id, capacity, peak in peaks if peak > capacity
+        ],
+        'drifted_buckets': len(drifted),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if report['oversold_stashpoints'] or report['drifted_buckets'] or statuses[201] != booked:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
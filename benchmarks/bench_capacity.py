@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark the peak-occupancy capacity check against the old booking-sum subquery.
+
+Loads a synthetic dataset (default 1M bookings over 2,000 stashpoints) into a
+dedicated database and runs both capacity filters for a handful of search
+windows, reporting execution time from EXPLAIN ANALYZE and how many
+stashpoints each one considers available.
+
+    python benchmarks/bench_capacity.py --database-url postgresql://.../stasher_bench
+
+The target database is wiped, so it refuses to run without an explicit URL.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, text  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Stashpoint, Booking  # noqa: E402
+from app.services.capacity import peak_occupancy_subquery  # noqa: E402
+from app.services.opening_hours import recompile_open_minutes  # noqa: E402
+from config import Config  # noqa: E402
+
+
+BASE_DATE = datetime(2024, 6, 1)
+
+
+def legacy_booking_counts(dropoff, pickup):
+    """The original capacity subquery: sum of every overlapping booking"""
+    return select(
+        Booking.stashpoint_id,
+        func.sum(Booking.bag_count).label('peak_bags')
+    ).where(
+        Booking.dropoff_time < pickup,
+        Booking.pickup_time > dropoff,
+        Booking.is_cancelled == False
+    ).group_by(Booking.stashpoint_id).subquery()
+
+
+def available_stashpoints(capacity_subquery, bag_count):
+    return select(Stashpoint.id).outerjoin(
+        capacity_subquery,
+        Stashpoint.id == capacity_subquery.c.stashpoint_id
+    ).where(
+        Stashpoint.capacity - func.coalesce(capacity_subquery.c.peak_bags, 0) >= bag_count
+    )
+
+
+def load_data(stashpoints, bookings):
+    """Bulk-load synthetic stashpoints and bookings with set-based inserts"""
+    db.drop_all()
+    db.create_all()
+
+    print(f"Loading {stashpoints:,} stashpoints and {bookings:,} bookings...")
+    started = time.perf_counter()
+    db.session.execute(text("""
+        INSERT INTO customers (id, created_at, email, name)
+        VALUES ('bench-customer', now(), 'bench@example.com', 'Bench Customer')
+    """))
+    db.session.execute(text("""
+        INSERT INTO stashpoints (id, created_at, name, address, postal_code,
+                                 latitude, longitude, location, capacity, open_from, open_until)
+        SELECT 'sp' || g, now(), 'Stashpoint ' || g, g || ' Bench Street', 'BN1 1AA',
+               lat, lng, ST_SetSRID(ST_MakePoint(lng, lat), 4326)::geography,
+               10 + (g % 90), '00:00', '23:59'
+        FROM (
+            SELECT g, 51.3 + random() * 0.4 AS lat, -0.5 + random() * 0.7 AS lng
+            FROM generate_series(1, :n) AS g
+        ) s
+    """), {'n': stashpoints})
+    recompile_open_minutes()
+    # dropoffs spread over 60 days, mostly a few hours long with some multi-day stays
+    db.session.execute(text("""
+        INSERT INTO bookings (id, created_at, bag_count, dropoff_time, pickup_time,
+                              is_paid, is_cancelled, checked_in, checked_out,
+                              stashpoint_id, customer_id)
+        SELECT 'b' || g, now(), 1 + (random() * 3)::int, dropoff,
+               dropoff + CASE WHEN random() < 0.8
+                              THEN interval '1 hour' * (1 + (random() * 8)::int)
+                              ELSE interval '1 day' * (1 + (random() * 4)::int) END,
+               true, random() < 0.05, false, false,
+               'sp' || (1 + (random() * (:stashpoints - 1))::int), 'bench-customer'
+        FROM (
+            SELECT g, :base + interval '1 minute' * (random() * 60 * 24 * 60)::int AS dropoff
+            FROM generate_series(1, :n) AS g
+        ) b
+    """), {'n': bookings, 'stashpoints': stashpoints, 'base': BASE_DATE})
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    print(f"Loaded in {time.perf_counter() - started:.1f}s")
+
+
+def explain_ms(statement):
+    """Execution time reported by EXPLAIN ANALYZE, in milliseconds"""
+    compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Execution Time']
+
+
+def run(runs):
+    windows = [
+        ('2h midday', BASE_DATE + timedelta(days=30, hours=12), timedelta(hours=2)),
+        ('8h day', BASE_DATE + timedelta(days=30, hours=9), timedelta(hours=8)),
+        ('3 days', BASE_DATE + timedelta(days=30, hours=9), timedelta(days=3)),
+    ]
+    results = []
+    for label, dropoff, duration in windows:
+        pickup = dropoff + duration
+        for engine, subquery in (
+            ('legacy sum', legacy_booking_counts(dropoff, pickup)),
+            ('peak occupancy', peak_occupancy_subquery(dropoff, pickup)),
+        ):
+            statement = available_stashpoints(subquery, bag_count=2)
+            available = len(db.session.execute(statement).all())
+            timings = [explain_ms(statement) for _ in range(runs)]
+            results.append({
+                'window': label,
+                'engine': engine,
+                'available_stashpoints': available,
+                'median_ms': round(statistics.median(timings), 2),
+                'min_ms': round(min(timings), 2),
+            })
+            print(f"{label:>10} | {engine:>14} | available={available:>6} "
+                  f"| median={statistics.median(timings):9.2f}ms | min={min(timings):9.2f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--stashpoints', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=1_000_000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--skip-load', action='store_true', help='reuse previously loaded data')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required; the database is wiped')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        if not args.skip_load:
+            load_data(args.stashpoints, args.bookings)
+        results = run(args.runs)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
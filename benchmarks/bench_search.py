@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Benchmark a fixed set of GET /api/v1/stashpoints/ query shapes.
+
+Each shape is requested --runs times through the Flask app (after a few
+warm-up requests) and reported as p50/p95/p99 latency, with the SQL
+statement count and database time from the query profiler headers. One
+more request per shape is profiled with EXPLAIN ANALYZE for the rows its
+statements scanned and any sequential scans. Runs against the data
+loaded by synthetic_data.py:
+
+    python benchmarks/synthetic_data.py --database-url postgresql://.../stasher_bench
+    python benchmarks/bench_search.py --database-url postgresql://.../stasher_bench \\
+        --output before.json
+    python benchmarks/bench_search.py --database-url ... --compare before.json
+
+Results are written as JSON so runs can be compared with --compare.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Booking, Stashpoint  # noqa: E402
+from config import Config  # noqa: E402
+from synthetic_data import BASE_DATE  # noqa: E402
+
+
+def iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+CENTRAL_LONDON = {'lat': 51.5074, 'lng': -0.1278}
+MIDDAY = BASE_DATE + timedelta(days=45, hours=11)
+WINDOW = {'dropoff': iso(MIDDAY), 'pickup': iso(MIDDAY + timedelta(hours=3))}
+
+# name -> query params; "page 2" resumes from the cursor of "radius 1km"
+SHAPES = {
+    'nearest 10': {**CENTRAL_LONDON, **WINDOW, 'bag_count': 1, 'limit': 10},
+    'radius 1km': {**CENTRAL_LONDON, **WINDOW, 'bag_count': 2, 'radius_km': 1.0, 'limit': 20},
+    'radius 5km': {**CENTRAL_LONDON, **WINDOW, 'bag_count': 2, 'radius_km': 5.0},
+    'page 2': {**CENTRAL_LONDON, **WINDOW, 'bag_count': 2, 'radius_km': 1.0, 'limit': 20},
+    'multi-day stay': {
+        **CENTRAL_LONDON, 'bag_count': 1, 'radius_km': 2.0,
+        'dropoff': iso(MIDDAY), 'pickup': iso(MIDDAY + timedelta(days=3)),
+    },
+    'large group': {**CENTRAL_LONDON, **WINDOW, 'bag_count': 6, 'radius_km': 3.0},
+    'other city': {'lat': 48.8566, 'lng': 2.3522, **WINDOW, 'bag_count': 2, 'radius_km': 2.0},
+    'sparse area': {'lat': 50.9, 'lng': -1.4, **WINDOW, 'bag_count': 1, 'limit': 10},
+    'catalog page': {'limit': 50},
+}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def profile(app, client, params):
+    """Rows scanned and sequential scans of one request, from EXPLAIN ANALYZE"""
+    profiler = app.extensions['query_profiler']
+    profiler.clear()
+    app.config['QUERY_PROFILER_THRESHOLD_MS'] = 0
+    client.get('/api/v1/stashpoints/', query_string=params)
+    app.config['QUERY_PROFILER_THRESHOLD_MS'] = float('inf')
+
+    statements = profiler.describe()[0]['statements'] if profiler.describe() else []
+    return {
+        'rows_scanned': sum(s.get('rows_scanned', 0) for s in statements),
+        'seq_scans': sorted({table for s in statements for table in s.get('seq_scans', [])}),
+    }
+
+
+def run_shape(app, client, params, runs, warmup):
+    for _ in range(warmup):
+        client.get('/api/v1/stashpoints/', query_string=params)
+
+    timings, query_counts, db_times, rows = [], [], [], 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get('/api/v1/stashpoints/', query_string=params)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        query_counts.append(int(response.headers['X-Query-Count']))
+        db_times.append(float(response.headers['X-DB-Time']))
+        rows = len(response.get_json())
+
+    timings.sort()
+    return {
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'db_time_ms': round(sum(db_times) / len(db_times), 2),
+        'queries': max(query_counts),
+        'rows_returned': rows,
+        **profile(app, client, params),
+    }
+
+
+def run(app, runs, warmup):
+    client = app.test_client()
+    first_page = client.get('/api/v1/stashpoints/', query_string=SHAPES['radius 1km'])
+    shapes = dict(SHAPES)
+    shapes['page 2'] = {**shapes['page 2'], 'cursor': first_page.headers.get('X-Next-Cursor', '')}
+
+    results = {}
+    for name, params in shapes.items():
+        if 'cursor' in params and not params['cursor']:
+            print(f"{name:>15} | skipped, the first page was the last")
+            continue
+        result = run_shape(app, client, params, runs, warmup)
+        results[name] = result
+        print(f"{name:>15} | p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+              f"p99={result['p99_ms']:8.2f}ms | db={result['db_time_ms']:8.2f}ms "
+              f"queries={result['queries']} rows={result['rows_returned']:>3} "
+              f"scanned={result['rows_scanned']:>9,} seq_scans={','.join(result['seq_scans']) or '-'}")
+    return results
+
+
+def compare(results, baseline_path):
+    """Print each shape's latency change against an earlier run's JSON"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\nChange against {baseline_path}:")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rows_scanned'):
+            change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            deltas.append(f"{key.replace('_ms', '')} {change:+6.1f}%")
+        print(f"{name:>15} | {' | '.join(deltas)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--capacity-source', choices=['occupancy', 'bookings'], default='occupancy')
+    parser.add_argument('--catalog', action='store_true', help='answer searches from the in-process catalog')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+        CAPACITY_SOURCE = args.capacity_source
+        STASHPOINT_CATALOG_ENABLED = args.catalog
+        SEARCH_CACHE_ENABLED = False
+        QUERY_PROFILER_ENABLED = True
+        QUERY_PROFILER_THRESHOLD_MS = float('inf')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        dataset = {
+            'stashpoints': db.session.scalar(select(func.count()).select_from(Stashpoint)),
+            'bookings': db.session.scalar(select(func.count()).select_from(Booking)),
+        }
+        print(f"{dataset['stashpoints']:,} stashpoints, {dataset['bookings']:,} bookings, "
+              f"{args.runs} runs per shape")
+        results = run(app, args.runs, args.warmup)
+
+    report = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'dataset': dataset,
+            'runs': args.runs,
+            'capacity_source': args.capacity_source,
+            'catalog': args.catalog,
+        },
+        'shapes': SHAPES,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
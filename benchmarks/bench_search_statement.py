@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark the Python CPU a search spends on its SQL statement.
+
+Runs the same searches with the statement rebuilt for every search, as
+it was before `search_statement` was cached, and with the cached
+statement and bound parameters. For each it reports the CPU time
+(time.process_time, so the database's own time is not counted) of
+building the statement alone and of the whole search, executed and
+fetched. Runs against the data loaded by synthetic_data.py:
+
+    python benchmarks/synthetic_data.py --database-url postgresql://.../stasher_bench
+    python benchmarks/bench_search_statement.py --database-url postgresql://.../stasher_bench
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.schemas.stashpoints import StashpointSearchParams  # noqa: E402
+from app.services.search import search_parameters, search_statement  # noqa: E402
+from config import Config  # noqa: E402
+from synthetic_data import BASE_DATE  # noqa: E402
+
+
+MIDDAY = BASE_DATE + timedelta(days=45, hours=11)
+
+# name -> (search, radius_km, limit, after)
+SEARCHES = {
+    'radius 1km': (dict(radius_km=1.0), 1.0, 21, None),
+    'radius 5km': (dict(radius_km=5.0), 5.0, None, None),
+    'page 2': (dict(radius_km=1.0), 1.0, 21, (200.0, 'sp')),
+}
+
+
+def search_params(**extra):
+    return StashpointSearchParams(
+        lat=51.5074, lng=-0.1278, dropoff=MIDDAY, pickup=MIDDAY + timedelta(hours=3), bag_count=2, **extra
+    )
+
+
+def rebuilt(source, params, radius_km, limit, after):
+    """A new statement for every search, bypassing the cache"""
+    statement = search_statement.__wrapped__(source, bool(radius_km), bool(limit), bool(after))
+    return statement, search_parameters(params, radius_km, limit, after)
+
+
+def cached(source, params, radius_km, limit, after):
+    statement = search_statement(source, bool(radius_km), bool(limit), bool(after))
+    return statement, search_parameters(params, radius_km, limit, after)
+
+
+def cpu_ms(fn, runs):
+    """Median CPU milliseconds of `fn` over `runs`"""
+    times = []
+    for _ in range(runs):
+        started = time.process_time()
+        fn()
+        times.append((time.process_time() - started) * 1000)
+    return statistics.median(times)
+
+
+def run(app, runs):
+    source = app.config['CAPACITY_SOURCE']
+    results = []
+    for name, (extra, radius_km, limit, after) in SEARCHES.items():
+        params = search_params(**extra)
+        for variant, build in (('rebuilt', rebuilt), ('cached', cached)):
+            def search():
+                statement, values = build(source, params, radius_km, limit, after)
+                rows = db.session.execute(statement, values).all()
+                db.session.rollback()
+                return rows
+
+            returned = len(search())
+            build_ms = cpu_ms(lambda: build(source, params, radius_km, limit, after), runs)
+            search_ms = cpu_ms(search, runs)
+            results.append({
+                'search': name, 'variant': variant, 'rows': returned,
+                'build_cpu_ms': round(build_ms, 3), 'search_cpu_ms': round(search_ms, 3),
+            })
+            print(f"{name:>11} | {variant:>7} | {returned:>4} rows | build cpu={build_ms:7.3f}ms "
+                  f"| search cpu={search_ms:7.3f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--capacity-source', choices=['occupancy', 'bookings'], default='occupancy')
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+        CAPACITY_SOURCE = args.capacity_source
+        SQLALCHEMY_BINDS = {}
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        results = run(app, args.runs)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
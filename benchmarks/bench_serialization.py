@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark how search results are read and serialized on large result sets.
+
+Runs one wide search (and one catalog page) returning --rows rows, reading
+the results as ORM instances or as plain `response_columns` rows, and
+encoding them with the standard library or orjson. Reports the app's CPU
+time per request (time.process_time, so the database's own time is not
+counted) and the peak Python allocation measured by tracemalloc. Runs
+against the data loaded by synthetic_data.py:
+
+    python benchmarks/synthetic_data.py --database-url postgresql://.../stasher_bench
+    python benchmarks/bench_serialization.py --database-url postgresql://.../stasher_bench
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.json_provider import OrjsonProvider  # noqa: E402
+from app.models import Stashpoint  # noqa: E402
+from app.routes.stashpoints import stashpoints_with_distance  # noqa: E402
+from app.schemas.stashpoints import StashpointSearchParams  # noqa: E402
+from app.services.search import StashpointRow, build_list_query, build_search_query, search_rows  # noqa: E402
+from config import Config  # noqa: E402
+from synthetic_data import BASE_DATE  # noqa: E402
+
+
+def search_params():
+    dropoff = BASE_DATE + timedelta(days=45, hours=11)
+    return StashpointSearchParams(
+        lat=51.5074, lng=-0.1278, dropoff=dropoff, pickup=dropoff + timedelta(hours=3),
+        bag_count=1, radius_km=50.0,
+    )
+
+
+def orm_search(config, rows):
+    """The search as it was: whole Stashpoint instances plus the distances"""
+    query, params = build_search_query(search_params(), config, radius_km=50.0, limit=rows)
+    columns = query.selected_columns
+    query = query.with_only_columns(Stashpoint, columns.distance_km, columns.sort_distance)
+    return stashpoints_with_distance(db.session.execute(query, params).all())
+
+
+def lean_search(config, rows):
+    query, params = build_search_query(search_params(), config, radius_km=50.0, limit=rows)
+    return stashpoints_with_distance(search_rows(db.session.execute(query, params).all()))
+
+
+def orm_list(config, rows):
+    stashpoints = db.session.scalars(select(Stashpoint).order_by(Stashpoint.id).limit(rows))
+    return [stashpoint.to_dict() for stashpoint in stashpoints]
+
+
+def lean_list(config, rows):
+    return [StashpointRow(row).to_dict() for row in db.session.execute(build_list_query(rows))]
+
+
+def measure(fn, runs):
+    """Median CPU and wall milliseconds over `runs`, and the peak allocation of one more"""
+    cpu, wall = [], []
+    for _ in range(runs):
+        started_cpu, started_wall = time.process_time(), time.perf_counter()
+        fn()
+        cpu.append((time.process_time() - started_cpu) * 1000)
+        wall.append((time.perf_counter() - started_wall) * 1000)
+        db.session.close()
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.close()
+    return statistics.median(cpu), statistics.median(wall), peak
+
+
+def run(app, rows, runs):
+    encoders = {'json': DefaultJSONProvider(app).dumps, 'orjson': OrjsonProvider(app).dumps_bytes}
+    readers = {
+        'search': {'orm': orm_search, 'columns': lean_search},
+        'catalog': {'orm': orm_list, 'columns': lean_list},
+    }
+
+    results = []
+    for endpoint, variants in readers.items():
+        for reader, read in variants.items():
+            for encoder, encode in encoders.items():
+                returned = len(read(app.config, rows))
+                cpu_ms, wall_ms, peak = measure(lambda: encode(read(app.config, rows)), runs)
+                results.append({
+                    'endpoint': endpoint,
+                    'rows': returned,
+                    'reader': reader,
+                    'encoder': encoder,
+                    'cpu_ms': round(cpu_ms, 2),
+                    'wall_ms': round(wall_ms, 2),
+                    'peak_alloc_kb': round(peak / 1024, 1),
+                })
+                print(f"{endpoint:>7} | {returned:>6} rows | {reader:>7} + {encoder:<6} | cpu={cpu_ms:8.2f}ms "
+                      f"| wall={wall_ms:8.2f}ms | peak alloc={peak / 1024:9.1f}KiB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        results = run(app, args.rows, args.runs)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
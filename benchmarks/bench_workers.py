@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Load test the production server (gunicorn with gunicorn.conf.py) at
+increasing worker counts.
+
+For each --workers count, starts `gunicorn wsgi:app` against the database
+with that many workers, fires random searches around central London with
+--concurrency-per-worker requests in flight per worker, and reports
+requests per second, latency percentiles and the speedup over one worker.
+Throughput should grow with the workers until the cores (or Postgres) are
+saturated. The load generator runs here too, so this needs spare cores to
+show anything: on a single core (with Postgres on it) the speedup stays
+around 1, and a warning is printed for worker counts above the cores. The
+search cache is disabled so every request reaches Postgres.
+Reuses the data loaded by bench_capacity.py or synthetic_data.py:
+
+    python benchmarks/synthetic_data.py --database-url postgresql://.../stasher_bench
+    python benchmarks/bench_workers.py --database-url postgresql://.../stasher_bench
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+
+from bench_async import ROOT, free_port, load, wait_until_up
+
+
+def start_server(port, database_url, workers, threads):
+    env = {
+        **os.environ,
+        'DATABASE_URL': database_url,
+        'SEARCH_CACHE_ENABLED': 'false',
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'GUNICORN_ACCESS_LOG': '',
+        'GUNICORN_LOG_LEVEL': 'warning',
+    }
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run(database_url, worker_counts, threads, concurrency_per_worker, requests, seed):
+    results = []
+    for workers in worker_counts:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server = start_server(port, database_url, workers, threads)
+        concurrency = workers * concurrency_per_worker
+        try:
+            wait_until_up(base_url)
+            # warm up every worker's connections
+            asyncio.run(load(base_url, concurrency, concurrency * 2, seed))
+            latencies, errors, elapsed = asyncio.run(load(base_url, concurrency, requests, seed))
+        finally:
+            server.terminate()
+            server.wait()
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        result = {
+            'workers': workers,
+            'threads': threads,
+            'concurrency': concurrency,
+            'requests': requests,
+            'errors': errors,
+            'requests_per_second': round(requests / elapsed, 1),
+            'p50_ms': round(quantiles[49], 2),
+            'p95_ms': round(quantiles[94], 2),
+        }
+        result['speedup'] = round(result['requests_per_second'] / results[0]['requests_per_second'], 2) \
+            if results else 1.0
+        results.append(result)
+        print(f"workers={workers:>3} | concurrency={concurrency:>4} | {result['requests_per_second']:8.1f} req/s "
+              f"| x{result['speedup']:<5} | p50={result['p50_ms']:8.2f}ms | p95={result['p95_ms']:8.2f}ms "
+              f"| errors={errors}")
+    return results
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, cores, cores * 2 + 1} - {0}),
+                        help=f'worker counts to try (this machine has {cores} cores)')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--concurrency-per-worker', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per worker count')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required')
+    if max(args.workers) > cores:
+        print(f'warning: {max(args.workers)} workers on {cores} cores, shared with this load generator; '
+              'the speedup past the cores measures contention, not scaling', file=sys.stderr)
+
+    results = run(
+        args.database_url, args.workers, args.threads, args.concurrency_per_worker, args.requests, args.seed
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cores': cores, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
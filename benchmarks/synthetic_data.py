@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Bulk-load a synthetic, production-sized dataset with COPY.
+
+Stashpoints are clustered around hotspots (stations, old towns) in a
+handful of cities, with some spread across each city. Bookings favour
+popular stashpoints, weekends and late-morning dropoffs; most last a few
+hours, some overnight, and a few are cancelled. The same --seed always
+produces the same data.
+
+    python benchmarks/synthetic_data.py --database-url postgresql://.../stasher_bench \\
+        --stashpoints 100000 --bookings 10000000
+
+The target database is wiped, so it refuses to run without an explicit URL.
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Booking  # noqa: E402
+from config import Config  # noqa: E402
+
+
+# Dropoffs fall within DAYS days from here, so searches can pick windows in it
+BASE_DATE = datetime(2024, 6, 1)
+DAYS = 90
+
+# (name, lat, lng, radius in degrees, share of the stashpoints)
+CITIES = [
+    ('London', 51.5074, -0.1278, 0.15, 0.35),
+    ('Paris', 48.8566, 2.3522, 0.10, 0.15),
+    ('New York', 40.7128, -74.0060, 0.12, 0.15),
+    ('Barcelona', 41.3874, 2.1686, 0.06, 0.08),
+    ('Rome', 41.9028, 12.4964, 0.08, 0.08),
+    ('Amsterdam', 52.3676, 4.9041, 0.05, 0.07),
+    ('Lisbon', 38.7223, -9.1393, 0.05, 0.06),
+    ('Edinburgh', 55.9533, -3.1883, 0.04, 0.06),
+]
+HOTSPOTS_PER_CITY = 12
+# share of a city's stashpoints scattered across it rather than at a hotspot
+SCATTERED = 0.2
+
+OPENING_HOURS = [('00:00', '23:59'), ('08:00', '22:00'), ('09:00', '18:00'), ('07:00', '23:00')]
+OPENING_WEIGHTS = [0.35, 0.35, 0.2, 0.1]
+
+# relative dropoff frequency by hour of day, peaking late morning and mid-afternoon
+HOUR_WEIGHTS = [0.2, 0.1, 0.1, 0.1, 0.1, 0.3, 0.8, 1.5, 2.5, 3.5, 4.0, 3.5,
+                3.0, 2.8, 3.0, 2.5, 2.0, 1.5, 1.2, 1.0, 0.8, 0.6, 0.4, 0.3]
+BAG_COUNTS = [1, 2, 3, 4, 5, 6]
+BAG_WEIGHTS = [0.5, 0.3, 0.1, 0.05, 0.03, 0.02]
+
+COPY_CHUNK_ROWS = 100_000
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def pick(rng, values, cum_weights):
+    """random.choices for one value, without rebuilding the cumulative weights"""
+    return values[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def stashpoint_rows(count, rng):
+    """CSV rows for the stashpoints table, clustered around city hotspots"""
+    hotspots = []
+    for name, lat, lng, radius, share in CITIES:
+        for _ in range(HOTSPOTS_PER_CITY):
+            hotspots.append((name, lat + rng.gauss(0, radius / 3), lng + rng.gauss(0, radius / 2), share))
+    hotspot_weights = cumulative(share / HOTSPOTS_PER_CITY for *_, share in hotspots)
+    cities = {name: (lat, lng, radius) for name, lat, lng, radius, _ in CITIES}
+    opening_weights = cumulative(OPENING_WEIGHTS)
+    now = BASE_DATE.isoformat()
+
+    for i in range(count):
+        name, lat, lng, _ = pick(rng, hotspots, hotspot_weights)
+        if rng.random() < SCATTERED:
+            lat, lng, radius = cities[name]
+            lat += rng.uniform(-radius, radius)
+            lng += rng.uniform(-radius, radius) * 1.5
+        else:
+            lat += rng.gauss(0, 0.004)
+            lng += rng.gauss(0, 0.006)
+        open_from, open_until = pick(rng, OPENING_HOURS, opening_weights)
+        capacity = int(10 + 90 * rng.random() ** 2)
+        yield (
+            f'sp{i:07d}', now, now, f'{name} Storage {i}', None, f'{i} Synthetic Street', 'SY1 1AA',
+            round(lat, 6), round(lng, 6), capacity, open_from, open_until,
+        )
+
+
+def customer_rows(count):
+    now = BASE_DATE.isoformat()
+    for i in range(count):
+        yield f'c{i:07d}', now, f'customer{i}@example.com', f'Customer {i}', None
+
+
+def booking_duration(rng):
+    """Mostly a few hours, sometimes overnight, rarely a week"""
+    roll = rng.random()
+    if roll < 0.85:
+        return timedelta(minutes=15 * min(int(rng.lognormvariate(math.log(12), 0.6)) + 1, 64))
+    if roll < 0.98:
+        return timedelta(days=1, hours=rng.randint(-12, 12))
+    return timedelta(days=rng.randint(3, 7))
+
+
+def booking_rows(count, stashpoints, customers, rng):
+    """CSV rows for the bookings table"""
+    # popularity falls off with rank, so a few stashpoints take most bookings
+    popularity = cumulative(1 / (rank + 1) ** 0.8 for rank in range(stashpoints))
+    stashpoint_order = list(range(stashpoints))
+    rng.shuffle(stashpoint_order)
+    days = list(range(DAYS))
+    # Fridays to Sundays are busier (BASE_DATE is a Saturday)
+    day_weights = cumulative(1.4 if (BASE_DATE + timedelta(days=d)).weekday() >= 4 else 1.0 for d in days)
+    hour_weights = cumulative(HOUR_WEIGHTS)
+    bag_weights = cumulative(BAG_WEIGHTS)
+    now = BASE_DATE.isoformat()
+
+    for i in range(count):
+        dropoff = BASE_DATE + timedelta(
+            days=pick(rng, days, day_weights),
+            hours=pick(rng, range(24), hour_weights),
+            minutes=15 * rng.randrange(4),
+        )
+        pickup = dropoff + booking_duration(rng)
+        yield (
+            f'b{i:09d}', now, pick(rng, BAG_COUNTS, bag_weights),
+            dropoff.isoformat(), pickup.isoformat(),
+            rng.random() < 0.9, rng.random() < 0.05, False, False,
+            f'sp{pick(rng, stashpoint_order, popularity):07d}',
+            f'c{rng.randrange(customers):07d}',
+        )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY `rows` into `table`, a chunk at a time so memory stays flat"""
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    copied = 0
+    while True:
+        chunk = list(itertools.islice(rows, COPY_CHUNK_ROWS))
+        if not chunk:
+            return copied
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(chunk)
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        copied += len(chunk)
+
+
+def load(stashpoints, bookings, customers=None, seed=1, occupancy=True, log=print):
+    """
+    Wipe the app's database and load the synthetic dataset into monthly
+    booking partitions. Booking indexes are built after the COPY, and the
+    occupancy buckets (if `occupancy`) rebuilt from the bookings.
+    """
+    from app.services.booking_partitions import add_months, create_booking_partition, month_start
+    from app.services.occupancy import rebuild_occupancy
+    from app.services.opening_hours import recompile_open_minutes
+
+    rng = random.Random(seed)
+    customers = customers or max(1, bookings // 20)
+
+    db.drop_all()
+    db.create_all()
+    month = month_start(BASE_DATE)
+    while month < BASE_DATE + timedelta(days=DAYS):
+        create_booking_partition(month)
+        month = add_months(month, 1)
+    booking_indexes = list(Booking.__table__.indexes)
+    connection = db.session.connection()
+    for index in booking_indexes:
+        index.drop(connection)
+
+    cursor = connection.connection.cursor()
+    started = time.perf_counter()
+    copy_rows(cursor, 'customers', ['id', 'created_at', 'email', 'name', 'phone'], customer_rows(customers))
+    copy_rows(cursor, 'stashpoints', [
+        'id', 'created_at', 'updated_at', 'name', 'description', 'address', 'postal_code',
+        'latitude', 'longitude', 'capacity', 'open_from', 'open_until',
+    ], stashpoint_rows(stashpoints, rng))
+    db.session.execute(text(
+        "UPDATE stashpoints SET location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography"
+    ))
+    log(f"Copied {customers:,} customers and {stashpoints:,} stashpoints in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    copy_rows(cursor, 'bookings', [
+        'id', 'created_at', 'bag_count', 'dropoff_time', 'pickup_time', 'is_paid', 'is_cancelled',
+        'checked_in', 'checked_out', 'stashpoint_id', 'customer_id',
+    ], booking_rows(bookings, stashpoints, customers, rng))
+    log(f"Copied {bookings:,} bookings in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    for index in booking_indexes:
+        index.create(connection)
+    db.session.commit()
+    log(f"Indexed bookings in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    compiled = recompile_open_minutes()
+    log(f"Compiled the opening hours of {compiled:,} stashpoints in {time.perf_counter() - started:.1f}s")
+
+    if occupancy:
+        started = time.perf_counter()
+        written = rebuild_occupancy()
+        log(f"Rebuilt {written:,} occupancy buckets in {time.perf_counter() - started:.1f}s")
+
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--stashpoints', type=int, default=100_000)
+    parser.add_argument('--bookings', type=int, default=10_000_000)
+    parser.add_argument('--customers', type=int, help='default: one per 20 bookings')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-occupancy', action='store_true',
+                        help="skip the occupancy rebuild (searches then need CAPACITY_SOURCE=bookings)")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCH_DATABASE_URL) is required; the database is wiped')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        load(args.stashpoints, args.bookings, args.customers, args.seed, occupancy=not args.no_occupancy)
+
+
+if __name__ == '__main__':
+    main()
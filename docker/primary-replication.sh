@@ -0,0 +1,3 @@
+#!/bin/sh
+# Run once when the db volume is created: let db-replica stream WAL from this server
+echo "host replication all all md5" >> "$PGDATA/pg_hba.conf"
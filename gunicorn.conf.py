@@ -0,0 +1,50 @@
+"""
+Production server settings, read by `gunicorn wsgi:app` from the working
+directory. Each value can be overridden by its environment variable.
+"""
+import multiprocessing
+import os
+
+from config import WORKER_THREADS
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Forked workers, each with a few threads and its own connection pool. The
+# threads cover requests waiting on Postgres, while the workers spread the
+# Python work (validation, serialization) over the cores. ProdConfig sizes
+# each worker's pools from the threads (GUNICORN_THREADS), so a server opens
+# up to workers x (threads + 2) connections to the primary and to each replica.
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = WORKER_THREADS
+worker_class = "gthread"
+
+# Import the app once in the master so workers fork with it loaded (faster
+# starts, shared memory). New code then needs a new master: `kill -USR2` the
+# master and `kill -QUIT` the old one once the new workers are up. HUP only
+# replaces the workers with the code already loaded.
+preload_app = True
+pidfile = os.environ.get("GUNICORN_PIDFILE")
+
+# Workers silent for longer are killed and replaced; on SIGTERM (or HUP, QUIT
+# after USR2) workers get graceful_timeout to finish their requests
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Replace each worker after this many requests (staggered by the jitter) so
+# slow leaks and fragmented memory don't build up
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# set GUNICORN_ACCESS_LOG empty to turn the access log off
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # the preloaded app's pools may hold connections the master opened
+    from app.pool import dispose_after_fork
+    from wsgi import app
+
+    dispose_after_fork(app)
@@ -0,0 +1,39 @@
+"""Index occupancy buckets by start time
+
+Revision ID: 1e6f3b8d4a27
+Revises: 9d2c5a7e1f04
+Create Date: 2026-10-17 09:15:00.000000
+
+For the batch search, which scans one time window's buckets across
+every stashpoint.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '1e6f3b8d4a27'
+down_revision = '9d2c5a7e1f04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_stashpoint_occupancy_bucket_start',
+            'stashpoint_occupancy',
+            ['bucket_start'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_stashpoint_occupancy_bucket_start',
+            table_name='stashpoint_occupancy',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
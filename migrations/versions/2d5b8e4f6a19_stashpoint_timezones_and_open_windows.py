@@ -0,0 +1,44 @@
+"""Stashpoint timezones and precomputed UTC open windows
+
+Revision ID: 2d5b8e4f6a19
+Revises: c3f7a2e9d815
+Create Date: 2026-10-17 09:28:00.000000
+
+Adds `stashpoints.timezone` (UTC for the existing ones), the range
+columns of the open windows and `stashpoint_open_windows`. The windows
+start empty, so searches convert to local time in SQL until
+`flask stashpoints refresh-open-windows` fills them.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d5b8e4f6a19'
+down_revision = 'c3f7a2e9d815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'stashpoints', sa.Column('timezone', sa.String(length=64), server_default='UTC', nullable=False)
+    )
+    op.add_column('stashpoints', sa.Column('open_windows_from', sa.DateTime(), nullable=True))
+    op.add_column('stashpoints', sa.Column('open_windows_until', sa.DateTime(), nullable=True))
+    op.create_table(
+        'stashpoint_open_windows',
+        sa.Column('stashpoint_id', sa.String(), nullable=False),
+        sa.Column('opens_at', sa.DateTime(), nullable=False),
+        sa.Column('closes_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['stashpoint_id'], ['stashpoints.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('stashpoint_id', 'opens_at'),
+    )
+
+
+def downgrade():
+    op.drop_table('stashpoint_open_windows')
+    op.drop_column('stashpoints', 'open_windows_until')
+    op.drop_column('stashpoints', 'open_windows_from')
+    op.drop_column('stashpoints', 'timezone')
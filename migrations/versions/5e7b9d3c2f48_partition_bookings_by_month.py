@@ -0,0 +1,127 @@
+"""Partition bookings by month
+
+Revision ID: 5e7b9d3c2f48
+Revises: 8c4d2e6f1a05
+Create Date: 2026-10-17 10:00:00.000000
+
+Rebuilds `bookings` as a table range-partitioned by `dropoff_time`, with a
+partition per month from the first booking to twelve months ahead and a
+default partition, and copies the bookings across. Bookings are locked
+while it runs. Fails if any booking lasts longer than the 31 days now
+allowed, so those have to be fixed first.
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7b9d3c2f48'
+down_revision = '8c4d2e6f1a05'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = (
+    'id, created_at, bag_count, dropoff_time, pickup_time, is_paid, is_cancelled, '
+    'checked_in, checked_out, stashpoint_id, customer_id'
+)
+
+INDEXES = [
+    ('ix_bookings_dropoff_time', ['dropoff_time']),
+    ('ix_bookings_pickup_time', ['pickup_time']),
+    ('ix_bookings_stashpoint_id', ['stashpoint_id']),
+    ('ix_bookings_customer_id', ['customer_id']),
+]
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def create_indexes():
+    for name, columns in INDEXES:
+        op.create_index(name, 'bookings', columns)
+    op.create_index(
+        'ix_bookings_stashpoint_window',
+        'bookings',
+        ['stashpoint_id', 'dropoff_time', 'pickup_time'],
+        postgresql_where=sa.text('NOT is_cancelled'),
+    )
+
+
+def drop_indexes(table):
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name=table)
+    op.drop_index('ix_bookings_stashpoint_window', table_name=table, if_exists=True)
+
+
+def booking_columns():
+    return [
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('bag_count', sa.Integer(), nullable=False),
+        sa.Column('dropoff_time', sa.DateTime(), nullable=False),
+        sa.Column('pickup_time', sa.DateTime(), nullable=False),
+        sa.Column('is_paid', sa.Boolean(), nullable=False),
+        sa.Column('is_cancelled', sa.Boolean(), nullable=False),
+        sa.Column('checked_in', sa.Boolean(), nullable=False),
+        sa.Column('checked_out', sa.Boolean(), nullable=False),
+        sa.Column('stashpoint_id', sa.String(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['stashpoint_id'], ['stashpoints.id']),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+    ]
+
+
+def upgrade():
+    connection = op.get_bind()
+    op.execute('LOCK TABLE bookings IN EXCLUSIVE MODE')
+    too_long = connection.execute(sa.text(
+        "SELECT count(*) FROM bookings WHERE pickup_time - dropoff_time > interval '31 days'"
+    )).scalar()
+    if too_long:
+        raise RuntimeError(f'{too_long} bookings last longer than 31 days; shorten or remove them first')
+
+    drop_indexes('bookings')
+    op.rename_table('bookings', 'bookings_unpartitioned')
+    op.execute('ALTER INDEX bookings_pkey RENAME TO bookings_unpartitioned_pkey')
+
+    op.create_table(
+        'bookings',
+        *booking_columns(),
+        sa.PrimaryKeyConstraint('id', 'dropoff_time'),
+        sa.CheckConstraint("pickup_time - dropoff_time <= interval '31 days'", name='ck_bookings_max_duration'),
+        postgresql_partition_by='RANGE (dropoff_time)',
+    )
+    op.execute('CREATE TABLE bookings_default PARTITION OF bookings DEFAULT')
+
+    first = connection.execute(sa.text('SELECT min(dropoff_time) FROM bookings_unpartitioned')).scalar()
+    now = datetime.utcnow()
+    month = datetime((first or now).year, (first or now).month, 1)
+    last = add_months(datetime(now.year, now.month, 1), 12)
+    while month <= last:
+        end = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE bookings_{month:%Y_%m} PARTITION OF bookings "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+
+    op.execute(f'INSERT INTO bookings ({COLUMNS}) SELECT {COLUMNS} FROM bookings_unpartitioned')
+    op.drop_table('bookings_unpartitioned')
+    create_indexes()
+
+
+def downgrade():
+    # partitions already archived or dropped stay where they are
+    drop_indexes('bookings')
+    op.rename_table('bookings', 'bookings_partitioned')
+    op.execute('ALTER INDEX bookings_pkey RENAME TO bookings_partitioned_pkey')
+
+    op.create_table('bookings', *booking_columns(), sa.PrimaryKeyConstraint('id'))
+    op.execute(f'INSERT INTO bookings ({COLUMNS}) SELECT {COLUMNS} FROM bookings_partitioned')
+    op.drop_table('bookings_partitioned')
+    create_indexes()
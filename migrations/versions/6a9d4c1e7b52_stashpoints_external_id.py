@@ -0,0 +1,28 @@
+"""Key imported stashpoints by the partner's id
+
+Revision ID: 6a9d4c1e7b52
+Revises: 1e6f3b8d4a27
+Create Date: 2026-10-17 09:20:00.000000
+
+Adds the unique `stashpoints.external_id` that imports are upserted on.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a9d4c1e7b52'
+down_revision = '1e6f3b8d4a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('stashpoints', sa.Column('external_id', sa.String(length=255), nullable=True))
+    op.create_unique_constraint('stashpoints_external_id_key', 'stashpoints', ['external_id'])
+
+
+def downgrade():
+    op.drop_constraint('stashpoints_external_id_key', 'stashpoints', type_='unique')
+    op.drop_column('stashpoints', 'external_id')
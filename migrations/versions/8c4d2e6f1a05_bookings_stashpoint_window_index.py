@@ -0,0 +1,42 @@
+"""Index live bookings by stashpoint and time
+
+Revision ID: 8c4d2e6f1a05
+Revises: 2d5b8e4f6a19
+Create Date: 2026-10-17 09:30:00.000000
+
+Backs the per-stashpoint capacity lookups of the search. Built
+concurrently, outside the migration's transaction, so bookings can still
+be written while it builds.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4d2e6f1a05'
+down_revision = '2d5b8e4f6a19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_bookings_stashpoint_window',
+            'bookings',
+            ['stashpoint_id', 'dropoff_time', 'pickup_time'],
+            postgresql_where=sa.text('NOT is_cancelled'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_bookings_stashpoint_window',
+            table_name='bookings',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,31 @@
+"""Track when stashpoints last changed
+
+Revision ID: 9d2c5a7e1f04
+Revises: 4b8e1d2a9c63
+Create Date: 2026-10-17 09:10:00.000000
+
+Adds `stashpoints.updated_at`, part of the in-process catalog's version,
+starting from each stashpoint's `created_at`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c5a7e1f04'
+down_revision = '4b8e1d2a9c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('stashpoints', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE stashpoints SET updated_at = created_at')
+    op.alter_column('stashpoints', 'updated_at', nullable=False)
+    op.create_index('ix_stashpoints_updated_at', 'stashpoints', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_stashpoints_updated_at', table_name='stashpoints')
+    op.drop_column('stashpoints', 'updated_at')
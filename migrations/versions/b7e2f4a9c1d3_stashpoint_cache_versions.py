@@ -0,0 +1,31 @@
+"""Version stashpoints for the search and availability caches
+
+Revision ID: b7e2f4a9c1d3
+Revises: 5e7b9d3c2f48
+Create Date: 2026-10-17 14:00:00.000000
+
+Adds `stashpoints.cache_version` and the sequence it is set from after
+each change, which every worker's caches check on their hits.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f4a9c1d3'
+down_revision = '5e7b9d3c2f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('stashpoint_cache_version')))
+    op.add_column(
+        'stashpoints', sa.Column('cache_version', sa.BigInteger(), nullable=False, server_default='0')
+    )
+
+
+def downgrade():
+    op.drop_column('stashpoints', 'cache_version')
+    op.execute(sa.schema.DropSequence(sa.Sequence('stashpoint_cache_version')))
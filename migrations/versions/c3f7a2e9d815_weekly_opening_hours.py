@@ -0,0 +1,63 @@
+"""Weekly opening hours compiled into per-minute bitmasks
+
+Revision ID: c3f7a2e9d815
+Revises: 6a9d4c1e7b52
+Create Date: 2026-10-17 09:25:00.000000
+
+Adds `stashpoint_opening_hours` and `stashpoints.open_minutes`, and
+compiles every stashpoint's open_from/open_until into it, the same hours
+each day. Hours that run past midnight were never open under the old
+checks, and stay closed.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f7a2e9d815'
+down_revision = '6a9d4c1e7b52'
+branch_labels = None
+depends_on = None
+
+
+WEEK_MINUTES = 7 * 24 * 60
+
+
+def upgrade():
+    op.create_table(
+        'stashpoint_opening_hours',
+        sa.Column('stashpoint_id', sa.String(), nullable=False),
+        sa.Column('weekday', sa.SmallInteger(), nullable=False),
+        sa.Column('opens', sa.Time(), nullable=False),
+        sa.Column('closes', sa.Time(), nullable=False),
+        sa.ForeignKeyConstraint(['stashpoint_id'], ['stashpoints.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('stashpoint_id', 'weekday', 'opens'),
+    )
+    op.add_column('stashpoints', sa.Column('open_minutes', postgresql.BIT(length=WEEK_MINUTES), nullable=True))
+
+    # minute 0 of the week first, one bit per minute, closing minute included
+    op.execute(f"""
+        UPDATE stashpoints SET open_minutes = repeat(
+            repeat('0', minutes.first)
+            || repeat('1', minutes.open_count)
+            || repeat('0', 1440 - minutes.first - minutes.open_count),
+            7
+        )::bit({WEEK_MINUTES})
+        FROM (
+            SELECT id, first, greatest(last - first + 1, 0) AS open_count
+            FROM (
+                SELECT id,
+                       (extract(hour FROM open_from) * 60 + extract(minute FROM open_from))::int AS first,
+                       (extract(hour FROM open_until) * 60 + extract(minute FROM open_until))::int AS last
+                FROM stashpoints
+            ) AS bounds
+        ) AS minutes
+        WHERE stashpoints.id = minutes.id
+    """)
+
+
+def downgrade():
+    op.drop_column('stashpoints', 'open_minutes')
+    op.drop_table('stashpoint_opening_hours')
@@ -0,0 +1,39 @@
+"""Index stashpoints by cache version
+
+Revision ID: f4a8c2d6e9b1
+Revises: b7e2f4a9c1d3
+Create Date: 2026-10-17 16:00:00.000000
+
+For the highest cache_version, which the search and availability caches
+read before computing each value, on the replica the request reads from.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a8c2d6e9b1'
+down_revision = 'b7e2f4a9c1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_stashpoints_cache_version',
+            'stashpoints',
+            ['cache_version'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_stashpoints_cache_version',
+            table_name='stashpoints',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
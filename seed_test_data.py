@@ -7,7 +7,7 @@ Creates stashpoints, customers, and bookings with varied times and bag counts
 import random
 from datetime import datetime, timedelta, time
 from app import create_app, db
-from app.models import Stashpoint, Customer, Booking
+from app.models import Stashpoint, Customer, Booking, StashpointOccupancy
 
 
 def seed_data():
@@ -15,6 +15,7 @@ def seed_data():
     print("Creating test data...")
 
     # Clear existing data
+    StashpointOccupancy.query.delete()
     Booking.query.delete()
     Customer.query.delete()
     Stashpoint.query.delete()
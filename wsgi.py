@@ -0,0 +1,5 @@
+from app import create_app
+from config import ProdConfig
+
+# gunicorn wsgi:app (settings in gunicorn.conf.py)
+app = create_app(ProdConfig)